@@ -1,10 +1,12 @@
 import pandas as pd
 import tqdm
 import argparse
+from mention_store import read_mentions
 
 def create_data_for_media_attribute_study(mentions_file, professions_file, imdb_file, soc_media_attribute_file, profession_media_attribute_file):
     print('reading mentions, professions, imdb')
-    mentions_df = pd.read_csv(mentions_file, index_col=None, dtype={'soc_code':str, 'soc_name':str})
+    mentions_df = read_mentions(mentions_file, columns=['soc_code', 'profession_merge', 'imdb', 'sentiment_label'], \
+        dtype={'soc_code':str, 'soc_name':str})
     professions_df = pd.read_csv(professions_file, index_col=None)
     imdb_df = pd.read_csv(imdb_file, index_col=None)
 
@@ -16,8 +18,8 @@ def create_data_for_media_attribute_study(mentions_file, professions_file, imdb_
     print('creating media attribute study data for soc groups')
     for i in tqdm.trange(23):
         soc_code = 11 + 2 * i
-        soc_mentions_df = mentions_df[mentions_df['soc_code'].fillna('').str.contains(str(soc_code))]
-        groups = soc_mentions_df.groupby(['profession_merge','year','imdb_kind','imdb_genres','imdb_countries'], dropna=False)
+        soc_mentions_df = mentions_df[mentions_df['soc_code'].str.contains(str(soc_code), na=False)]
+        groups = soc_mentions_df.groupby(['profession_merge','year','imdb_kind','imdb_genres','imdb_countries'], dropna=False, observed=True)
 
         for (profession, year, kind, genres, countries), group_df in tqdm.tqdm(groups, total=groups.ngroups):
             n = len(profession.split())
@@ -36,7 +38,7 @@ def create_data_for_media_attribute_study(mentions_file, professions_file, imdb_
     print()
 
     professions = professions_df['profession_merge'].unique()[:500]
-    groups = mentions_df[mentions_df['profession_merge'].isin(professions)].groupby(['profession_merge','year','imdb_kind','imdb_genres','imdb_countries'], dropna=False)
+    groups = mentions_df[mentions_df['profession_merge'].isin(professions)].groupby(['profession_merge','year','imdb_kind','imdb_genres','imdb_countries'], dropna=False, observed=True)
     profession_records = []
     print('creating media attribute study data for professions')
         
@@ -2,13 +2,15 @@ import os
 import pandas as pd
 import numpy as np
 from tqdm import tqdm, trange
+from mention_store import read_mentions
 
 def collect(x):
     return set(val for val in x)
 
 def create_data(mentions_file, professions_file, imdb_file, profession_media_dir, soc_media_dir):
 
-    mentions_df = pd.read_csv(mentions_file, index_col=None, dtype={"soc_code":str, "soc_name":str})
+    mentions_df = read_mentions(mentions_file, columns=["imdb", "profession_merge", "soc_code", "sentiment_label"], \
+        dtype={"soc_code":str, "soc_name":str})
     professions_df = pd.read_csv(professions_file, index_col=None)
     imdb_df = pd.read_csv(imdb_file, index_col=None)
 
@@ -99,8 +101,8 @@ def create_data(mentions_file, professions_file, imdb_file, profession_media_dir
     for x in trange(23, desc="soc"):
 
         soc_code = 11 + 2*x
-        soc_mentions_df = mentions_df[mentions_df['soc_code'].fillna('').str.contains(str(soc_code))].copy()
-        soc_mentions_df["n"] = soc_mentions_df["profession_merge"].apply(lambda x: len(x.split()))
+        soc_mentions_df = mentions_df[mentions_df['soc_code'].str.contains(str(soc_code), na=False)].copy()
+        soc_mentions_df["n"] = soc_mentions_df["profession_merge"].astype(object).apply(lambda x: len(x.split()))
         ns = soc_mentions_df["n"].unique()
 
         for n in tqdm(ns, desc=str(soc_code)):
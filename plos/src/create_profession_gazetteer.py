@@ -1,10 +1,10 @@
 import pandas as pd
 import numpy as np
-from nltk.corpus import wordnet
 from pattern.text.en import singularize
 import inflect
 import re
 import argparse
+from sense_inventory import SenseInventory
 
 p = inflect.engine()
 
@@ -102,7 +102,7 @@ def backward_segmentation_expansion(soc_csv_filepath, soc_txt_filepath, bseg_fil
     # write new job titles
     open(bseg_filepath, "w").write("\n".join(sorted(expanded_titles)))
 
-def find_wordnet_synsets_from_word(word):
+def find_wordnet_synsets_from_word(word, inventory):
     """Return noun synsets of word and their hyponyms
 
     Parameters
@@ -110,31 +110,31 @@ def find_wordnet_synsets_from_word(word):
     word : str
         The word for which we need to find the wordnet synsets
 
+    inventory : SenseInventory
+        WordNet sense inventory. Whitespace of the word is replaced by underscore when it is looked up
+
     Returns
     -------
     list
-        A list of wordnet synsets
+        A list of wordnet synset names
     """
-
-    # replace whitespace by underscore
-    word = re.sub("\s+", "_", word.lower())
     synsets = []
 
     # search noun synsets
-    for synset in wordnet.synsets(word, pos = "n"):
+    for synset in inventory.synsets(word, pos = "n"):
 
         # search person and group semantic category
-        if synset.lexname() in ["noun.person", "noun.group"]:
+        if inventory.lexname(synset) in ["noun.person", "noun.group"]:
             synsets.append(synset)
 
             # search noun person and noun group hyponyms
-            for hyponym_synset in synset.hyponyms():
-                if hyponym_synset.lexname() in ["noun.person", "noun.group"]:
+            for hyponym_synset in inventory.hyponyms(synset):
+                if inventory.lexname(hyponym_synset) in ["noun.person", "noun.group"]:
                     synsets.append(hyponym_synset)
 
     return synsets
 
-def find_wordnet_synsets(soc_txt_filepath, bseg_filtered_filepath, wn_syn_filepath):
+def find_wordnet_synsets(soc_txt_filepath, bseg_filtered_filepath, wn_syn_filepath, inventory_filepath):
     """Find the wordnet synsets of the SOC titles and the new titles expanded from SOC
     titles using backward segmentation
 
@@ -149,7 +149,12 @@ def find_wordnet_synsets(soc_txt_filepath, bseg_filtered_filepath, wn_syn_filepa
 
     wn_syn_filepath : str
         txt filepath to which we will write the wordnet synsets and their definitions 
+
+    inventory_filepath : str
+        json filepath of the WordNet sense inventory created by `sense_inventory.py`. Titles that are not in it are
+        looked up in WordNet
     """
+    inventory = SenseInventory.load(inventory_filepath)
 
     # read SOC and job titles created from backward segmentation
     soc_titles = open(soc_txt_filepath).read().strip().split("\n")
@@ -159,7 +164,7 @@ def find_wordnet_synsets(soc_txt_filepath, bseg_filtered_filepath, wn_syn_filepa
     # search wordnet synsets
     synsets = []
     for word in list(soc_titles) + list(bseg_titles):
-        synsets.extend(find_wordnet_synsets_from_word(word))
+        synsets.extend(find_wordnet_synsets_from_word(word, inventory))
 
     synsets = np.unique(synsets)
     print(f"{'WORDNET SYNSETS':30s} = {len(synsets)} wordnet synsets found from SOC and BSEG titles")
@@ -167,9 +172,10 @@ def find_wordnet_synsets(soc_txt_filepath, bseg_filtered_filepath, wn_syn_filepa
     # write synsets to file
     with open(wn_syn_filepath,"w") as fw:
         for synset in synsets:
-            fw.write(f"{synset.name():25s}\t{synset.definition()}\n")
+            fw.write(f"{synset:25s}\t{inventory.definition(synset)}\n")
         
-def wordnet_expansion(soc_txt_filepath, bseg_filtered_filepath, wn_syn_filtered_filepath, wn_title_filepath):
+def wordnet_expansion(soc_txt_filepath, bseg_filtered_filepath, wn_syn_filtered_filepath, wn_title_filepath, \
+    inventory_filepath):
     """Find the phrases from the manually filtered wordnet synsets
 
     Parameters
@@ -186,7 +192,11 @@ def wordnet_expansion(soc_txt_filepath, bseg_filtered_filepath, wn_syn_filtered_
 
     wn_title_filepath : str
         txt filepath containing the new titles found from the filtered wordnet synsets
+
+    inventory_filepath : str
+        json filepath of the WordNet sense inventory
     """
+    inventory = SenseInventory.load(inventory_filepath)
 
     # read SOC and job titles created from SOC using backward segmentation
     soc_titles = open(soc_txt_filepath).read().strip().split("\n")
@@ -199,8 +209,7 @@ def wordnet_expansion(soc_txt_filepath, bseg_filtered_filepath, wn_syn_filtered_
     # find lemma names for each wordnet synset
     wn_titles = []
     for line in lines:
-        synset = wordnet.synset(line.split()[0])
-        wn_titles.extend([re.sub("_"," ", x) for x in synset.lemma_names()])
+        wn_titles.extend([re.sub("_"," ", x) for x in inventory.lemma_names(line.split()[0])])
 
     wn_titles = set(wn_titles).difference(soc_titles.union(bseg_titles))
     wn_titles = sorted(wn_titles)
@@ -350,6 +359,7 @@ def create_gazetteer():
     parser.add_argument("--wn_title", type=str, default="data/gazetteer/wn.title.txt", help="TXT filepath to which we will write WORDNET TITLES (WordNet titles found from WORDNET SYNSETS FILTERED)", dest="wn_title")
     parser.add_argument("--wn_title_filtered", type=str, default="data/gazetteer/wn.title.filtered.txt", help="TXT filepath containing WORDNET TITLES FILTERES (manually filtered WORDNET TITLES)", dest="wn_title_filtered")
     parser.add_argument("--final", type=str, default="data/gazetteer/final.txt", help="TXT filepath to which the final list of job titles will be written", dest="final")
+    parser.add_argument("--inventory", type=str, default="data/gazetteer/sense_inventory.json", help="JSON filepath of the WordNet sense inventory created by sense_inventory.py. Titles and synsets that are not in it are looked up in WordNet", dest="inventory")
     parser.add_argument("--inflection", type=str, default="data/gazetteer/inflection.csv", help="CSV filepath to which the inflected forms of the job titles in the final list will be written", dest="inflection")
 
     args = parser.parse_args()
@@ -364,12 +374,14 @@ def create_gazetteer():
     wn_title_filtered_filepath = args.wn_title_filtered
     final_filepath = args.final
     inflection_filepath = args.inflection
+    inventory_filepath = args.inventory
 
     backward_segmentation_expansion(soc_csv_filepath, soc_txt_filepath, bseg_filepath)
 
-    find_wordnet_synsets(soc_txt_filepath, bseg_filtered_filepath, wn_syn_filepath)
+    find_wordnet_synsets(soc_txt_filepath, bseg_filtered_filepath, wn_syn_filepath, inventory_filepath)
 
-    wordnet_expansion(soc_txt_filepath, bseg_filtered_filepath, wn_syn_filtered_filepath, wn_title_filepath)
+    wordnet_expansion(soc_txt_filepath, bseg_filtered_filepath, wn_syn_filtered_filepath, wn_title_filepath, \
+        inventory_filepath)
 
     merge_expansions(soc_txt_filepath, bseg_filtered_filepath, wn_title_filtered_filepath, final_filepath)
 
@@ -1,20 +1,18 @@
 import pandas as pd
 import argparse
+from mention_store import read_mentions, write_mentions
 
 def filter_mentions_by_sense(in_mentions_file, in_professions_file, out_mentions_file, out_professions_file):
-    print("reading mentions")
-    mentions_df = pd.read_csv(in_mentions_file, index_col=None)
+    print("reading mentions filtered by is_nopos_profession")
+    mentions_df = read_mentions(in_mentions_file, filters=[("is_nopos_profession", "==", 1)])
 
     print("reading professions")
     professions_df = pd.read_csv(in_professions_file, index_col=None)
 
-    print("filtering by is_nopos_profession")
-    mentions_df = mentions_df[mentions_df.is_nopos_profession == 1]
-
     print("updating n_mentins in professions")
     profession_counts = dict([(profession, 0) for profession in professions_df.profession])
     
-    for profession, df in mentions_df.groupby("profession"):
+    for profession, df in mentions_df.groupby("profession", observed=True):
         profession_counts[profession] = len(df)
 
     n_mentions_list = [profession_counts[profession] for profession in professions_df.profession]
@@ -39,7 +37,7 @@ def filter_mentions_by_sense(in_mentions_file, in_professions_file, out_mentions
     print(f"top 1500 professions cover {100*cumul_frac_mentions[1499]:.2f}% mentions\n")
 
     print("saving mentions")
-    mentions_df.to_csv(out_mentions_file, index=False)
+    write_mentions(mentions_df, out_mentions_file)
 
     print("saving professions")
     professions_df.to_csv(out_professions_file, index=False)
@@ -49,11 +47,11 @@ if __name__ == "__main__":
         formatter_class=argparse.ArgumentDefaultsHelpFormatter)
     
     parser.add_argument("--in_mentions", default="data/mentions/mentions.word_filtered.prediction_added.csv", \
-        help="mentions file")
+        help="mentions file (csv or parquet)")
     parser.add_argument("--in_professions", default="data/mentions/professions.word_filtered.prediction_added.csv", \
         help="professions file")
     parser.add_argument("--out_mentions", default="data/mentions/mentions.word_filtered.sense_filtered.csv", \
-        help="mentions file filtered by sense")
+        help="mentions file filtered by sense (csv or parquet)")
     parser.add_argument("--out_professions", default="data/mentions/professions.word_filtered.sense_filtered.csv", \
         help="professions file containing updated n_mentions after sense filtering")
 
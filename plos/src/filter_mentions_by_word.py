@@ -1,13 +1,26 @@
+import numpy as np
 import pandas as pd
-import jsonlines
-from nltk.corpus import wordnet as wn
-from tqdm import tqdm
 import argparse
+from token_store import lookup_tokens
+from sense_inventory import SenseInventory, read_sense_names
+from mention_store import read_mentions, write_mentions
+
+def read_senses(wsd_file, rsis, starts):
+    """Returns the list of senses of the tokens `starts[i]` of the sentences `rsis[i]`. The WSD output is either
+    the JSONLINES file of the senses of all tokens, or the csv file of the senses of the unigram mention tokens
+    created by `find_wordnet_sense.py --mentions`. The sense is an empty string if there is no sense.
+    """
+    if wsd_file.endswith(".csv"):
+        wsd_df = pd.read_csv(wsd_file, index_col=None, keep_default_na=False, dtype={"sense": str})
+        tokens_df = pd.DataFrame({"rsi": rsis, "start": starts})
+        return tokens_df.merge(wsd_df, how="left", on=["rsi", "start"]).sense.fillna("").tolist()
+    return lookup_tokens(wsd_file, rsis, starts)
 
 def filter_mentions(mentions_file, professions_file, filtered_mentions_file, filtered_professions_file, \
-    zero_sense_professions_file, professional_senses_file, pos_ner_file, wsd_file, nopos_wsd_file):
+    zero_sense_professions_file, professional_senses_file, pos_ner_file, wsd_file, nopos_wsd_file, \
+    inventory_file="data/gazetteer/sense_inventory.json"):
     print("reading mentions")
-    mentions_df = pd.read_csv(mentions_file, index_col=None)
+    mentions_df = read_mentions(mentions_file)
 
     print("reading professions")
     professions_df = pd.read_csv(professions_file, index_col=None)
@@ -15,8 +28,11 @@ def filter_mentions(mentions_file, professions_file, filtered_mentions_file, fil
     print("reading profession words with zero senses")
     zero_sense_professions = set(open(zero_sense_professions_file).read().strip().split("\n"))
 
+    print("reading sense inventory")
+    inventory = SenseInventory.load(inventory_file)
+
     print("reading professional senses")
-    professional_senses = set([wn.synset(line.split()[0]) for line in open(professional_senses_file)])
+    professional_senses = read_sense_names(professional_senses_file, inventory)
 
     print("removing profession words that have zero sense and are not professions")
     all_zero_sense_professions = set(professions_df[professions_df.n_synsets == 0].profession)
@@ -27,7 +43,7 @@ def filter_mentions(mentions_file, professions_file, filtered_mentions_file, fil
     nonzero_sense_professions = set(professions_df[professions_df.n_synsets > 0].profession)
     delete_zero_professional_sense_professions = set()
     for profession in nonzero_sense_professions:
-        senses = set(wn.synsets(profession.lower().replace(" ","_")))
+        senses = set(inventory.synsets(profession))
         if len(senses.intersection(professional_senses)) == 0:
             delete_zero_professional_sense_professions.add(profession)
     mentions_df = mentions_df[~mentions_df.profession.isin(delete_zero_professional_sense_professions)]
@@ -36,10 +52,10 @@ def filter_mentions(mentions_file, professions_file, filtered_mentions_file, fil
     records = []
 
     S = 0
-    for profession, df in mentions_df.groupby("profession"):
+    for profession, df in mentions_df.groupby("profession", observed=True):
         n_words = len(profession.split())
-        synsets = wn.synsets(profession.lower().replace(" ", "_"))
-        noun_synsets = wn.synsets(profession.lower().replace(" ", "_"), pos="n")
+        synsets = inventory.synsets(profession)
+        noun_synsets = inventory.synsets(profession, pos="n")
         professional_synsets = set(synsets).intersection(professional_senses)
         n_synsets = len(synsets)
         n_noun_synsets = len(noun_synsets)
@@ -70,34 +86,29 @@ def filter_mentions(mentions_file, professions_file, filtered_mentions_file, fil
         "n_noun_senses", "n_professional_senses", "n_non_professional_senses"])
     filtered_professions_df.to_csv(filtered_professions_file, index=False)
 
-    print("reading pos and ner")
-    pos_ner_docs = list(tqdm(jsonlines.open(pos_ner_file), total=3577313))
+    # only the docs of the unigram mentions are read
+    unigram_indices = np.flatnonzero((mentions_df.end - mentions_df.start == 1).values)
+    rsis = mentions_df.rsi.values[unigram_indices]
+    starts = mentions_df.start.values[unigram_indices]
+
+    print("reading pos and ner of unigram mentions")
+    tokens = lookup_tokens(pos_ner_file, rsis, starts)
 
     print("reading mention senses")
-    wsd_docs = list(tqdm(jsonlines.open(wsd_file), total=3577313))
+    senses = read_senses(wsd_file, rsis, starts)
 
     print("reading no pos mention senses")
-    nopos_wsd_docs = list(tqdm(jsonlines.open(nopos_wsd_file), total=3577313))
+    nopos_senses = read_senses(nopos_wsd_file, rsis, starts)
 
     print("adding pos, ner, sense and no pos sense columns for unigram mentions")
-    start_list, end_list, rsi_list = mentions_df.start.values, mentions_df.end.values, mentions_df.rsi.values
-    pos_list, ner_list, sense_list, nopos_sense_list = [], [], [], []
-    
-    for start, end, rsi in tqdm(zip(start_list, end_list, rsi_list), total=len(start_list)):
-        pos, ner, sense, nopos_sense = None, None, None, None
-        if end - start == 1:
-            token = pos_ner_docs[rsi][start]
-            pos, ner = token["pos"], token["ner"]
-            sense_str = wsd_docs[rsi][start]
-            if sense_str:
-                sense = sense_str
-            nopos_sense_str = nopos_wsd_docs[rsi][start]
-            if nopos_sense_str:
-                nopos_sense = nopos_sense_str
-        pos_list.append(pos)
-        ner_list.append(ner)
-        sense_list.append(sense)
-        nopos_sense_list.append(nopos_sense)
+    pos_list, ner_list, sense_list, nopos_sense_list = [[None] * len(mentions_df) for _ in range(4)]
+
+    for i, token, sense, nopos_sense in zip(unigram_indices.tolist(), tokens, senses, nopos_senses):
+        pos_list[i], ner_list[i] = token["pos"], token["ner"]
+        if sense:
+            sense_list[i] = sense
+        if nopos_sense:
+            nopos_sense_list[i] = nopos_sense
 
     mentions_df["pos"] = pos_list
     mentions_df["ner"] = ner_list
@@ -105,26 +116,31 @@ def filter_mentions(mentions_file, professions_file, filtered_mentions_file, fil
     mentions_df["no_pos_sense"] = nopos_sense_list
 
     print("saving mentions")
-    mentions_df.to_csv(filtered_mentions_file, index=False)
+    write_mentions(mentions_df, filtered_mentions_file)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="filter mentions and professions according to profession word, and \
         create new mentions and professions file", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
 
-    parser.add_argument("--in_mentions", default="data/mentions/mentions.csv", help="mentions file")
+    parser.add_argument("--in_mentions", default="data/mentions/mentions.csv", help="mentions file (csv or \
+        parquet)")
     parser.add_argument("--in_professions", default="data/mentions/professions.csv", help="professions file")
     parser.add_argument("--out_mentions", default="data/mentions/mentions.word_filtered.csv", help="filtered mentions \
-        file")
+        file (csv or parquet)")
     parser.add_argument("--out_professions", default="data/mentions/professions.word_filtered.csv", help="filtered \
         professions file")
     parser.add_argument("--zero_sense_professions", default="data/gazetteer/title.zerosense.filtered.txt", help="\
         file containing words that have zero wordnet sense and are professions")
     parser.add_argument("--professional_senses", default="data/gazetteer/wn.syn.mention.txt", help="file containing \
         professional senses")
-    parser.add_argument("--pos_ner_docs", default="data/mentions/pos.ner.jsonl", help="pos and ner docs")
-    parser.add_argument("--wsd_docs", default="data/mentions/wsd.jsonl", help="wsd docs")
+    parser.add_argument("--pos_ner_docs", default="data/mentions/pos.ner.jsonl", help="pos and ner docs \
+        (jsonlines file or token store directory)")
+    parser.add_argument("--wsd_docs", default="data/mentions/wsd.jsonl", help="wsd docs (jsonlines file, or \
+        csv file of the mention token senses)")
     parser.add_argument("--wsd_no_pos_docs", default="data/mentions/wsd.nopos.jsonl", help="wsd without pos tagging \
-        docs")
+        docs (jsonlines file, or csv file of the mention token senses)")
+    parser.add_argument("--inventory", default="data/gazetteer/sense_inventory.json", help="json file of the sense \
+        inventory created by sense_inventory.py. Words that are not in it are looked up in WordNet")
 
     args = parser.parse_args()
     mentions_file = args.in_mentions
@@ -136,6 +152,7 @@ if __name__ == "__main__":
     pos_ner_file = args.pos_ner_docs
     wsd_file = args.wsd_docs
     nopos_wsd_file = args.wsd_no_pos_docs
+    inventory_file = args.inventory
 
     filter_mentions(mentions_file, professions_file, filtered_mentions_file, filtered_professions_file, \
-    zero_sense_professions_file, professional_senses_file, pos_ner_file, wsd_file, nopos_wsd_file)
\ No newline at end of file
+    zero_sense_professions_file, professional_senses_file, pos_ner_file, wsd_file, nopos_wsd_file, inventory_file)
\ No newline at end of file
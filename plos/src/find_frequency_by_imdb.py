@@ -4,10 +4,11 @@ import numpy as np
 from tqdm import tqdm
 from collections import defaultdict
 import argparse
+from mention_store import read_mentions
 
 def find_frequency_by_imdb(mentions_file, imdb_file, professions_file, imdb_frequency_file, min_year, max_year):
     print("reading mentions data")
-    mentions_df = pd.read_csv(mentions_file, index_col=None, dtype={"soc_code":str, "soc_name":str})
+    mentions_df = read_mentions(mentions_file, columns=["imdb", "profession_merge"])
 
     print("reading imdb data")
     imdb_attr_df = pd.read_csv(imdb_file, index_col=None)
@@ -24,7 +25,7 @@ def find_frequency_by_imdb(mentions_file, imdb_file, professions_file, imdb_freq
     print("finding frequency by imdb")
     imdb_profession_frequency_dict = defaultdict(lambda: defaultdict(int))
     for imdb, imdb_df in tqdm(mentions_df.groupby("imdb"), total=mentions_df["imdb"].unique().size, desc="imdb"):
-        for profession, profession_df in imdb_df.groupby("profession_merge"):
+        for profession, profession_df in imdb_df.groupby("profession_merge", observed=True):
             if profession in professions:
                 ngram = len(profession.split())
                 frequency = len(profession_df)/imdb_ngram_dict[imdb][ngram - 1]
@@ -1,15 +1,18 @@
 import pandas as pd
+from mention_store import read_mentions
 
 def find_frequency_by_merged_profession(mentions_file, frequency_file, professions_file, \
     merged_profession_frequency_file):
-    print("reading mentions")
-    mentions_df = pd.read_csv(mentions_file, index_col=None, dtype={"soc_code":str, "soc_name":str})
     frequency_df = pd.read_csv(frequency_file, index_col=None)
     professions_df = pd.read_csv(professions_file, index_col=None)
 
     merged_professions = professions_df.profession_merge.unique()[:1000]
     print(f"top {len(merged_professions)} merged professions considered")
 
+    print("reading mentions of merged professions")
+    mentions_df = read_mentions(mentions_file, columns=["profession", "profession_merge"], \
+        filters=[("profession_merge", "in", list(merged_professions))])
+
     n_mentions_covered = professions_df[professions_df.profession_merge.isin(merged_professions)].n_mentions.sum()
     n_mentions_total = professions_df.n_mentions.sum()
     percent = 100*n_mentions_covered/n_mentions_total
@@ -19,7 +22,7 @@ def find_frequency_by_merged_profession(mentions_file, frequency_file, professio
     map_df = mentions_df.loc[mentions_df.profession_merge.isin(merged_professions), ["profession","profession_merge"]]\
         .drop_duplicates()
     merged_frequency_df = frequency_df.merge(map_df, on=["profession"]).drop(columns=["profession","no_pos_sense"])
-    merged_frequency_df = merged_frequency_df.groupby("profession_merge").agg(sum)
+    merged_frequency_df = merged_frequency_df.groupby("profession_merge", observed=True).agg(sum)
 
     print("saving merged frequency data")
     merged_frequency_df.to_csv(merged_profession_frequency_file)
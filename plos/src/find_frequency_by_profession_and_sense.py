@@ -2,6 +2,7 @@ import pandas as pd
 import numpy as np
 from collections import defaultdict
 from tqdm import tqdm
+from mention_store import read_mentions
 
 def find_frequency_by_profession_and_sense(mentions_file, imdb_file, frequency_file, max_ngram, max_year, min_year, sample=False, cutoff=False):
     print("reading imdb data")
@@ -26,7 +27,7 @@ def find_frequency_by_profession_and_sense(mentions_file, imdb_file, frequency_f
         imdb_df = imdb_df[imdb_df["1_gram_count"] < quant]
 
     print("reading mentions data")
-    mentions_df = pd.read_csv(mentions_file, index_col=None, dtype={"soc_code":str, "soc_name":str})
+    mentions_df = read_mentions(mentions_file, columns=["profession", "imdb", "no_pos_sense"])
 
     if sample or cutoff:
         mentions_df = mentions_df[mentions_df.imdb.isin(imdb_df.imdb_ID)]
@@ -51,11 +52,11 @@ def find_frequency_by_profession_and_sense(mentions_file, imdb_file, frequency_f
     mentions_df["year"] = year_col
 
     profession_sense_frequency_data = defaultdict(lambda: defaultdict(int))
-    mentions_df.no_pos_sense.fillna("none", inplace=True)
+    mentions_df["no_pos_sense"] = mentions_df.no_pos_sense.astype(object).fillna("none")
     n_groups = len(mentions_df[["profession", "no_pos_sense", "year"]].drop_duplicates())
 
     print("finding profession and sense counts by year")
-    for (profession, sense, year), df in tqdm(mentions_df.groupby(["profession", "no_pos_sense", "year"]), total=n_groups):
+    for (profession, sense, year), df in tqdm(mentions_df.groupby(["profession", "no_pos_sense", "year"], observed=True), total=n_groups):
         profession_ngram_size = len(profession.split())
         year_ngram_count = year_ngram_count_data[year][profession_ngram_size-1]
         profession_sense_frequency_data[(profession, sense)][year] = len(df)/year_ngram_count
@@ -1,10 +1,12 @@
 import pandas as pd
 import numpy as np
 from map_soc import soc_names
+from mention_store import read_mentions
 
 def find_frequency_by_soc(mentions_file, frequency_file, soc_frequency_file):
     print("reading mentions")
-    mentions_df = pd.read_csv(mentions_file, index_col=None, dtype={"soc_code":str, "soc_name":str})
+    mentions_df = read_mentions(mentions_file, columns=["profession", "no_pos_sense", "soc_code", "soc_name"], \
+        dtype={"soc_code":str, "soc_name":str})
     frequency_df = pd.read_csv(frequency_file, index_col=None)
     
     print("finding soc frequency")
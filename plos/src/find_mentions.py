@@ -1,10 +1,18 @@
 import json
-import jsonlines
+import csv
 import pandas as pd
+import numpy as np
 import os
+import shutil
+import itertools
+import multiprocessing
 from tqdm import tqdm
 import nltk
 import argparse
+from token_store import TokenStore, read_processed, iter_processed
+from sentence_store import SentenceStore
+from sentence_index import SentenceIndex, DictSentenceIndex
+from mention_store import read_mentions, write_mentions
 
 def contains_open_left_bracket(text):
     """Returns true if the text contains an open left bracket (parantheses, curly braces, square brackets)
@@ -89,7 +97,169 @@ def is_song(text):
     """
     return "♪" in text
 
-def find_mentions(key_to_si_filepath, si_to_rsi_filepath, sentences_filepath, processed_filepath, profession_filepath, prof_to_si_filepath, mentions_directory, max_n_words):
+class ProfessionMatcher:
+    """Token-level Aho-Corasick automaton over the tokenizations of the profession gazetteer.
+
+    The automaton is compiled once from the singular and plural forms of every gazetteer row,
+    tokenized using `nltk.wordpunct_tokenize` and whitespace splitting. A single pass over the
+    lowercased tokens of a processed doc then finds every `(row, start, end)` match, where `row`
+    is the positional index of the gazetteer row. Matching is linear in the number of doc tokens
+    instead of professions x window length.
+
+    Parameters
+    ----------
+    profession_df : pd.DataFrame \\
+        Profession gazetteer. It contains `word`, `singular` and `plural` columns.
+    """
+
+    def __init__(self, profession_df):
+        # goto[node] maps a token to the next node, fail[node] is the failure link
+        # and output[node] is the list of (gazetteer row, pattern length) ending at node
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]
+
+        for row, (singular, plural) in enumerate(zip(profession_df["singular"], profession_df["plural"])):
+            profession_toks = set([tuple(nltk.wordpunct_tokenize(singular)), tuple(singular.split()), \
+                tuple(nltk.wordpunct_tokenize(plural)), tuple(plural.split())])
+            for tok in profession_toks:
+                if tok:
+                    self._add(row, tok)
+
+        self._link()
+
+    def _add(self, row, tok):
+        node = 0
+        for token in tok:
+            if token not in self.goto[node]:
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append([])
+                self.goto[node][token] = len(self.goto) - 1
+            node = self.goto[node][token]
+        if (row, len(tok)) not in self.output[node]:
+            self.output[node].append((row, len(tok)))
+
+    def _link(self):
+        # breadth-first traversal to set the failure links
+        queue = list(self.goto[0].values())
+        k = 0
+        while k < len(queue):
+            node = queue[k]
+            k += 1
+            for token, child in self.goto[node].items():
+                queue.append(child)
+                state = self.fail[node]
+                while state and token not in self.goto[state]:
+                    state = self.fail[state]
+                self.fail[child] = self.goto[state].get(token, 0)
+                self.output[child] = self.output[child] + self.output[self.fail[child]]
+
+    def match(self, text_tok):
+        """Find all profession matches in a list of tokens.
+
+        Parameters
+        ----------
+        text_tok : list \\
+            List of word tokens of the processed doc.
+
+        Returns
+        -------
+        dict
+            Dictionary of gazetteer row index to set of `(start, end)` token spans.
+        """
+        matches = {}
+        node = 0
+        for j, token in enumerate(text_tok):
+            token = token.lower()
+            while node and token not in self.goto[node]:
+                node = self.fail[node]
+            node = self.goto[node].get(token, 0)
+            for row, n in self.output[node]:
+                if row not in matches:
+                    matches[row] = set()
+                matches[row].add((j + 1 - n, j + 1))
+        return matches
+
+mention_files = {
+    "long": ("mentions_long.csv", ["profession", "imdb", "sent", "rsi", "sentence"]),
+    "nomatch": ("mentions_nomatch.csv", ["profession", "imdb", "sent", "rsi", "sentence"]),
+    "bracketed": ("mentions_bracketed.csv", ["profession", "imdb", "sent", "rsi", "left", "mention", "right"]),
+    "speaker": ("mentions_speaker.csv", ["profession", "imdb", "sent", "rsi", "left", "mention", "right"]),
+    "song": ("mentions_song.csv", ["profession", "imdb", "sent", "rsi", "sentence"]),
+    "mentions": ("mentions.csv", ["profession", "imdb", "sent", "rsi", "left", "mention", "right", "start", "end"])
+}
+
+def find_sentence_mentions(prof, imdb, sent, rsi, sentence, text_tok, match, max_n_words):
+    """Classify the mentions of a profession in a subtitle sentence.
+
+    Parameters
+    ----------
+    prof : str \\
+        Profession word from the gazetteer.
+
+    imdb, sent, rsi : str, int, int \\
+        File sentence index and flattened sentence index of the subtitle sentence.
+
+    sentence : str \\
+        Subtitle sentence.
+
+    text_tok : list \\
+        Word tokens of the processed doc of the sentence.
+
+    match : set \\
+        Set of `(start, end)` token spans where the profession matched.
+
+    max_n_words : int \\
+        subtitle sentences containing more than `max_n_words` are
+        ignored.
+
+    Returns
+    -------
+    list
+        List of `(category, record)` tuples. `category` is one of the keys of
+        `mention_files`.
+    """
+    if len(sentence.split()) > max_n_words:
+        return [("long", [prof, imdb, sent, rsi, sentence])]
+
+    if not match:
+        return [("nomatch", [prof, imdb, sent, rsi, sentence])]
+
+    records = []
+    for i, j in match:
+        left = " ".join(text_tok[:i]).strip()
+        target = " ".join(text_tok[i:j]).strip()
+        right = " ".join(text_tok[j:]).strip()
+
+        if contains_open_left_bracket(left) and contains_open_right_bracket(right):
+            records.append(("bracketed", [prof, imdb, sent, rsi, left, target, right]))
+        elif is_speaker(left, target, right):
+            records.append(("speaker", [prof, imdb, sent, rsi, left, target, right]))
+        elif is_song(left) or is_song(right):
+            records.append(("song", [prof, imdb, sent, rsi, sentence]))
+        else:
+            records.append(("mentions", [prof, imdb, sent, rsi, left, target, right, i, j]))
+    return records
+
+def print_mention_counts(counts, max_n_words):
+    S = sum(counts.values())
+    print(f"#mentions longer than {max_n_words} words = {counts['long']} ({100*counts['long']/S:.3f}%)")
+    print(f"#mentions not containing profession = {counts['nomatch']} ({100*counts['nomatch']/S:.3f}%)")
+    print(f"#mentions which are bracketed = {counts['bracketed']} ({100*counts['bracketed']/S:.3f}%)")
+    print(f"#mentions which are speakers = {counts['speaker']} ({100*counts['speaker']/S:.3f}%)")
+    print(f"#mentions which are songs = {counts['song']} ({100*counts['song']/S:.3f}%)")
+    print(f"#mentions = {counts['mentions']} ({100*counts['mentions']/S:.3f}%)")
+
+def mention_filepath(mentions_directory, filename, parquet=False):
+    """Returns the filepath of a mention file in `mentions_directory`, with the `.parquet` extension if `parquet` is
+    True
+    """
+    if parquet:
+        filename = os.path.splitext(filename)[0] + ".parquet"
+    return os.path.join(mentions_directory, filename)
+
+def find_mentions(key_to_si_filepath, si_to_rsi_filepath, sentences_filepath, processed_filepath, profession_filepath, prof_to_si_filepath, mentions_directory, max_n_words, index_dir=None, parquet=False):
     """Find mentions of professions in subtitle sentences and save it as a csv. The profession to file sentence index 
     dictionary is also found and saved.
 
@@ -108,8 +278,8 @@ def find_mentions(key_to_si_filepath, si_to_rsi_filepath, sentences_filepath, pr
         professional mention.
 
     processed_filepath : str \\
-        JSONLINES filepath containing NLP processed sentences which contain
-        POS and NER tags.
+        JSONLINES filepath or token store directory containing NLP processed
+        sentences which contain POS and NER tags.
 
     prof_to_si_filepath : str \\
         JSON filepath to which the profession to file sentence index
@@ -130,124 +300,390 @@ def find_mentions(key_to_si_filepath, si_to_rsi_filepath, sentences_filepath, pr
         4. mentions_directory/mentions_speaker.csv: mentions that are speaker names
         5. mentions_directory/mentions_song.csv: mentions that are part of some song.
         6. mentions_directory/mentions.csv: mentions
+
+    index_dir : str \\
+        Directory of the compact sentence index created by `key_to_si_merge` and `si_to_rsi`.
+        If given, it is used instead of the key_to_si and si_to_rsi dictionaries.
+
+    parquet : bool \\
+        If True, the mention files are saved as parquet files instead of csv files, for example
+        mentions_directory/mentions.parquet. The mentions are saved grouped by profession in gazetteer order.
     """
 
     # read the dictionaries, profession gazetteer, sentences and NLP processed docs
-    print(f"reading dictionaries")
-    key_to_si = json.load(open(key_to_si_filepath))
-    si_to_rsi = json.load(open(si_to_rsi_filepath))
+    if index_dir is not None:
+        print(f"loading sentence index")
+        index = SentenceIndex.load(index_dir)
+    else:
+        print(f"reading dictionaries")
+        index = DictSentenceIndex(key_to_si=json.load(open(key_to_si_filepath)), \
+            si_to_rsi=json.load(open(si_to_rsi_filepath)))
 
     print(f"reading profession gazetteer")
     profession_df = pd.read_csv(profession_filepath, index_col = None)
+    professions = profession_df["word"].tolist()
 
-    print(f"reading sentences")
-    sentences = open(sentences_filepath).read().strip().split("\n")
+    print(f"opening sentences")
+    sentences = SentenceStore(sentences_filepath)
 
-    processed = [doc for doc in tqdm(jsonlines.open(processed_filepath), desc="reading processed", total=len(sentences))]
+    processed = read_processed(processed_filepath)
 
-    prof_to_si = {}
-    long_sentences = []
-    no_match_sentences = []
-    bracketed_sentences = []
-    speaker_sentences = []
-    song_sentences = []
-    mentions = []
+    print(f"compiling profession matcher")
+    matcher = ProfessionMatcher(profession_df)
 
     # for each profession in the gazetteer, get the singular and plural keys
     # find the list of file sentence indices from these keys using key_to_si
     # for each file sentence index, find the flattened sentence index (rsi)
     # using si_to_rsi
-    # find the sentence using rsi
-    # find the match using the processed doc tokens
-    for _, row in tqdm(profession_df.iterrows(), total=len(profession_df), desc="mentions"):
-        prof = row["word"]
-        si_list = set([(imdb, sent) for key in [row["singular_key"], row["plural_key"]] for imdb, sent in key_to_si[key]])
-        prof_to_si[prof] = []
-
-        for imdb, sent in si_list:
-            rsi = si_to_rsi[imdb][str(sent)]
-            sentence = sentences[rsi]
-            
-            if len(sentence.split()) <= max_n_words:
-                doc = processed[rsi]
-                profession_toks = set([tuple(nltk.wordpunct_tokenize(row["singular"])), tuple(row["singular"].split()), tuple(nltk.wordpunct_tokenize(row["plural"])), tuple(row["plural"].split())])
-                text_tok = [word["word"] for word in doc]
-                match = set()
-
-                for tok in profession_toks:
-                    for i in range(len(text_tok) - len(tok) + 1):
-                        text_subtok = [token.lower() for token in text_tok[i:i + len(tok)]]
-                        if text_subtok == list(tok):
-                            match.add((i, i + len(tok)))
-
-                if match:
-                    for i, j in match:
-                        left = " ".join(text_tok[:i]).strip()
-                        target = " ".join(text_tok[i:j]).strip()
-                        right = " ".join(text_tok[j:]).strip()
-
-                        if contains_open_left_bracket(left) and contains_open_right_bracket(right):
-                            bracketed_sentences.append([prof, imdb, sent, rsi, left, target, right])
-                        elif is_speaker(left, target, right):
-                            speaker_sentences.append([prof, imdb, sent, rsi, left, target, right])
-                        elif is_song(left) or is_song(right):
-                            song_sentences.append([prof, imdb, sent, rsi, sentence])
-                        else:
-                            prof_to_si[prof].append([imdb, sent])
-                            mentions.append([prof, imdb, sent, rsi, left, target, right, i, j])
-                else:
-                    no_match_sentences.append([prof, imdb, sent, rsi, sentence])
-            else:
-                long_sentences.append([prof, imdb, sent, rsi, sentence])
+    # group the file sentence indices of all professions by rsi
+    print(f"finding file sentence indices of professions")
+    si_rows = sorted(set([(rsi, imdb, sent, r) for r, keys in enumerate(zip(profession_df["singular_key"], \
+        profession_df["plural_key"])) for key in keys for imdb, sent, rsi in index.key_si(key)]))
+
+    # for each rsi, find the sentence and the match using the processed doc tokens
+    # every processed doc is matched once against all professions
+    # the records are collected per profession to save them in gazetteer order
+    records = dict((category, [[] for _ in professions]) for category in mention_files)
+    prof_si_lists = [[] for _ in professions]
+    for rsi, rsi_rows in itertools.groupby(tqdm(si_rows, desc="mentions"), key=lambda si_row: si_row[0]):
+        sentence = sentences[rsi]
+        text_tok, rsi_match = None, {}
+
+        if len(sentence.split()) <= max_n_words:
+            doc = processed[rsi]
+            text_tok = [word["word"] for word in doc]
+            rsi_match = matcher.match(text_tok)
+
+        for _, imdb, sent, r in rsi_rows:
+            for category, record in find_sentence_mentions(professions[r], imdb, sent, rsi, sentence, text_tok, \
+                rsi_match.get(r, set()), max_n_words):
+                records[category][r].append(record)
+                if category == "mentions":
+                    prof_si_lists[r].append([imdb, sent])
+
+    prof_to_si = dict((prof, prof_si_lists[r]) for r, prof in enumerate(professions))
+    records = dict((category, [record for prof_records in category_records for record in prof_records]) for \
+        category, category_records in records.items())
 
     # save profession to file sentence index
     print("saving profession to file sentence index dictionary")
     json.dump(prof_to_si, open(prof_to_si_filepath, "w"))
 
-    # create dataframes
-    long_sentences_df = pd.DataFrame(long_sentences, columns=["profession", "imdb", "sent", "rsi", "sentence"])
-    no_match_sentences_df = pd.DataFrame(no_match_sentences, columns=["profession", "imdb", "sent", "rsi", "sentence"])
-    bracketed_sentences_df = pd.DataFrame(bracketed_sentences, columns=["profession", "imdb", "sent", "rsi", "left", "mention", "right"])
-    speaker_sentences_df = pd.DataFrame(speaker_sentences, columns=["profession", "imdb", "sent", "rsi", "left", "mention", "right"])
-    song_sentences_df = pd.DataFrame(song_sentences, columns=["profession", "imdb", "sent", "rsi", "sentence"])
-    mentions_df = pd.DataFrame(mentions, columns=["profession", "imdb", "sent", "rsi", "left", "mention", "right", "start", "end"])
-
     # print lengths
-    S = len(long_sentences_df) + len(no_match_sentences_df) + len(bracketed_sentences_df) + len(speaker_sentences_df) + len(song_sentences_df) + len(mentions_df)
-    print(f"#mentions longer than {max_n_words} words = {len(long_sentences_df)} ({100*len(long_sentences_df)/S:.3f}%)")
-    print(f"#mentions not containing profession = {len(no_match_sentences_df)} ({100*len(no_match_sentences_df)/S:.3f}%)")
-    print(f"#mentions which are bracketed = {len(bracketed_sentences_df)} ({100*len(bracketed_sentences_df)/S:.3f}%)")
-    print(f"#mentions which are speakers = {len(speaker_sentences_df)} ({100*len(speaker_sentences_df)/S:.3f}%)")
-    print(f"#mentions which are songs = {len(song_sentences_df)} ({100*len(song_sentences_df)/S:.3f}%)")
-    print(f"#mentions = {len(mentions_df)} ({100*len(mentions_df)/S:.3f}%)")
+    print_mention_counts(dict((category, len(category_records)) for category, category_records in records.items()), \
+        max_n_words)
 
     print("saving mentions")
-    long_sentences_df.to_csv(os.path.join(mentions_directory, "mentions_long.csv"), index=False)
-    no_match_sentences_df.to_csv(os.path.join(mentions_directory, "mentions_nomatch.csv"), index=False)
-    bracketed_sentences_df.to_csv(os.path.join(mentions_directory, "mentions_bracketed.csv"), index=False)
-    speaker_sentences_df.to_csv(os.path.join(mentions_directory, "mentions_speaker.csv"), index=False)
-    song_sentences_df.to_csv(os.path.join(mentions_directory, "mentions_song.csv"), index=False)
-    mentions_df.to_csv(os.path.join(mentions_directory, "mentions.csv"), index=False)
+    for category, (filename, columns) in mention_files.items():
+        df = pd.DataFrame(records[category], columns=columns)
+        write_mentions(df, mention_filepath(mentions_directory, filename, parquet))
+
+def write_mentions_streaming(lines, rsi_start, context, mentions_directory, progress=True, total=None, rsis=None, \
+    imdbs=None, append=False):
+    """Find mentions of professions in a stream of (sentence, processed doc) pairs and write them to the six
+    mention csv files in `mentions_directory`.
+
+    Parameters
+    ----------
+    lines : iterable \\
+        Iterable of `(sentence, doc)` tuples in flattened sentence index order.
+
+    rsi_start : int \\
+        Flattened sentence index of the first element of `lines`.
+
+    context : tuple \\
+        Tuple of `(index, professions, key_to_rows, matcher, max_n_words)`. `index` is a
+        `SentenceIndex` or `DictSentenceIndex`.
+
+    mentions_directory : str \\
+        Directory to which the mention csv files will be saved.
+
+    rsis : iterable \\
+        Flattened sentence indices of the elements of `lines`. If given, `rsi_start` is ignored and `lines`
+        need not be contiguous.
+
+    imdbs : set \\
+        If given, only the file sentence indices of these IMDb ids are searched.
+
+    append : bool \\
+        If true, the mentions are appended to the mention csv files without headers.
+
+    Returns
+    -------
+    tuple
+        Profession to file sentence index dictionary and the number of rows written
+        to each mention csv file.
+    """
+    index, professions, key_to_rows, matcher, max_n_words = context
+    prof_to_si = dict((prof, []) for prof in professions)
+    counts = dict((category, 0) for category in mention_files)
+
+    # open the mention csv files and write the headers
+    files, writers = {}, {}
+    for category, (filename, columns) in mention_files.items():
+        files[category] = open(os.path.join(mentions_directory, filename), "a" if append else "w", newline="")
+        writers[category] = csv.writer(files[category])
+        if not append:
+            writers[category].writerow(columns)
+
+    # for each rsi, find the file sentence indices and their keys using the sentence index
+    # for each file sentence index, find the gazetteer rows from its keys
+    if rsis is None:
+        rsis = itertools.count(rsi_start)
+    for rsi, (sentence, doc) in zip(rsis, tqdm(lines, desc="mentions", total=total, disable=not progress)):
+        text_tok = [word["word"] for word in doc]
+        rsi_match = matcher.match(text_tok)
+
+        for imdb, sent, keys in index.rsi_si_keys(rsi):
+            if imdbs is not None and imdb not in imdbs:
+                continue
+            rows = sorted(set([r for key in keys for r in key_to_rows.get(key, [])]))
+
+            for r in rows:
+                prof = professions[r]
+                for category, record in find_sentence_mentions(prof, imdb, sent, rsi, sentence, text_tok, \
+                    rsi_match.get(r, set()), max_n_words):
+                    writers[category].writerow(record)
+                    counts[category] += 1
+                    if category == "mentions":
+                        prof_to_si[prof].append([imdb, sent])
+
+    for category in mention_files:
+        files[category].close()
+
+    return prof_to_si, counts
+
+shard_context = None
+
+def init_shard_worker(context):
+    global shard_context
+    shard_context = context
+
+def find_shard_mentions(shard):
+    """Find mentions of the flattened sentence index range `[rsi_start, rsi_end)` and save the six mention csv files
+    and the profession to file sentence index dictionary of the shard in the shard directory. Run by the pool workers.
+    """
+    rsi_start, rsi_end, processed_offset, sentences_filepath, processed_filepath, shard_directory = shard
+    os.makedirs(shard_directory, exist_ok=True)
+    sentences = SentenceStore(sentences_filepath).range(rsi_start, rsi_end)
+
+    # the processed docs are read from the token store by rsi, or from the JSONLINES file by byte offset
+    if os.path.isdir(processed_filepath):
+        store = TokenStore(processed_filepath)
+        docs = (store[rsi] for rsi in range(rsi_start, rsi_end))
+        prof_to_si, counts = write_mentions_streaming(zip(sentences, docs), rsi_start, shard_context, \
+            shard_directory, progress=False)
+    else:
+        with open(processed_filepath, "rb") as processed_reader:
+            processed_reader.seek(processed_offset)
+            docs = (json.loads(doc) for doc in itertools.islice(processed_reader, rsi_end - rsi_start))
+            prof_to_si, counts = write_mentions_streaming(zip(sentences, docs), rsi_start, shard_context, \
+                shard_directory, progress=False)
+
+    json.dump(prof_to_si, open(os.path.join(shard_directory, "prof_to_si.json"), "w"))
+    return counts
+
+def find_line_offsets(filepath, chunk_size):
+    """Returns the byte offsets of every `chunk_size`-th line of the file
+    """
+    offsets = []
+    offset = 0
+    with open(filepath, "rb") as reader:
+        for i, line in enumerate(reader):
+            if i % chunk_size == 0:
+                offsets.append(offset)
+            offset += len(line)
+    return offsets
+
+def merge_shard_mentions(shard_directories, mentions_directory, prof_to_si_filepath, professions):
+    """Concatenate the mention csv files and the profession to file sentence index dictionaries of the shards
+    in shard order, and delete the shard directories.
+    """
+    for filename, _ in mention_files.values():
+        with open(os.path.join(mentions_directory, filename), "wb") as writer:
+            for k, shard_directory in enumerate(shard_directories):
+                with open(os.path.join(shard_directory, filename), "rb") as reader:
+                    header = reader.readline()
+                    if k == 0:
+                        writer.write(header)
+                    shutil.copyfileobj(reader, writer)
+
+    prof_to_si = dict((prof, []) for prof in professions)
+    for shard_directory in shard_directories:
+        for prof, si_list in json.load(open(os.path.join(shard_directory, "prof_to_si.json"))).items():
+            prof_to_si[prof].extend(si_list)
+    json.dump(prof_to_si, open(prof_to_si_filepath, "w"))
+
+    for shard_directory in shard_directories:
+        shutil.rmtree(shard_directory)
+
+def create_mention_context(index, profession_filepath, max_n_words):
+    """Returns the `(index, professions, key_to_rows, matcher, max_n_words)` context of `write_mentions_streaming`
+    """
+    print(f"reading profession gazetteer")
+    profession_df = pd.read_csv(profession_filepath, index_col = None)
+    professions = profession_df["word"].tolist()
+
+    print(f"compiling profession matcher")
+    matcher = ProfessionMatcher(profession_df)
+
+    # find key to gazetteer rows
+    key_to_rows = {}
+    for r, (singular_key, plural_key) in enumerate(zip(profession_df["singular_key"], profession_df["plural_key"])):
+        for key in set([singular_key, plural_key]):
+            if key not in key_to_rows:
+                key_to_rows[key] = []
+            key_to_rows[key].append(r)
+
+    return index, professions, key_to_rows, matcher, max_n_words
+
+def convert_mention_files(mentions_directory, professions):
+    """Convert the mention csv files in `mentions_directory` to parquet files and delete the csv files. The mentions
+    are stably sorted by profession in gazetteer order, so that the parquet row groups span few professions.
+    """
+    profession_to_row = dict((prof, r) for r, prof in reversed(list(enumerate(professions))))
+    for filename, _ in mention_files.values():
+        csv_filepath = mention_filepath(mentions_directory, filename)
+        df = read_mentions(csv_filepath, dtype={"imdb": str}, categorical=False)
+        df = df.iloc[np.argsort(df["profession"].map(profession_to_row).values, kind="stable")]
+        write_mentions(df, mention_filepath(mentions_directory, filename, parquet=True))
+        os.remove(csv_filepath)
+
+def find_mentions_streaming(si_to_key_filepath, rsi_to_si_filepath, sentences_filepath, processed_filepath, profession_filepath, prof_to_si_filepath, mentions_directory, max_n_words, n_workers=1, chunk_size=100000, index_dir=None, parquet=False):
+    """Find mentions of professions in subtitle sentences in constant memory. The sentences and the NLP processed
+    docs are read in lockstep, one rsi at a time, and the mention rows are appended to the six mention csv files
+    as they are found. Peak memory is bounded by the gazetteer and the sentence index dictionaries, not by the
+    number of sentences.
+
+    The mention csv files contain the same rows as `find_mentions`, but they are ordered by rsi instead of by
+    profession.
+
+    Parameters
+    ----------
+    si_to_key_filepath : str \\
+        JSON filepath containing file sentence index to key dictionary.
+        It is of the form `{imdb:{sent:[key]}}`
+
+    rsi_to_si_filepath : str \\
+        JSON filepath containing flattened sentence index to file sentence
+        index dictionary. It is of the form `{rsi:[[imdb, sent]]}`
+
+    sentences_filepath, processed_filepath, profession_filepath, prof_to_si_filepath, mentions_directory, \
+    max_n_words : \\
+        Same as `find_mentions`
+
+    n_workers : int \\
+        Number of worker processes. If greater than 1, the flattened sentence index range is split into
+        shards of `chunk_size` sentences. Each worker writes the mention csv files of its shards to
+        `mentions_directory/shards/`, and the shards are merged in rsi order. The output is the same
+        as that of a single process.
+
+    chunk_size : int \\
+        Number of sentences in a shard.
+
+    index_dir : str \\
+        Directory of the compact sentence index. If given, it is used instead of the si_to_key
+        and rsi_to_si dictionaries.
+
+    parquet : bool \\
+        If True, the mention csv files are converted to parquet files by `convert_mention_files` after the search.
+        The conversion reads each mention file into memory, and the parquet mentions are ordered by profession in
+        gazetteer order, like those of `find_mentions`.
+    """
+
+    # read the dictionaries and the profession gazetteer
+    if index_dir is not None:
+        print(f"loading sentence index")
+        index = SentenceIndex.load(index_dir)
+    else:
+        print(f"reading dictionaries")
+        index = DictSentenceIndex(rsi_to_si=json.load(open(rsi_to_si_filepath)), \
+            si_to_key=json.load(open(si_to_key_filepath)))
+
+    context = create_mention_context(index, profession_filepath, max_n_words)
+    professions = context[1]
+
+    if n_workers > 1:
+        # split the flattened sentence index range into shards
+        print(f"finding shard offsets")
+        n_sentences = len(SentenceStore(sentences_filepath))
+        if os.path.isdir(processed_filepath):
+            processed_offsets = [None] * int(np.ceil(n_sentences/chunk_size))
+        else:
+            processed_offsets = find_line_offsets(processed_filepath, chunk_size)
+        shards = []
+        for k, rsi_start in enumerate(range(0, n_sentences, chunk_size)):
+            shard_directory = os.path.join(mentions_directory, "shards", f"{k:05d}")
+            shards.append((rsi_start, min(rsi_start + chunk_size, n_sentences), processed_offsets[k], \
+                sentences_filepath, processed_filepath, shard_directory))
+
+        # find the mentions of each shard
+        counts = dict((category, 0) for category in mention_files)
+        with multiprocessing.Pool(n_workers, initializer=init_shard_worker, initargs=(context,)) as pool:
+            for shard_counts in tqdm(pool.imap_unordered(find_shard_mentions, shards), total=len(shards), \
+                desc="mentions"):
+                for category, n in shard_counts.items():
+                    counts[category] += n
+
+        # merge the shards
+        print("merging shards")
+        merge_shard_mentions([shard[-1] for shard in shards], mentions_directory, prof_to_si_filepath, professions)
+        os.rmdir(os.path.join(mentions_directory, "shards"))
+    else:
+        # walk the sentences and processed docs in lockstep
+        with open(sentences_filepath) as sentences_reader:
+            lines = ((sentence.rstrip("\n"), doc) for sentence, doc in zip(sentences_reader, \
+                iter_processed(processed_filepath)))
+            prof_to_si, counts = write_mentions_streaming(lines, 0, context, mentions_directory, \
+                total=len(index))
+
+        # save profession to file sentence index
+        print("saving profession to file sentence index dictionary")
+        json.dump(prof_to_si, open(prof_to_si_filepath, "w"))
+
+    if parquet:
+        print("converting mention files to parquet")
+        convert_mention_files(mentions_directory, professions)
+
+    # print lengths
+    print_mention_counts(counts, max_n_words)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Find mentions", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
     parser.add_argument("--k2s", type=str, dest="k2s", help="json file of key to sentence index", default="/proj/sbaruah/subtitle/profession/csl/data/mentions/key_to_si.json")
     parser.add_argument("--s2r", type=str, help="json file of file sentence index to flattened sentence index", default="/proj/sbaruah/subtitle/profession/csl/data/mentions/si_to_rsi.json", dest="s2r")
+    parser.add_argument("--s2k", type=str, help="json file of file sentence index to key, used in streaming mode", default="/proj/sbaruah/subtitle/profession/csl/data/mentions/si_to_key.json", dest="s2k")
+    parser.add_argument("--r2s", type=str, help="json file of flattened sentence index to file sentence index, used in streaming mode", default="/proj/sbaruah/subtitle/profession/csl/data/mentions/rsi_to_si.json", dest="r2s")
+    parser.add_argument("--index", type=str, help="directory of the compact sentence index. If given, it is used instead of the json dictionaries", default=None, dest="index")
     parser.add_argument("--sent", type=str, help="txt file of subtitle sentences which have some professiona word", default="/proj/sbaruah/subtitle/profession/csl/data/mentions/sentences.txt", dest="sent")
-    parser.add_argument("--proc", type=str, help="json file of processed sentences (tokens, POS, NER)", default="/proj/sbaruah/subtitle/profession/csl/data/mentions/processed_finegrained.jsonl", dest="proc")
+    parser.add_argument("--proc", type=str, help="json file or token store directory of processed sentences (tokens, POS, NER)", default="/proj/sbaruah/subtitle/profession/csl/data/mentions/processed_finegrained.jsonl", dest="proc")
     parser.add_argument("--gzt", type=str, help="csv file of profession gazetteer", default="/proj/sbaruah/subtitle/profession/csl/data/gazetteer/inflection.csv", dest="gzt")
     parser.add_argument("--p2s", type=str, help="json file to which profession to file sentence index will be saved", default="/proj/sbaruah/subtitle/profession/csl/data/mentions/prof_to_si.json", dest="p2s")
     parser.add_argument("--mentions", type=str, help="directory to which the mention csv files will be saved", default="/proj/sbaruah/subtitle/profession/csl/data/mentions/", dest="mentions")
     parser.add_argument("--max_words", type=int, help="Maximum number of words allowed in the subtitle sentence", default=100, dest="max")
+    parser.add_argument("--stream", action="store_true", help="stream the sentences and processed docs in constant memory", dest="stream")
+    parser.add_argument("--workers", type=int, help="number of worker processes. If greater than 1, mentions are found in streaming mode over shards of sentences", default=1, dest="workers")
+    parser.add_argument("--chunk_size", type=int, help="number of sentences in a shard", default=100000, dest="chunk_size")
+    parser.add_argument("--parquet", action="store_true", help="save the mention files as parquet files instead of csv files", dest="parquet")
 
     args = parser.parse_args()
     key_to_si_filepath = args.k2s
     si_to_rsi_filepath = args.s2r
+    si_to_key_filepath = args.s2k
+    rsi_to_si_filepath = args.r2s
+    index_dir = args.index
     sentences_filepath = args.sent
     processed_filepath = args.proc
     profession_filepath = args.gzt
     prof_to_si_filepath = args.p2s
     mentions_directory = args.mentions
     max_n_words = args.max
-
-    find_mentions(key_to_si_filepath, si_to_rsi_filepath, sentences_filepath, processed_filepath, profession_filepath, prof_to_si_filepath, mentions_directory, max_n_words)
\ No newline at end of file
+    stream = args.stream
+    n_workers = args.workers
+    chunk_size = args.chunk_size
+    parquet = args.parquet
+
+    if stream or n_workers > 1:
+        find_mentions_streaming(si_to_key_filepath, rsi_to_si_filepath, sentences_filepath, processed_filepath, profession_filepath, prof_to_si_filepath, mentions_directory, max_n_words, n_workers=n_workers, chunk_size=chunk_size, index_dir=index_dir, parquet=parquet)
+    else:
+        find_mentions(key_to_si_filepath, si_to_rsi_filepath, sentences_filepath, processed_filepath, profession_filepath, prof_to_si_filepath, mentions_directory, max_n_words, index_dir=index_dir, parquet=parquet)
\ No newline at end of file
@@ -3,10 +3,154 @@ import json
 import numpy as np
 import argparse
 import os
+import bisect
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from sentence_store import SentenceStore
+from merge_ner_pos import merge_finegrained_processed
 
-def process_sentences(sentences_filepath, n_batches, batch_index, max_n_words, processed_dir):
+def annotate_texts(client, texts):
+    """Tokenize and find the POS and NER tags of a list of subtitle lines in one CoreNLP request.
+
+    The lines are joined by newlines, and every newline is a sentence break
+    (`ssplit.newlineIsSentenceBreak=always`), so no sentence spans two lines. A line is still split
+    into sentences as it would be if it were annotated alone, e.g. "Stop. Police!" is two sentences.
+    The tokens of the sentences of a line are merged back into the doc of the line using their
+    character offsets, and the offsets are made relative to the line. CoreNLP offsets count UTF-16
+    code units, so the line offsets are counted in the same unit.
+
+    Parameters
+    ----------
+    client : CoreNLPClient \\
+        Client of a running CoreNLP server
+
+    texts : list \\
+        List of subtitle lines. They should not contain newlines.
+
+    Returns
+    -------
+    list
+        List of docs, one per line. A doc is a list of tokens of the form
+        `{lemma:str, word:str, start:int, end:int, pos:str, ner:str}`
+    """
+    line_starts = []
+    offset = 0
+    for text in texts:
+        line_starts.append(offset)
+        offset += len(text.encode("utf-16-le"))//2 + 1
+
+    docs = [[] for _ in texts]
+    stanford_doc = client.annotate("\n".join(texts), properties={"ssplit.newlineIsSentenceBreak": "always"})
+    for sentence in stanford_doc["sentences"]:
+        for token in sentence["tokens"]:
+            i = bisect.bisect_right(line_starts, token["characterOffsetBegin"]) - 1
+            docs[i].append(dict(lemma=token["lemma"], word=token["originalText"], \
+                start=token["characterOffsetBegin"] - line_starts[i], end=token["characterOffsetEnd"] - line_starts[i], \
+                    pos=token["pos"], ner=token["ner"]))
+    return docs
+
+def annotate_sentences(client, sentences, max_n_words, batch_size, n_concurrent):
+    """Annotate subtitle sentences with batched requests, keeping `n_concurrent` requests in flight.
+    The docs are yielded in the order of the sentences.
+
+    Parameters
+    ----------
+    client : CoreNLPClient \\
+        Client of a running CoreNLP server
+
+    sentences : list \\
+        List of subtitle sentences
+
+    max_n_words : int \\
+        If sentences contain more than `max_n_words`, ignore them.
+        Their processed docs are empty lists
+
+    batch_size : int \\
+        Number of sentences packed in one request
+
+    n_concurrent : int \\
+        Number of requests in flight
+    """
+    def annotate_batch(batch):
+        docs = [[] for _ in batch]
+        indices = [i for i, text in enumerate(batch) if len(text.split()) <= max_n_words and text.strip()]
+        if indices:
+            for i, doc in zip(indices, annotate_texts(client, [batch[i] for i in indices])):
+                docs[i] = doc
+        return docs
+
+    with ThreadPoolExecutor(max_workers=n_concurrent) as executor:
+        futures = deque()
+        for i in range(0, len(sentences), batch_size):
+            futures.append(executor.submit(annotate_batch, sentences[i: i + batch_size]))
+            if len(futures) > n_concurrent:
+                yield from futures.popleft().result()
+        while futures:
+            yield from futures.popleft().result()
+
+def read_checkpoint(processed_filepath):
+    """Returns the number of docs and the byte offset recorded in the checkpoint of the processed JSONLINES file.
+    Returns `(0, 0)` if there is no checkpoint.
+    """
+    checkpoint_filepath = processed_filepath + ".checkpoint"
+    if os.path.exists(processed_filepath) and os.path.exists(checkpoint_filepath):
+        checkpoint = json.load(open(checkpoint_filepath))
+        return checkpoint["n_docs"], checkpoint["offset"]
+    return 0, 0
+
+def write_checkpoint(processed_filepath, n_docs, offset, n_expected_docs):
+    """Record that the first `n_docs` docs, `offset` bytes, of the processed JSONLINES file are complete, out of the
+    `n_expected_docs` docs of its sentence range. `merge_ner_pos` only merges files whose docs are all complete.
+    """
+    checkpoint_filepath = processed_filepath + ".checkpoint"
+    json.dump(dict(n_docs=n_docs, offset=offset, n_expected_docs=n_expected_docs), \
+        open(checkpoint_filepath + ".tmp", "w"))
+    os.replace(checkpoint_filepath + ".tmp", checkpoint_filepath)
+
+def is_complete(processed_filepath, n_expected_docs):
+    """Returns True if the checkpoint of the processed JSONLINES file records all the `n_expected_docs` docs
+    """
+    checkpoint_filepath = processed_filepath + ".checkpoint"
+    if not os.path.exists(processed_filepath) or not os.path.exists(checkpoint_filepath):
+        return False
+    checkpoint = json.load(open(checkpoint_filepath))
+    return checkpoint["n_docs"] == checkpoint.get("n_expected_docs") == n_expected_docs
+
+def write_processed(client, sentences, processed_filepath, max_n_words, batch_size, n_concurrent, checkpoint_every, \
+    desc):
+    """Annotate the sentences and append the docs to the processed JSONLINES file, resuming from its checkpoint.
+    The file is truncated to the checkpoint offset, so docs written after the last checkpoint are annotated again.
+    A checkpoint is recorded every `checkpoint_every` docs and at the end, also if there are no docs to annotate.
+    """
+    n_done, offset = read_checkpoint(processed_filepath)
+
+    with open(processed_filepath, "r+b" if os.path.exists(processed_filepath) else "wb") as writer:
+        writer.truncate(offset)
+        writer.seek(offset)
+
+        for i, doc in enumerate(annotate_sentences(client, sentences[n_done:], max_n_words, batch_size, \
+            n_concurrent), start=n_done + 1):
+            writer.write((json.dumps(doc) + "\n").encode("utf-8"))
+
+            if i % checkpoint_every == 0 or i == len(sentences):
+                writer.flush()
+                os.fsync(writer.fileno())
+                write_checkpoint(processed_filepath, i, writer.tell(), len(sentences))
+                print(f"{desc}. {100*i//len(sentences):3d}% sentences processed")
+
+        if n_done >= len(sentences):
+            write_checkpoint(processed_filepath, n_done, offset, len(sentences))
+
+def process_sentences(sentences_filepath, n_batches, batch_index, max_n_words, processed_dir, batch_size=50, \
+    n_concurrent=8, checkpoint_every=1000):
     """Tokenize and find the POS and NER tags of the subtitle sentences.
 
+    The processed docs are appended to `processed_dir/processed_finegrained_{batch_index}.jsonl` as they
+    are annotated, and a progress checkpoint is recorded next to it. If the job is killed, running it again
+    resumes from the last checkpoint.
+
     Parameters
     ----------
         
@@ -17,40 +161,159 @@ def process_sentences(sentences_filepath, n_batches, batch_index, max_n_words, p
         If sentences contain more than `max_n_words`, ignore them.
         Their processed docs are empty lists
 
-    processed_filepath : str \\
-        JSON filepath to which the processed sentence docs will be saved.
-        It is of the form `[[{token:str, ner:str, xpos:str}]]`
+    processed_dir : str \\
+        Directory to which the JSONLINES file of processed sentence docs will be saved.
+        Each line is of the form `[{lemma:str, word:str, start:int, end:int, pos:str, ner:str}]`
+
+    batch_size : int \\
+        Number of sentences packed in one CoreNLP request
+
+    n_concurrent : int \\
+        Number of CoreNLP requests in flight. The server runs 8 threads.
+
+    checkpoint_every : int \\
+        Number of docs between checkpoints
+    """
+
+    # find the sentence range of the batch
+    n_batch_sentences = int(np.ceil(len(SentenceStore(sentences_filepath))/n_batches))
+    processed_filepath = os.path.join(processed_dir, f"processed_finegrained_{batch_index}.jsonl")
+    process_sentence_range(sentences_filepath, batch_index * n_batch_sentences, (batch_index + 1) * n_batch_sentences, \
+        processed_filepath, max_n_words, batch_index, batch_size=batch_size, n_concurrent=n_concurrent, \
+            checkpoint_every=checkpoint_every, desc=f"batch {batch_index:2d}")
+
+def process_sentence_range(sentences_filepath, start, end, processed_filepath, max_n_words, server_index, \
+    batch_size=50, n_concurrent=8, checkpoint_every=1000, desc="sentences"):
+    """Tokenize and find the POS and NER tags of the subtitle sentences from `start` (inclusive) to `end`
+    (exclusive) and save the docs to `processed_filepath`, resuming from its checkpoint. The CoreNLP server
+    listens on port `12345 + server_index` and logs to `error_{server_index}.log`.
     """
+    sentences = SentenceStore(sentences_filepath).range(start, end)
+    port = 12345 + server_index
 
-    # read the sentences
-    sentences = open(sentences_filepath).read().strip().split("\n")
-    n_batch_sentences = int(np.ceil(len(sentences)/n_batches))
-    sentences = sentences[batch_index * n_batch_sentences: (batch_index + 1) * n_batch_sentences]
-    port = 12345 + batch_index
+    # find the progress. A complete or empty range is recorded as complete without starting the server
+    n_done, offset = read_checkpoint(processed_filepath)
+    if n_done >= len(sentences):
+        print(f"{desc}. all sentences already processed")
+        open(processed_filepath, "ab").close()
+        write_checkpoint(processed_filepath, n_done, offset, len(sentences))
+        return
+    if n_done:
+        print(f"{desc}. resuming from sentence {n_done}")
 
     # create the NLP processing pipeline
-    docs = []
     with CoreNLPClient(threads=8, annotators=["tokenize","pos","ner"], output_format="json", memory="8G", \
-        be_quiet=True, timeout=60000, stderr=open(f"error_{batch_index}.log", "w"), \
+        be_quiet=True, timeout=60000, stderr=open(f"error_{server_index}.log", "a"), \
             endpoint=f"http://localhost:{port}") as client:
+        write_processed(client, sentences, processed_filepath, max_n_words, batch_size, n_concurrent, \
+            checkpoint_every, desc)
+
+def tag_chunks(worker_index, chunk_queue, attempts, failed, errors, lock, sentences, processed_dir, max_n_words, \
+    batch_size, n_concurrent, checkpoint_every, max_retries):
+    """Worker of `process_sentences_dynamic`. It starts a CoreNLP server on port `12345 + worker_index` and tags
+    chunks from the shared queue until the queue is empty. A failed chunk is put back in the queue until it has
+    failed `max_retries` times, and the server is restarted. An error outside of a chunk, such as a server that
+    does not start, stops the worker and is appended to `errors`, so that the main thread can raise it.
+    """
+    port = 12345 + worker_index
+
+    try:
+        while not chunk_queue.empty():
+            with CoreNLPClient(threads=8, annotators=["tokenize","pos","ner"], output_format="json", memory="8G", \
+                be_quiet=True, timeout=60000, stderr=open(f"error_{worker_index}.log", "a"), \
+                    endpoint=f"http://localhost:{port}") as client:
+
+                while True:
+                    try:
+                        k, start, end = chunk_queue.get_nowait()
+                    except queue.Empty:
+                        return
+
+                    chunk_filepath = os.path.join(processed_dir, "chunks", \
+                        f"processed_finegrained_{k:06d}.jsonl")
+                    try:
+                        write_processed(client, sentences.range(start, end), chunk_filepath, max_n_words, \
+                            batch_size, n_concurrent, checkpoint_every, f"worker {worker_index:2d}. chunk {k:6d}")
+                    except Exception as error:
+                        with lock:
+                            attempts[k] += 1
+                            if attempts[k] < max_retries:
+                                chunk_queue.put((k, start, end))
+                            else:
+                                failed.append(k)
+                        print(f"worker {worker_index:2d}. chunk {k:6d} failed ({error}), restarting server")
+                        break
+    except Exception as error:
+        print(f"worker {worker_index:2d}. stopped ({error!r})")
+        with lock:
+            errors.append(error)
+
+def process_sentences_dynamic(sentences_filepath, n_workers, chunk_size, max_n_words, processed_dir, batch_size=50, \
+    n_concurrent=8, checkpoint_every=1000, max_retries=3):
+    """Tokenize and find the POS and NER tags of the subtitle sentences with `n_workers` CoreNLP servers that take
+    small chunks of sentences from a shared queue, instead of a static split into `n_batches` slices.
+
+    Each chunk is saved to `processed_dir/chunks/processed_finegrained_{chunk:06d}.jsonl` with its checkpoint,
+    so completed chunks are skipped and partial chunks are resumed when the job is run again. When all chunks
+    are complete, they are merged in order into `processed_dir/processed_finegrained.jsonl`.
+
+    Parameters
+    ----------
+    sentences_filepath : str \\
+        TEXT filepath containing subtitle sentences that contain some professional title
+
+    n_workers : int \\
+        Number of CoreNLP servers
+
+    chunk_size : int \\
+        Number of sentences in a chunk
+
+    max_retries : int \\
+        Number of times a chunk is tried before it is given up
+
+    max_n_words, processed_dir, batch_size, n_concurrent, checkpoint_every : \\
+        Same as `process_sentences`
+    """
+    sentences = SentenceStore(sentences_filepath)
+    chunks = [(k, start, min(start + chunk_size, len(sentences))) for k, start in \
+        enumerate(range(0, len(sentences), chunk_size))]
+    chunk_filepaths = [os.path.join(processed_dir, "chunks", f"processed_finegrained_{k:06d}.jsonl") for k, _, _ in \
+        chunks]
+    os.makedirs(os.path.join(processed_dir, "chunks"), exist_ok=True)
+
+    # queue the chunks that are not complete
+    chunk_queue = queue.Queue()
+    for (k, start, end), chunk_filepath in zip(chunks, chunk_filepaths):
+        if not is_complete(chunk_filepath, end - start):
+            chunk_queue.put((k, start, end))
+    print(f"{chunk_queue.qsize()}/{len(chunks)} chunks to process")
+
+    # tag the chunks
+    attempts = dict((k, 0) for k, _, _ in chunks)
+    failed, errors = [], []
+    lock = threading.Lock()
+    workers = [threading.Thread(target=tag_chunks, args=(worker_index, chunk_queue, attempts, failed, errors, lock, \
+        sentences, processed_dir, max_n_words, batch_size, n_concurrent, checkpoint_every, max_retries)) for \
+            worker_index in range(n_workers)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    # the other workers keep tagging after a worker stops, so the chunks they completed are saved
+    if errors:
+        print(f"{len(errors)} of {n_workers} workers stopped with an error")
+        raise errors[0]
+
+    incomplete = [k for (k, start, end), chunk_filepath in zip(chunks, chunk_filepaths) \
+        if not is_complete(chunk_filepath, end - start)]
+    if incomplete:
+        raise RuntimeError(f"{len(incomplete)} chunks are incomplete, {len(failed)} failed {max_retries} times: "
+            f"{incomplete[:10]}. Run again to resume.")
 
-        for i, text in enumerate(sentences):
-            doc = []
-            if len(text.split()) <= max_n_words:
-                stanford_doc = client.annotate(text)
-                for sentence in stanford_doc["sentences"]:
-                    for token in sentence["tokens"]:
-                        doc.append(dict(lemma=token["lemma"], word=token["originalText"], \
-                            start=token["characterOffsetBegin"], end=token["characterOffsetEnd"], pos=token["pos"], \
-                                ner=token["ner"]))
-            docs.append(doc)
-            print(f"batch {batch_index:2d}. {100*(i + 1)//len(sentences):3d}% sentences processed")
-            docs.append(doc)
-
-    # save the processed sentences
-    print(f"batch {batch_index:2d}. saving processed batch")
-    processed_filepath = os.path.join(processed_dir, f"processed_finegrained_{batch_index}.json")
-    json.dump(docs, open(processed_filepath, "w"))
+    # merge the chunks in order
+    print("merging chunks")
+    merge_finegrained_processed(chunk_filepaths, os.path.join(processed_dir, "processed_finegrained.jsonl"))
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Tokenize and find POS and named entities using Stanford CoreNLP", \
@@ -62,8 +325,19 @@ if __name__ == "__main__":
         dest="batch_index")
     parser.add_argument("--max_words", type=int, help="Maximum number of words allowed in the subtitle sentence", \
         default=100, dest="max")
-    parser.add_argument("--out", type=str, help="directory to which the processed json files will be saved", \
+    parser.add_argument("--out", type=str, help="directory to which the processed jsonl files will be saved", \
         default="/proj/sbaruah/subtitle/profession/csl/data/mentions/", dest="out")
+    parser.add_argument("--batch_size", type=int, help="number of sentences packed in one CoreNLP request", default=50, \
+        dest="batch_size")
+    parser.add_argument("--concurrent", type=int, help="number of CoreNLP requests in flight", default=8, \
+        dest="concurrent")
+    parser.add_argument("--checkpoint_every", type=int, help="number of docs between progress checkpoints", \
+        default=1000, dest="checkpoint_every")
+    parser.add_argument("--workers", type=int, help="number of CoreNLP servers taking chunks from a shared queue. If \
+        greater than 0, --n_batches and --batch_index are ignored", default=0, dest="workers")
+    parser.add_argument("--chunk_size", type=int, help="number of sentences in a chunk of the shared queue", \
+        default=2000, dest="chunk_size")
+    parser.add_argument("--retries", type=int, help="number of times a chunk is tried", default=3, dest="retries")
 
     args = parser.parse_args()
     sentences_filepath = args.sent
@@ -71,5 +345,17 @@ if __name__ == "__main__":
     batch_index = args.batch_index
     max_n_words = args.max
     processed_dir = args.out
+    batch_size = args.batch_size
+    n_concurrent = args.concurrent
+    checkpoint_every = args.checkpoint_every
+    n_workers = args.workers
+    chunk_size = args.chunk_size
+    max_retries = args.retries
 
-    process_sentences(sentences_filepath, n_batches, batch_index, max_n_words, processed_dir)
\ No newline at end of file
+    if n_workers > 0:
+        process_sentences_dynamic(sentences_filepath, n_workers, chunk_size, max_n_words, processed_dir, \
+            batch_size=batch_size, n_concurrent=n_concurrent, checkpoint_every=checkpoint_every, \
+                max_retries=max_retries)
+    else:
+        process_sentences(sentences_filepath, n_batches, batch_index, max_n_words, processed_dir, \
+            batch_size=batch_size, n_concurrent=n_concurrent, checkpoint_every=checkpoint_every)
\ No newline at end of file
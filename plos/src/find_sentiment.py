@@ -2,10 +2,12 @@ import pandas as pd
 import numpy as np
 from collections import defaultdict
 from tqdm import tqdm
+from mention_store import read_mentions
 
 def find_sentiment(mentions_file, imdb_file, profession_file, out_profession_file, out_soc_file):
     print('reading mentions, imdb, professions')
-    mentions_df = pd.read_csv(mentions_file, index_col=None, dtype={'soc_code':str, 'soc_name':str})
+    mentions_df = read_mentions(mentions_file, columns=['profession', 'profession_merge', 'imdb', 'soc_name', \
+        'sentiment_label'], dtype={'soc_code':str, 'soc_name':str})
     imdb_df = pd.read_csv(imdb_file, index_col=None)
     profession_df = pd.read_csv(profession_file, index_col=None)
     
@@ -14,7 +16,7 @@ def find_sentiment(mentions_file, imdb_file, profession_file, out_profession_fil
     professions = profession_df.profession_merge.unique()[:500]
 
     print('finding sentiment by profession')
-    gdf = mentions_df[mentions_df.profession_merge.isin(professions)].groupby(['profession','year','sentiment_label']).agg({'imdb':len}).imdb
+    gdf = mentions_df[mentions_df.profession_merge.isin(professions)].groupby(['profession','year','sentiment_label'], observed=True).agg({'imdb':len}).imdb
     gdf = gdf.reindex(index=pd.MultiIndex.from_product([professions, np.arange(1950, 2018), [-1,0,1]], names=['profession','year','sentiment']), fill_value=0)
     gdf.to_csv(out_profession_file, header=True)
 
@@ -1,12 +1,23 @@
 import math
+import os
+import csv
+import itertools
+import multiprocessing
+import queue
+import threading
 
-from collections import namedtuple
+from collections import namedtuple, deque
 from nltk.corpus import wordnet as wn
 import numpy as np
+import pandas as pd
 import jsonlines
 import torch
-from tqdm import tqdm, trange
+from tqdm import tqdm
 import argparse
+from token_store import TokenStore, iter_processed
+from sentence_store import SentenceStore
+from logit_cache import LogitCache, file_sha256
+from mention_store import read_mentions
 
 from ewiser.fairseq_ext.data.dictionaries import Dictionary, ResourceManager, DEFAULT_DICTIONARY
 from ewiser.fairseq_ext.data.utils import make_offset
@@ -15,11 +26,393 @@ from ewiser.fairseq_ext.models.sequence_tagging import LinearTaggerModel
 def make_offset(synset):
     return "wn:" + str(synset.offset()).zfill(8) + synset.pos()
 
-def find_wsd(processed_filepath, wsd_checkpoint_filepath, wsd_filepath, device, batch_size, use_pos=True):
+class CandidateTable:
+    """Candidate synsets of the `(lemma, WordNet POS)` pairs, found once per pair.
+
+    The candidates of pair `c` are `names[offsets[c]: offsets[c + 1]]`, and their indices in the EWISER output
+    dictionary are `output_indices[offsets[c]: offsets[c + 1]]`. The arrays grow as new pairs are found.
+
+    Parameters
+    ----------
+    output_dictionary : ewiser Dictionary \\
+        Output dictionary of the EWISER model
+    """
+
+    def __init__(self, output_dictionary):
+        self.output_dictionary = output_dictionary
+        self.key_to_id = {}
+        self.names = []
+        self.offsets = np.zeros(1024, dtype=np.int64)
+        self.output_indices = np.zeros(1024, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.key_to_id)
+
+    def find(self, lemma, pos):
+        """Returns the candidate id of the lowercased lemma and WordNet POS. If `pos` is None, the candidates are
+        the synsets of all parts of speech.
+        """
+        key = (lemma, pos)
+        if key not in self.key_to_id:
+            synsets = wn.synsets(lemma, pos) if pos else wn.synsets(lemma)
+            self._add(key, [self.output_dictionary.index(make_offset(synset)) for synset in synsets], \
+                [synset.name() for synset in synsets])
+        return self.key_to_id[key]
+
+    def _add(self, key, output_indices, names):
+        c = len(self.key_to_id)
+        start, end = self.offsets[c], self.offsets[c] + len(names)
+        if c + 2 > len(self.offsets):
+            self.offsets = np.concatenate([self.offsets, np.zeros(len(self.offsets), dtype=np.int64)])
+        while end > len(self.output_indices):
+            self.output_indices = np.concatenate([self.output_indices, np.zeros(len(self.output_indices), \
+                dtype=np.int64)])
+        self.output_indices[start: end] = output_indices
+        self.offsets[c + 1] = end
+        self.names.extend(names)
+        self.key_to_id[key] = c
+
+    def entries(self, start=0):
+        """Returns the `(key, output_indices, names)` entries of the candidate ids from `start`
+        """
+        keys = list(self.key_to_id.keys())[start:]
+        return [(key, self.output_indices[self.offsets[c]: self.offsets[c + 1]].tolist(), \
+            self.names[self.offsets[c]: self.offsets[c + 1]]) for c, key in enumerate(keys, start=start)]
+
+    def merge(self, entries):
+        """Add the entries returned by `entries` of another table whose keys are not in this table
+        """
+        for key, output_indices, names in entries:
+            if key not in self.key_to_id:
+                self._add(key, output_indices, names)
+
+    def save(self, filepath):
+        """Save the table to a NPZ file
+        """
+        keys = list(self.key_to_id.keys())
+        np.savez(filepath, lemmas=np.array([lemma for lemma, _ in keys], dtype=str), \
+            pos=np.array([pos or "" for _, pos in keys], dtype=str), offsets=self.offsets[: len(keys) + 1], \
+                output_indices=self.output_indices[: self.offsets[len(keys)]], names=np.array(self.names, dtype=str))
+
+    @classmethod
+    def load(cls, filepath, output_dictionary):
+        """Load the table saved by `save`
+        """
+        data = np.load(filepath)
+        table = cls(output_dictionary)
+        offsets, output_indices, names = data["offsets"], data["output_indices"], data["names"].tolist()
+        for c, (lemma, pos) in enumerate(zip(data["lemmas"].tolist(), data["pos"].tolist())):
+            table._add((lemma, pos or None), output_indices[offsets[c]: offsets[c + 1]], \
+                names[offsets[c]: offsets[c + 1]])
+        return table
+
+wnpos = {"NN":"n", "VB":"v", "JJ":"a", "RB":"r"}
+
+def prepare_doc(doc, dictionary, candidates, pos_variants=(True,), positions=None):
+    """Returns the `(tokens, indices, candidate_ids)` of the doc. `indices` are the input dictionary indices of the
+    tokens, and `candidate_ids` is the `(len(pos_variants), n_tokens)` int64 array of the candidate table ids of the
+    tokens, one row per variant. A variant finds the candidates with the POS tag if it is True, and without it
+    otherwise. If `positions` is given, only the tokens at these positions are disambiguated, and the candidate ids
+    of the other tokens are -1.
+    """
+    tokens = [word["word"] for word in doc]
+    indices = [dictionary.index(token) for token in tokens]
+    if positions is None:
+        positions = range(len(doc))
+    candidate_ids = np.full((len(pos_variants), len(doc)), -1, dtype=np.int64)
+    for j in positions:
+        word = doc[j]
+        lemma = word["lemma"].lower()
+        for v, use_pos in enumerate(pos_variants):
+            candidate_ids[v, j] = candidates.find(lemma, wnpos.get(word["pos"][:2]) if use_pos else None)
+    return tokens, indices, candidate_ids
+
+def bucket_batches(lengths, batch_size, max_tokens=None):
+    """Split the docs into batches. If `max_tokens` is None, the batches are consecutive runs of `batch_size` docs.
+    Otherwise, the docs are sorted by length and a batch is filled while its padded size (number of docs times
+    the longest length) is at most `max_tokens` and it has at most `batch_size` docs.
+
+    Docs without tokens are left out of the batches, because a batch of only such docs would be an empty input
+    tensor. `disambiguate_window` gives them empty outputs.
+
+    Returns
+    -------
+    batches : list \\
+        List of lists of doc positions
+    """
+    if max_tokens is None:
+        batches = [[k for k in range(i, min(i + batch_size, len(lengths))) if lengths[k] > 0] for i in \
+            range(0, len(lengths), batch_size)]
+        return [batch for batch in batches if batch]
+
+    batches, batch = [], []
+    for k in np.argsort(lengths, kind="stable").tolist():
+        if lengths[k] == 0:
+            continue
+        if batch and (len(batch) == batch_size or (len(batch) + 1) * lengths[k] > max_tokens):
+            batches.append(batch)
+            batch = []
+        batch.append(k)
+    if batch:
+        batches.append(batch)
+    return batches
+
+def iter_windows(items, window_size):
+    """Yield lists of `window_size` consecutive items. The last list might be shorter.
+    """
+    items = iter(items)
+    while True:
+        window = list(itertools.islice(items, window_size))
+        if not window:
+            break
+        yield window
+
+def prepare_window(items, dictionary, candidates, batch_size, max_tokens=None, pos_variants=(True,)):
+    """Prepare the `(doc, positions)` items for WSD and split them into batches with `bucket_batches`. `positions`
+    are the token positions to disambiguate, or None for all the tokens.
+
+    Returns
+    -------
+    window : tuple \\
+        `(prepared_docs, batches)`. `prepared_docs` is the list of `prepare_doc` outputs, and `batches` is the list of
+        lists of positions in `prepared_docs`
+    """
+    window = [prepare_doc(doc, dictionary, candidates, pos_variants=pos_variants, positions=positions) for doc, \
+        positions in items]
+    return window, bucket_batches([len(tokens) for tokens, _, _ in window], batch_size, max_tokens)
+
+def prepare_windows(items, dictionary, candidates, batch_size, max_tokens=None, window_size=2000, \
+    pos_variants=(True,)):
+    """Prepare the `(doc, positions)` items for WSD in windows of `window_size` items. Yields the `prepare_window`
+    output of each window.
+    """
+    for window in iter_windows(items, window_size):
+        yield prepare_window(window, dictionary, candidates, batch_size, max_tokens=max_tokens, \
+            pos_variants=pos_variants)
+
+def prefetch(iterator, n_prefetch):
+    """Run the iterator in a background thread and yield its items, keeping up to `n_prefetch` items ready.
+    Exceptions of the iterator are raised in the calling thread.
+    """
+    items = queue.Queue(maxsize=n_prefetch)
+    end = object()
+
+    def produce():
+        try:
+            for item in iterator:
+                items.put(item)
+            items.put(end)
+        except BaseException as error:
+            items.put(error)
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    while True:
+        item = items.get()
+        if item is end:
+            break
+        if isinstance(item, BaseException):
+            raise item
+        yield item
+    thread.join()
+
+def disambiguate_batch(model, batch, candidates, pad_index, device, cache=None):
+    """Run the model on a batch of `prepare_doc` outputs and return, for each doc, the tuple of the lists of
+    disambiguated synset names of the POS variants. The synset name is an empty string for tokens without
+    candidates. The logits are found once and shared by the variants.
+
+    If a `LogitCache` is given, the docs whose senses can be found exactly from the cached top-k logits are not
+    run through the model, and the top-k logits of the other docs are saved to the cache.
+    """
+    batch_disambiguated_synsets = [None] * len(batch)
+    n_variants = len(batch[0][2])
+
+    if cache is not None:
+        keys = [cache.key(tokens) for tokens, _, _ in batch]
+        entries = cache.get(keys)
+        for i, (key, (_, _, candidate_ids)) in enumerate(zip(keys, batch)):
+            if key in entries:
+                synsets_lists = tuple(select_cached_synsets(*entries[key], candidate_ids[v], candidates, cache) \
+                    for v in range(n_variants))
+                if all(synsets_list is not None for synsets_list in synsets_lists):
+                    batch_disambiguated_synsets[i] = synsets_lists
+
+    missing = [i for i, synsets_lists in enumerate(batch_disambiguated_synsets) if synsets_lists is None]
+    if not missing:
+        return batch_disambiguated_synsets
+    missing_batch = [batch[i] for i in missing]
+
+    batch_tokens = [tokens for tokens, _, _ in missing_batch]
+    batch_maxlen = max(len(indices) for _, indices, _ in missing_batch)
+    batch_indices = [indices + [pad_index] * (batch_maxlen - len(indices)) for _, indices, _ in missing_batch]
+    batch_indices = torch.LongTensor(batch_indices).to(device)
+
+    with torch.no_grad():
+        logits, _ = model(src_tokens=batch_indices, src_tokens_str=batch_tokens)
+
+    logits = logits.detach().cpu()
+    logits[:,:,0:2] = -1e7
+    if cache is not None:
+        top_logits, top_indices = logits.topk(min(cache.top_k, logits.shape[2]), dim=2)
+        cache.put([keys[i] for i in missing], top_indices.numpy(), top_logits.numpy(), \
+            [len(tokens) for tokens in batch_tokens])
+    logits = logits.numpy()
+
+    for i, synsets_lists in zip(missing, zip(*[select_synsets(logits, [len(tokens) for tokens in batch_tokens], \
+        [example_candidate_ids[v] for _, _, example_candidate_ids in missing_batch], candidates) \
+            for v in range(n_variants)])):
+        batch_disambiguated_synsets[i] = synsets_lists
+    return batch_disambiguated_synsets
+
+def select_cached_synsets(indices, logits, candidate_ids, candidates, cache):
+    """Returns the list of disambiguated synset names of a doc from its cached top-k output `indices` and `logits`,
+    or None if the sense of some token cannot be found exactly from them
+    """
+    disambiguated_synsets = [""] * len(candidate_ids)
+    for j, c in enumerate(candidate_ids.tolist()):
+        if c >= 0 and candidates.offsets[c + 1] > candidates.offsets[c]:
+            start, end = int(candidates.offsets[c]), int(candidates.offsets[c + 1])
+            best = cache.best(indices[j], logits[j], candidates.output_indices[start: end])
+            if best is None:
+                return None
+            disambiguated_synsets[j] = candidates.names[start + best]
+    return disambiguated_synsets
+
+def select_synsets(logits, lengths, batch_candidate_ids, candidates):
+    """Returns the list of disambiguated synset names of each doc of the batch, given the `(n_docs, maxlen,
+    n_outputs)` logits and the candidate table ids of the tokens of each doc.
+
+    The candidate logits of all the tokens of the batch are gathered at once, and the first best candidate of each
+    token is found with segment reductions over the flattened candidates.
+    """
+    # flatten the tokens that have candidates
+    batch_disambiguated_synsets = [[""] * length for length in lengths]
+    candidate_ids = np.concatenate(batch_candidate_ids)
+    rows = np.repeat(np.arange(len(lengths)), lengths)
+    cols = np.concatenate([np.arange(length) for length in lengths])
+    targeted = candidate_ids >= 0
+    rows, cols, candidate_ids = rows[targeted], cols[targeted], candidate_ids[targeted]
+    starts = candidates.offsets[candidate_ids]
+    counts = candidates.offsets[candidate_ids + 1] - starts
+    has_candidates = counts > 0
+    rows, cols, starts, counts = rows[has_candidates], cols[has_candidates], starts[has_candidates], \
+        counts[has_candidates]
+    if not len(counts):
+        return batch_disambiguated_synsets
+
+    # flatten the candidates of the tokens and gather their logits
+    segment_starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    n_candidates = int(counts.sum())
+    positions = np.repeat(starts - segment_starts, counts) + np.arange(n_candidates)
+    values = logits[np.repeat(rows, counts), np.repeat(cols, counts), candidates.output_indices[positions]]
+
+    # find the first candidate with the maximum logit of each token
+    is_max = values == np.repeat(np.maximum.reduceat(values, segment_starts), counts)
+    best = np.minimum.reduceat(np.where(is_max, np.arange(n_candidates), n_candidates), segment_starts)
+    for i, j, k in zip(rows.tolist(), cols.tolist(), positions[best].tolist()):
+        batch_disambiguated_synsets[i][j] = candidates.names[k]
+    return batch_disambiguated_synsets
+
+def disambiguate_window(model, window, batches, candidates, pad_index, device, cache=None):
+    """Disambiguate the batches of a window prepared by `prepare_window`, and return the tuples of synset names of
+    the POS variants of the docs in the window order. The docs without tokens, which are not in the batches, get
+    empty lists.
+    """
+    window_synsets_list = [tuple([] for _ in candidate_ids) for _, _, candidate_ids in window]
+    for batch in batches:
+        for k, synsets_list in zip(batch, disambiguate_batch(model, [window[k] for k in batch], candidates, \
+            pad_index, device, cache=cache)):
+            window_synsets_list[k] = synsets_list
+    return window_synsets_list
+
+# model, dictionary, candidate table and settings of the worker processes, inherited through fork
+wsd_worker = None
+
+def init_wsd_worker(n_threads):
+    torch.set_num_threads(n_threads)
+
+def disambiguate_docs(items):
+    """Prepare and disambiguate a window of `(doc, positions)` items with the model replica of the worker process.
+    Returns the synset names of the docs, and the candidate table entries added by the window, so that the parent
+    can merge them.
+    """
+    model, dictionary, candidates, device, batch_size, max_tokens, pos_variants, cache = wsd_worker
+    n_candidates = len(candidates)
+    window, batches = prepare_window(items, dictionary, candidates, batch_size, max_tokens=max_tokens, \
+        pos_variants=pos_variants)
+    window_synsets_list = disambiguate_window(model, window, batches, candidates, dictionary.pad_index, device, \
+        cache=cache)
+    if cache is not None:
+        # the pool terminates the workers without closing their connections
+        cache.commit()
+    return window_synsets_list, candidates.entries(n_candidates)
+
+def imap_bounded(pool, func, items, n_in_flight):
+    """Like `pool.imap`, but at most `n_in_flight` items are submitted at a time, so the input is not read ahead
+    of the workers
+    """
+    results = deque()
+    for item in items:
+        results.append(pool.apply_async(func, (item,)))
+        if len(results) == n_in_flight:
+            yield results.popleft().get()
+    while results:
+        yield results.popleft().get()
+
+def read_mention_positions(mentions_filepath):
+    """Returns the dictionary of rsi to the sorted token positions of the unigram mentions in the mentions file
+    """
+    mentions_df = read_mentions(mentions_filepath, columns=["rsi", "start", "end"])
+    mentions_df = mentions_df[mentions_df["end"] - mentions_df["start"] == 1]
+    rsi_to_positions = {}
+    for rsi, start in sorted(set(zip(mentions_df["rsi"].tolist(), mentions_df["start"].tolist()))):
+        if rsi not in rsi_to_positions:
+            rsi_to_positions[rsi] = []
+        rsi_to_positions[rsi].append(start)
+    return rsi_to_positions
+
+def find_wsd(processed_filepath, wsd_checkpoint_filepath, wsd_filepath, device, batch_size, use_pos=True, \
+    candidates_filepath=None, n_prefetch=2, max_tokens=None, window_size=2000, n_workers=1, n_threads_per_worker=1, \
+    mentions_filepath=None, nopos_wsd_filepath=None, cache_filepath=None, cache_top_k=16, cache_size=2000000):
+    """Find the WordNet sense of the tokens of the NLP processed docs with the EWISER model, and write one line of
+    synset names per doc to the WSD JSONLINES file.
+
+    The docs are streamed: a background thread reads and prepares windows of `window_size` docs, up to `n_prefetch`
+    windows ahead of the model, and the output of each window is written as soon as it is disambiguated. Memory
+    does not grow with the number of docs.
+
+    If `max_tokens` is given, the docs of a window are batched by length with a padded size of at most `max_tokens`
+    tokens (see `bucket_batches`), and the output is written in the original order. Otherwise the batches are
+    consecutive runs of `batch_size` docs.
+
+    If `n_workers` is greater than 1, the model is loaded once and `n_workers` processes are forked, each with a
+    copy-on-write replica of the model that runs `n_threads_per_worker` intra-op threads. The windows are sent to
+    the workers, at most two per worker at a time, and their outputs are written in the original order. This mode
+    only supports CPU inference: forked processes cannot use the CUDA context of the parent, so an error is raised
+    if `device` is not the CPU.
+
+    If `mentions_filepath` is given, only the tokens of the unigram mentions of the mentions csv file are
+    disambiguated. The model still reads the whole sentence. The output is a csv file with `rsi`, `start` and `sense`
+    columns, one row per unigram mention token, instead of the JSONLINES file. `sense` is empty if the token has no
+    candidate synsets.
+
+    If `nopos_wsd_filepath` is given, the WSD outputs with and without POS are found in the same model pass, and
+    written to `wsd_filepath` and `nopos_wsd_filepath` respectively. `use_pos` is ignored. Only the candidate synsets
+    differ between the two outputs, so the logits of each batch are found once and the best candidate is selected
+    from both candidate sets.
+
+    If `cache_filepath` is given, the top-k logits of the tokens of each sentence are saved in a `LogitCache`, keyed
+    by the token sequence. Sentences that are repeated in the corpus or were scored in an earlier run with the same
+    checkpoint skip the forward pass if their senses can be found exactly from the cached logits. The cache keeps at
+    most `cache_size` sentences.
+    """
+    if n_workers > 1 and torch.device(device).type != "cpu":
+        raise ValueError(f"n_workers = {n_workers} forks the model replicas, which only works on the CPU, but the "
+            f"device is {device}. Use one worker on a CUDA device.")
+
     dictionary = Dictionary.load(DEFAULT_DICTIONARY)
     output_dictionary = ResourceManager.get_offsets_dictionary()
 
-    wnpos = {"NN":"n", "VB":"v", "JJ":"a", "RB":"r"}
     _FakeTask = namedtuple("_FakeTask", ("dictionary", "output_dictionary", "kind"))
     task = _FakeTask(dictionary, output_dictionary, "wsd")
 
@@ -29,91 +422,137 @@ def find_wsd(processed_filepath, wsd_checkpoint_filepath, wsd_filepath, device,
     model.load_state_dict(data["model"])
     model.to(device)
 
-    maxlen = -1
-    docs = []
-    for doc in tqdm(jsonlines.open(processed_filepath), total=3577313):
-        docs.append(doc)
-        maxlen = max(maxlen, len(doc))
-    print(f"{len(docs)} subtitle docs read. maxlen = {maxlen} tokens")
-    indices_list, tokens_list, synsets_list, output_indices_list = [], [], [], []
-    
-    for doc in tqdm(docs, desc="preparing for WSD"):
-        indices = []
-        tokens = []
-        synsets = []
-        output_indices = []
-        
-        for word in doc:
-            tokens.append(word["word"])
-            indices.append(dictionary.index(word["word"]))
-
-            lemma, pos = word["lemma"], word["pos"]
-            pos = wnpos.get(pos[:2])
-            if pos and use_pos:
-                word_synsets = wn.synsets(lemma.lower(), pos)
-            else:
-                word_synsets = wn.synsets(lemma.lower())
-            
-            offsets = [make_offset(synset) for synset in word_synsets]
-            word_output_indices = np.array([output_dictionary.index(offset) for offset in offsets])
-            
-            synsets.append(word_synsets)
-            output_indices.append(word_output_indices)
-        
-        indices_list.append(indices)
-        tokens_list.append(tokens)
-        synsets_list.append(synsets)
-        output_indices_list.append(output_indices)
-
-    n_batches = math.ceil(len(docs)/batch_size)
-    disambiguated_synsets_list = []
-    print(f"processing {n_batches} batches for WSD")
-
-    for i in trange(n_batches, desc="WSD"):
-        batch_tokens, batch_indices, batch_synsets, batch_output_indices = tokens_list[i * batch_size: (i + 1) * batch_size], \
-            indices_list[i * batch_size: (i + 1) * batch_size], synsets_list[i * batch_size: (i + 1) * batch_size], \
-                output_indices_list[i * batch_size: (i + 1) * batch_size]
-
-        batch_maxlen = max(len(x) for x in batch_indices)
-        batch_indices = [indices + [dictionary.pad_index] * (batch_maxlen - len(indices)) for indices in batch_indices]
-        batch_indices = torch.LongTensor(batch_indices).to(device)
-
-        with torch.no_grad():
-            logits, _ = model(src_tokens=batch_indices, src_tokens_str=batch_tokens)
-        
-        logits = logits.detach().cpu()
-        logits[:,:,0:2] = -1e7
-
-        batch_disambiguated_synsets = []
-        for i, (example_synsets, example_output_indices) in enumerate(zip(batch_synsets, batch_output_indices)):
-            example_disambiguated_synsets = []
-            for j, (word_synsets, word_output_indices) in enumerate(zip(example_synsets, example_output_indices)):
-                disambiguated_synset = ""
-
-                if len(word_output_indices):
-                    logits_token = logits[i, j]
-                    logits_synsets = logits_token[word_output_indices]
-                    index = torch.max(logits_synsets, -1).indices.item()
-                    disambiguated_synset = word_synsets[index].name()
-                
-                example_disambiguated_synsets.append(disambiguated_synset)
-            batch_disambiguated_synsets.append(example_disambiguated_synsets)
-        disambiguated_synsets_list.extend(batch_disambiguated_synsets)
-    
-    print("saving output")
-    with jsonlines.open(wsd_filepath, "w") as writer:
-        for synsets_list in tqdm(disambiguated_synsets_list, "writing WSD output"):
-            writer.write(synsets_list)
+    # the candidate table depends on the output dictionary, so it is saved per checkpoint
+    if candidates_filepath is not None and os.path.exists(candidates_filepath):
+        print("loading candidate synsets table")
+        candidates = CandidateTable.load(candidates_filepath, output_dictionary)
+    else:
+        candidates = CandidateTable(output_dictionary)
+
+    if cache_filepath is not None:
+        print("opening logit cache")
+        cache = LogitCache(cache_filepath, file_sha256(wsd_checkpoint_filepath), top_k=cache_top_k, \
+            max_entries=cache_size)
+        print(f"{len(cache)} sentences in the logit cache")
+    else:
+        cache = None
+
+    # find the docs and token positions to disambiguate
+    if mentions_filepath is None:
+        items = ((doc, None) for doc in iter_processed(processed_filepath))
+        # the line index of the JSONLINES file counts the docs without parsing them
+        total = len(TokenStore(processed_filepath)) if os.path.isdir(processed_filepath) else \
+            len(SentenceStore(processed_filepath))
+    else:
+        print("reading mentions")
+        rsi_to_positions = read_mention_positions(mentions_filepath)
+        if os.path.isdir(processed_filepath):
+            store = TokenStore(processed_filepath)
+            items = ((store[rsi], positions) for rsi, positions in rsi_to_positions.items())
+        else:
+            items = ((doc, rsi_to_positions[rsi]) for rsi, doc in enumerate(iter_processed(processed_filepath)) \
+                if rsi in rsi_to_positions)
+        total = len(rsi_to_positions)
+        print(f"{total} subtitle docs with unigram mentions")
+    n_docs = 0
+
+    # one output per POS variant
+    if nopos_wsd_filepath is None:
+        pos_variants, output_filepaths = (use_pos,), [wsd_filepath]
+    else:
+        pos_variants, output_filepaths = (True, False), [wsd_filepath, nopos_wsd_filepath]
+
+    # write one line per doc, or one row per mention token
+    if mentions_filepath is None:
+        output_files = [open(filepath, "w") for filepath in output_filepaths]
+        writers = [jsonlines.Writer(output_file) for output_file in output_files]
+        def write(synsets_lists):
+            for writer, synsets_list in zip(writers, synsets_lists):
+                writer.write(synsets_list)
+    else:
+        output_files = [open(filepath, "w", newline="") for filepath in output_filepaths]
+        writers = [csv.writer(output_file) for output_file in output_files]
+        for writer in writers:
+            writer.writerow(["rsi", "start", "sense"])
+        rsi_positions = iter(rsi_to_positions.items())
+        def write(synsets_lists):
+            rsi, positions = next(rsi_positions)
+            for writer, synsets_list in zip(writers, synsets_lists):
+                for start in positions:
+                    writer.writerow([rsi, start, synsets_list[start]])
+
+    if n_workers > 1:
+        # the workers are forked after the model is loaded, so they share its weights
+        global wsd_worker
+        wsd_worker = (model, dictionary, candidates, device, batch_size, max_tokens, pos_variants, cache)
+        if cache is not None:
+            # the workers open their own connections
+            cache.close()
+        windows = iter_windows(items, window_size)
+
+        with multiprocessing.get_context("fork").Pool(n_workers, initializer=init_wsd_worker, \
+            initargs=(n_threads_per_worker,)) as pool:
+            for window_synsets_list, entries in tqdm(imap_bounded(pool, disambiguate_docs, windows, 2 * n_workers), \
+                total=math.ceil(total/window_size), desc="WSD"):
+                for synsets_lists in window_synsets_list:
+                    write(synsets_lists)
+                n_docs += len(window_synsets_list)
+                candidates.merge(entries)
+        wsd_worker = None
+    else:
+        # the preparation thread only appends to the candidate table, and the candidates of a batch are complete
+        # before the batch is queued, so the model thread can read the table while it grows
+        windows = prefetch(prepare_windows(items, dictionary, candidates, batch_size, max_tokens=max_tokens, \
+            window_size=window_size, pos_variants=pos_variants), n_prefetch)
+
+        for window, batches in tqdm(windows, total=math.ceil(total/window_size), desc="WSD"):
+            for synsets_lists in disambiguate_window(model, window, batches, candidates, dictionary.pad_index, \
+                device, cache=cache):
+                write(synsets_lists)
+            n_docs += len(window)
+    for output_file in output_files:
+        output_file.close()
+    print(f"{n_docs} subtitle docs disambiguated. {len(candidates)} (lemma, pos) candidate synset lists")
+
+    # the processed docs file ends before the last mention doc if it is shorter than the sentences file
+    if mentions_filepath is not None and n_docs != len(rsi_to_positions):
+        raise RuntimeError(f"{len(rsi_to_positions)} subtitle docs have unigram mentions, but only {n_docs} were found "
+            f"in {processed_filepath}. The mention senses in {', '.join(output_filepaths)} are incomplete.")
+
+    if cache is not None:
+        cache.evict()
+        cache.close()
+
+    if candidates_filepath is not None:
+        print("saving candidate synsets table")
+        candidates.save(candidates_filepath)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Find Word Sense", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
     parser.add_argument("--data", default="data/mentions/pos.ner.jsonl", \
-        help="jsonlines filepath containing output of Stanford CoreNLP preprocessing on subtitles")
+        help="jsonlines filepath or token store directory containing output of Stanford CoreNLP preprocessing on subtitles")
     parser.add_argument("--checkpoint", default="data/wsd_models/ewiser.semcor+wngt.pt", \
         help="torch checkpoint filepath of EWISER English model")
     parser.add_argument("--device", default="cpu", help="CUDA device or CPU")
     parser.add_argument("--batch_size", default=20, help="number of subtitles in a batch", type=int)
     parser.add_argument("--out", default="data/mentions/wsd.jsonl", help="jsonlines filepath containing WSD output")
+    parser.add_argument("--max_tokens", default=None, type=int, help="if given, docs are batched by length so \
+        that a padded batch has at most this many tokens and at most batch_size docs")
+    parser.add_argument("--window", default=2000, type=int, help="number of docs read, prepared and batched together")
+    parser.add_argument("--workers", default=1, type=int, help="number of forked model replicas for CPU \
+        inference. It should be 1 on a CUDA device")
+    parser.add_argument("--threads_per_worker", default=1, type=int, help="number of intra-op threads of each \
+        model replica")
+    parser.add_argument("--mentions", default=None, help="mentions csv file. If given, only the tokens of the \
+        unigram mentions are disambiguated, and the output is a csv file of rsi, start and sense")
+    parser.add_argument("--candidates", default=None, help="npz filepath of the candidate synsets table. It is \
+        loaded if it exists and saved after preparation. Use one file per checkpoint")
+    parser.add_argument("--out_nopos", default=None, help="if given, the WSD output without POS is found in the same \
+        model pass and written to this file, and --disable_pos is ignored")
+    parser.add_argument("--cache", default=None, help="sqlite filepath of the cache of the top-k logits of the \
+        sentences. It is cleared if the checkpoint changes")
+    parser.add_argument("--cache_top_k", default=16, type=int, help="number of logits cached per token")
+    parser.add_argument("--cache_size", default=2000000, type=int, help="maximum number of sentences in the cache")
     parser.add_argument("--disable_pos", action="store_true", help="set if you choose not use POS to find wordnet synsets")
 
     args = parser.parse_args()
@@ -123,5 +562,19 @@ if __name__ == "__main__":
     device = args.device
     batch_size = args.batch_size
     use_pos = not args.disable_pos
+    candidates_filepath = args.candidates
+    max_tokens = args.max_tokens
+    window_size = args.window
+    n_workers = args.workers
+    n_threads_per_worker = args.threads_per_worker
+    mentions_filepath = args.mentions
+    nopos_wsd_filepath = args.out_nopos
+    cache_filepath = args.cache
+    cache_top_k = args.cache_top_k
+    cache_size = args.cache_size
 
-    find_wsd(processed_filepath, wsd_checkpoint_filepath, wsd_filepath, device, batch_size, use_pos=use_pos)
\ No newline at end of file
+    find_wsd(processed_filepath, wsd_checkpoint_filepath, wsd_filepath, device, batch_size, use_pos=use_pos, \
+        candidates_filepath=candidates_filepath, max_tokens=max_tokens, window_size=window_size, n_workers=n_workers, \
+            n_threads_per_worker=n_threads_per_worker, mentions_filepath=mentions_filepath, \
+                nopos_wsd_filepath=nopos_wsd_filepath, cache_filepath=cache_filepath, cache_top_k=cache_top_k, \
+                    cache_size=cache_size)
\ No newline at end of file
@@ -1,6 +1,10 @@
 import json
 import argparse
 import pandas as pd
+from multiprocessing import Pool
+import numpy as np
+from tqdm import tqdm
+from sentence_index import SentenceIndex
 from pattern.text.en import singularize
 
 from whoosh.qparser import QueryParser
@@ -18,6 +22,14 @@ class SingularizeFilter(Filter):
             t.text = singularize(t.text)
             yield t
 
+def open_search_index(index, search_index_dir):
+    """Open the `index`-th Whoosh search index of `search_index_dir`. Returns the search index and schema.
+    """
+    custom_analyzer = RegexTokenizer(expression="\w+|[^\w\s]+") | LowercaseFilter() | SingularizeFilter()
+    schema = Schema(imdb_ID=ID(stored=True), sent_ID=ID(stored=True), content=TEXT(analyzer=custom_analyzer))
+    search_index = open_dir(search_index_dir, indexname=f"index{index}", schema=schema)
+    return search_index, schema
+
 def search(index, profession_filepath, key_to_si_filepath, search_index_dir):
     """Search key words (from the profession gazetteer) in subtitle sentences.
 
@@ -58,10 +70,8 @@ def search(index, profession_filepath, key_to_si_filepath, search_index_dir):
 
     # open the Whoosh search index
     print(f"index {index:2d}: opening search index...")
-    custom_analyzer = RegexTokenizer(expression="\w+|[^\w\s]+") | LowercaseFilter() | SingularizeFilter()
-    schema = Schema(imdb_ID=ID(stored=True), sent_ID=ID(stored=True), content=TEXT(analyzer=custom_analyzer))
     # search_index = open_dir("/proj/sbaruah/subtitle/profession/data/search_index/", indexname=f"index{index}", schema=schema)
-    search_index = open_dir(search_index_dir, indexname=f"index{index}", schema=schema)
+    search_index, schema = open_search_index(index, search_index_dir)
 
     engine = search_index.searcher()
     query_parser = QueryParser("content", schema)
@@ -83,12 +93,183 @@ def search(index, profession_filepath, key_to_si_filepath, search_index_dir):
 
     engine.close()
 
+# searchers of the worker process, keyed by search index number
+searchers = {}
+
+def search_keys(task):
+    """Worker of `search_all`. Search the keys in one search index.
+
+    Parameters
+    ----------
+    task : tuple \\
+        `(index, key_ids, keys, search_index_dir)`
+
+    Returns
+    -------
+    hits : tuple \\
+        `(key_ids, imdbs, sents)` aligned lists of the hits
+    """
+    index, key_ids, keys, search_index_dir = task
+    if index not in searchers:
+        search_index, schema = open_search_index(index, search_index_dir)
+        searchers[index] = (search_index.searcher(), QueryParser("content", schema))
+    engine, query_parser = searchers[index]
+
+    hit_key_ids, hit_imdbs, hit_sents = [], [], []
+    for key_id, key in zip(key_ids, keys):
+        query = query_parser.parse(f'"{key}"')
+        for hit in engine.search(query, limit=None):
+            hit_key_ids.append(key_id)
+            hit_imdbs.append(str(hit["imdb_ID"]))
+            hit_sents.append(int(hit["sent_ID"]))
+    return hit_key_ids, hit_imdbs, hit_sents
+
+class PostingBuffer:
+    """Buffer of `(key_id, imdb, sent)` hits. The IMDb ids are interned and the hits of each batch are kept as a
+    deduplicated int32 array, so a hit takes 12 bytes instead of a tuple in a set. The batches are merged once, by
+    `postings`.
+    """
+
+    def __init__(self):
+        self.imdb_to_id = {}
+        self.batches = []
+
+    def add(self, key_ids, imdbs, sents):
+        """Add the hits given as aligned lists of key id, IMDb id (str) and sentence index (int)
+        """
+        if len(key_ids):
+            imdb_ids = [self.imdb_to_id.setdefault(imdb, len(self.imdb_to_id)) for imdb in imdbs]
+            self.batches.append(np.unique(np.array([key_ids, imdb_ids, sents], dtype=np.int32), axis=1))
+
+    def postings(self):
+        """Returns the sorted unique postings as aligned `(key_ids, imdbs, sents)` arrays
+        """
+        imdb_table = np.array(list(self.imdb_to_id), dtype=str)
+        order = np.argsort(imdb_table)
+        hits = np.concatenate(self.batches + [np.zeros((3, 0), dtype=np.int32)], axis=1)
+        self.batches = []
+
+        # rank the interned IMDb ids so that the unique hits are sorted by (key id, imdb, sent)
+        rank = np.empty(len(order), dtype=np.int32)
+        rank[order] = np.arange(len(order))
+        hits[1] = rank[hits[1]]
+        hits = np.unique(hits, axis=1)
+        return hits[0], imdb_table[order][hits[1]], hits[2]
+
+def search_all(n_indices, profession_filepath, key_to_si_filepath, si_to_key_filepath, search_index_dir, n_workers=10, \
+    keys_per_task=100, index_dir=None):
+    """Search the keys of the profession gazetteer in all the search indices in one pass and save the merged
+    key to sentence index and sentence index to key dictionaries. This replaces running `search` once per
+    search index followed by `key_to_si_merge`.
+
+    The (search index, key chunk) tasks are run concurrently by a process pool. The hits of each task are added to
+    a `PostingBuffer` as they arrive, and merged and deduplicated at the end.
+
+    Parameters
+    ----------
+    n_indices : int \\
+        Number of search indices
+
+    profession_filepath : str \\
+        CSV file containing the profession gazetteer
+
+    key_to_si_filepath : str \\
+        JSON filepath to which the merged key to sentence index dictionary is saved.
+        It will be of the form {`key`: List[[`imdb`, `sent`]]}
+
+    si_to_key_filepath : str \\
+        JSON filepath to which the sentence index to key dictionary is saved.
+        It will be of the form {`imdb`: {`sent`: List[`key`]}}
+
+    search_index_dir : str \\
+        The folder path which store the search indices
+
+    n_workers : int \\
+        Number of worker processes
+
+    keys_per_task : int \\
+        Number of keys searched in a task
+
+    index_dir : str \\
+        Directory to which the compact sentence index is saved. If given, it is saved instead of the two
+        JSON dictionaries
+    """
+    from subtitle_index import read_keys
+    keys = read_keys(profession_filepath)
+    tasks = []
+    for index in range(n_indices):
+        for i in range(0, len(keys), keys_per_task):
+            key_ids = list(range(i, min(i + keys_per_task, len(keys))))
+            tasks.append((index, key_ids, keys[i: i + keys_per_task], search_index_dir))
+
+    # search and merge the hits
+    buffer = PostingBuffer()
+    with Pool(n_workers) as pool:
+        for hits in tqdm(pool.imap_unordered(search_keys, tasks), total=len(tasks), desc="searching"):
+            buffer.add(*hits)
+    save_postings(keys, buffer.postings(), key_to_si_filepath, si_to_key_filepath, index_dir=index_dir)
+
+def search_native(subtitle_index_filepath, profession_filepath, key_to_si_filepath, si_to_key_filepath, index_dir=None):
+    """Same as `search_all`, but search the keys in the positional inverted index created by `subtitle_index`
+    instead of the Whoosh search indices.
+
+    Parameters
+    ----------
+    subtitle_index_filepath : str \\
+        NPZ filepath of the subtitle index
+
+    profession_filepath, key_to_si_filepath, si_to_key_filepath, index_dir : \\
+        Same as `search_all`
+    """
+    from subtitle_index import SubtitleIndex, read_keys
+    keys = read_keys(profession_filepath)
+    print("opening subtitle index")
+    subtitle_index = SubtitleIndex(subtitle_index_filepath)
+    buffer = PostingBuffer()
+    buffer.add(*subtitle_index.search(keys))
+    save_postings(keys, buffer.postings(), key_to_si_filepath, si_to_key_filepath, index_dir=index_dir)
+
+def save_postings(keys, postings, key_to_si_filepath, si_to_key_filepath, index_dir=None):
+    """Save the sorted unique postings, given as `(key_ids, imdbs, sents)` aligned arrays, as the key to sentence
+    index and sentence index to key dictionaries, or as the compact sentence index if `index_dir` is given.
+    """
+    key_ids, imdbs, sents = postings
+    print(f"{len(key_ids)} unique (key, sentence) hits")
+
+    if index_dir is not None:
+        print("saving compact sentence index")
+        SentenceIndex.from_postings(keys, key_ids, imdbs, sents).save(index_dir)
+        return
+
+    key_to_si = dict((key, []) for key in keys)
+    si_to_key = {}
+    for key_id, imdb, sent in zip(np.asarray(key_ids).tolist(), np.asarray(imdbs).tolist(), \
+        np.asarray(sents).tolist()):
+        key_to_si[keys[key_id]].append([imdb, sent])
+        if imdb not in si_to_key:
+            si_to_key[imdb] = {}
+        if sent not in si_to_key[imdb]:
+            si_to_key[imdb][sent] = []
+        si_to_key[imdb][sent].append(keys[key_id])
+
+    print("saving dictionaries")
+    json.dump(key_to_si, open(key_to_si_filepath, "w"))
+    json.dump(si_to_key, open(si_to_key_filepath, "w"))
+
 def create_key():
     parser = argparse.ArgumentParser(description="Create key to sentence index dictionary", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
     parser.add_argument("--index", type=int, choices=list(range(10)), help="search index number", default=0, dest="index")
     parser.add_argument("--gzt", type=str, help="CSV filepath of profession gazetteer", default="/proj/sbaruah/subtitle/profession/csl/data/gazetteer/inflection.csv", dest="gzt")
     parser.add_argument("--out", type=str, help="JSON filepath to which the search results are saved", default="/proj/sbaruah/subtitle/profession/csl/data/mentions/key_to_si_0.json", dest="out")
     parser.add_argument("--index_dir", type=str, help="Directory of the search index", default="/proj/sbaruah/subtitle/profession/data/search_index/", dest="dir")
+    parser.add_argument("--all", action="store_true", help="search all the search indices concurrently and save the merged dictionaries, instead of searching one index", dest="all")
+    parser.add_argument("--n_indices", type=int, help="number of search indices, used with --all", default=10, dest="n_indices")
+    parser.add_argument("--workers", type=int, help="number of worker processes, used with --all", default=10, dest="workers")
+    parser.add_argument("--keys_per_task", type=int, help="number of keys searched in a task, used with --all", default=100, dest="keys_per_task")
+    parser.add_argument("--k2s", type=str, help="JSON filepath to which the merged key to sentence dictionary is saved, used with --all", default="/proj/sbaruah/subtitle/profession/csl/data/mentions/key_to_si.json", dest="k2s")
+    parser.add_argument("--s2k", type=str, help="JSON filepath to which the sentence index to key dictionary is saved, used with --all", default="/proj/sbaruah/subtitle/profession/csl/data/mentions/si_to_key.json", dest="s2k")
+    parser.add_argument("--native_index", type=str, help="npz filepath of the subtitle index created by subtitle_index.py. If given, the keys are searched in it instead of the Whoosh search indices, and the merged dictionaries are saved as with --all", default=None, dest="native_index")
+    parser.add_argument("--sentence_index", type=str, help="directory to which the compact sentence index is saved instead of the JSON dictionaries, used with --all", default=None, dest="sentence_index")
 
     args = parser.parse_args()
     index = args.index
@@ -96,7 +277,13 @@ def create_key():
     key_to_si_filepath = args.out
     search_index_dir = args.dir
 
-    search(index, profession_filepath, key_to_si_filepath, search_index_dir)
+    if args.native_index is not None:
+        search_native(args.native_index, profession_filepath, args.k2s, args.s2k, index_dir=args.sentence_index)
+    elif args.all:
+        search_all(args.n_indices, profession_filepath, args.k2s, args.s2k, search_index_dir, n_workers=args.workers, \
+            keys_per_task=args.keys_per_task, index_dir=args.sentence_index)
+    else:
+        search(index, profession_filepath, key_to_si_filepath, search_index_dir)
 
 if __name__ == "__main__":
     create_key()
\ No newline at end of file
@@ -1,7 +1,8 @@
 import json
 import argparse
+from sentence_index import SentenceIndex
 
-def merge_search_outputs(key_to_si_filepaths, merged_key_to_si_filepath, si_to_key_filepath):
+def merge_search_outputs(key_to_si_filepaths, merged_key_to_si_filepath, si_to_key_filepath, index_dir=None):
     """Merge the search results from the 10 different key_to_si json files
 
     Parameters
@@ -21,6 +22,10 @@ def merge_search_outputs(key_to_si_filepaths, merged_key_to_si_filepath, si_to_k
         JSON filepath to which the reverse mapping, sentence index to key, will be
         saved.
         It will be of the form {`imdb`: {`sent`: List[`key`]}}
+
+    index_dir : str
+        Directory to which the compact sentence index will be saved.
+        If given, it is saved instead of the two JSON dictionaries.
     """
 
     # read the list of key to sentence index dictionaries
@@ -53,6 +58,11 @@ def merge_search_outputs(key_to_si_filepaths, merged_key_to_si_filepath, si_to_k
         si_list = list(set(si_list))
         key_to_si[key] = si_list
 
+    if index_dir is not None:
+        print(f"saving compact sentence index")
+        SentenceIndex.from_key_to_si(key_to_si).save(index_dir)
+        return
+
     # create the reverse mapping: sentence index to key
     print(f"creating si_to_key dictionary")
     for key, si_list in key_to_si.items():
@@ -72,14 +82,16 @@ def merge():
     parser = argparse.ArgumentParser(description="Merge key to sentence index dictionaries", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
     parser.add_argument("--files", nargs="+", default=[f"/proj/sbaruah/subtitle/profession/csl/data/mentions/key_to_si_{i}.json" for i in range(10)], dest="files", help="list of JSON key to sentence dictionary files")
     parser.add_argument("--k2s", type=str, default="/proj/sbaruah/subtitle/profession/csl/data/mentions/key_to_si.json", dest="k2s", help="JSON filepath to which the final merged key to sentence dictionary will be saved")
+    parser.add_argument("--index", type=str, default=None, dest="index", help="directory to which the compact sentence index will be saved instead of the JSON dictionaries")
     parser.add_argument("--s2k", type=str, default="/proj/sbaruah/subtitle/profession/csl/data/mentions/si_to_key.json", dest="s2k", help="JSON filepath to which the reverse dictionary, sentence index to key, will be saved")
     
     args = parser.parse_args()
     key_to_si_filepaths = args.files
     merged_key_to_si_filepath = args.k2s
     si_to_key_filepath = args.s2k
+    index_dir = args.index
 
-    merge_search_outputs(key_to_si_filepaths, merged_key_to_si_filepath, si_to_key_filepath)
+    merge_search_outputs(key_to_si_filepaths, merged_key_to_si_filepath, si_to_key_filepath, index_dir=index_dir)
 
 if __name__ == "__main__":
     merge()
\ No newline at end of file
@@ -1,19 +1,19 @@
+import argparse
 import pandas as pd
-from nltk.corpus import wordnet as wn
+from sense_inventory import SenseInventory, read_sense_names
 
-def list_synsets_not_found_in_gazetteer(professions_file, gazetteer_wordnet_file, found_synsets_file, notfound_synsets_file):
+def list_synsets_not_found_in_gazetteer(professions_file, gazetteer_wordnet_file, found_synsets_file, notfound_synsets_file, inventory_file):
     professions = pd.read_csv(professions_file, index_col=None)
+    inventory = SenseInventory.load(inventory_file)
     synsets_set = set()
 
     for profession in professions.profession:
-        synsets = wn.synsets(profession.lower().replace(" ", "_"), pos="n")
+        synsets = inventory.synsets(profession, pos="n")
         for synset in synsets:
-            if synset.lexname() in ["noun.person", "noun.group"]:
+            if inventory.lexname(synset) in ["noun.person", "noun.group"]:
                 synsets_set.add(synset)
     
-    gazetteer_synsets_set = set()
-    for line in open(gazetteer_wordnet_file):
-        gazetteer_synsets_set.add(wn.synset(line.split()[0]))
+    gazetteer_synsets_set = read_sense_names(gazetteer_wordnet_file, inventory)
     
     found_synsets = synsets_set.intersection(gazetteer_synsets_set)
     print(f"{len(found_synsets)} wordnet synsets of mentions present in gazetteer")
@@ -23,11 +23,31 @@ def list_synsets_not_found_in_gazetteer(professions_file, gazetteer_wordnet_file
 
     with open(found_synsets_file, "w") as fw:
         for synset in found_synsets:
-            fw.write(f"{synset.name():30s}\t{synset.definition()}\n")
+            fw.write(f"{synset:30s}\t{inventory.definition(synset)}\n")
 
     with open(notfound_synsets_file, "w") as fw:
         for synset in notfound_synsets:
-            fw.write(f"{synset.name():30s}\t{synset.definition()}\n")
+            fw.write(f"{synset:30s}\t{inventory.definition(synset)}\n")
 
 if __name__ == "__main__":
-    list_synsets_not_found_in_gazetteer("data/mentions/professions.csv", "data/gazetteer/wn.syn.filtered.txt", "data/gazetteer/wn.syn.mention.found.txt", "data/gazetteer/wn.syn.mention.notfound.txt")
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="List the WordNet synsets of the mention professions that are and are \
+        not in the gazetteer", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--professions", default="data/mentions/professions.csv", help="csv file of professions")
+    parser.add_argument("--gazetteer_synsets", default="data/gazetteer/wn.syn.filtered.txt", help="txt file of the \
+        WordNet synsets of the gazetteer")
+    parser.add_argument("--found", default="data/gazetteer/wn.syn.mention.found.txt", help="txt file to which the \
+        synsets found in the gazetteer are written")
+    parser.add_argument("--notfound", default="data/gazetteer/wn.syn.mention.notfound.txt", help="txt file to which \
+        the synsets not found in the gazetteer are written")
+    parser.add_argument("--inventory", default="data/gazetteer/sense_inventory.json", help="json file of the sense \
+        inventory created by sense_inventory.py. Words that are not in it are looked up in WordNet")
+
+    args = parser.parse_args()
+    professions_file = args.professions
+    gazetteer_wordnet_file = args.gazetteer_synsets
+    found_synsets_file = args.found
+    notfound_synsets_file = args.notfound
+    inventory_file = args.inventory
+
+    list_synsets_not_found_in_gazetteer(professions_file, gazetteer_wordnet_file, found_synsets_file, \
+        notfound_synsets_file, inventory_file)
\ No newline at end of file
@@ -1,19 +1,22 @@
 import pandas as pd
-from nltk.corpus import wordnet
 import argparse
 from tqdm import tqdm
+from sense_inventory import SenseInventory
 
-def list_professions(mentions_filepath, professions_filepath):
+def list_professions(mentions_filepath, professions_filepath, inventory_filepath):
     print("reading mentions")
     mentions = pd.read_csv(mentions_filepath, index_col=None)
 
+    print("reading sense inventory")
+    inventory = SenseInventory.load(inventory_filepath)
+
     records = []
 
     print("finding profession in mentions")
     for profession, df in mentions.groupby("profession"):
         n_words = len(profession.split())
-        synsets = wordnet.synsets(profession.lower().replace(" ", "_"))
-        noun_synsets = wordnet.synsets(profession.lower().replace(" ", "_"), pos="n")
+        synsets = inventory.synsets(profession)
+        noun_synsets = inventory.synsets(profession, pos="n")
         n_synsets = len(synsets)
         n_noun_synsets = len(noun_synsets)
         n_mentions = len(df)
@@ -46,9 +49,13 @@ if __name__ == "__main__":
         default="/proj/sbaruah/subtitle/profession/csl/data/mentions/mentions.csv", dest="mentions")
     parser.add_argument("--profession", help="csv file to which professions will be saved", \
         default="/proj/sbaruah/subtitle/profession/csl/data/mentions/professions.csv", dest="profession")
+    parser.add_argument("--inventory", help="json file of the sense inventory created by sense_inventory.py. Words that \
+        are not in it are looked up in WordNet", \
+        default="/proj/sbaruah/subtitle/profession/csl/data/gazetteer/sense_inventory.json", dest="inventory")
 
     args = parser.parse_args()
     mentions_filepath = args.mentions
     professions_filepath = args.profession
+    inventory_filepath = args.inventory
 
-    list_professions(mentions_filepath, professions_filepath)
\ No newline at end of file
+    list_professions(mentions_filepath, professions_filepath, inventory_filepath)
\ No newline at end of file
@@ -3,15 +3,17 @@ import re
 from numpy.core.records import record
 import pandas as pd
 from collections import defaultdict
-from nltk.corpus import wordnet as wn
+from sense_inventory import SenseInventory, read_sense_names
 import json
+import argparse
 
 def list_professions_for_merging_and_mapping(professions_file, senses_file, soc_titles_file, soc_definitions_file, \
-    out_map_file, out_soc_data_file):
+    out_map_file, out_soc_data_file, inventory_file):
     professions_df = pd.read_csv(professions_file, index_col=None)
     soc_professions_df = pd.read_csv(soc_titles_file, index_col=None)
     soc_definitions_df = pd.read_csv(soc_definitions_file, index_col=None)
-    professional_senses = [wn.synset(line.split()[0]) for line in open(senses_file)]
+    inventory = SenseInventory.load(inventory_file)
+    professional_senses = read_sense_names(senses_file, inventory)
 
     professions_df.sort_values("n_mentions", inplace=True, ascending=False)
     media_professions = professions_df.profession.values[:500]
@@ -37,7 +39,7 @@ def list_professions_for_merging_and_mapping(professions_file, senses_file, soc_
 
     print("finding professional senses of media professions")
     for profession in media_professions:
-        senses = set(wn.synsets(profession.replace(" ", "_").lower().strip()))
+        senses = set(inventory.synsets(profession))
         media_profession_sense_data[profession] = senses.intersection(professional_senses)
 
     print("finding soc major code data of media professions")
@@ -60,7 +62,7 @@ def list_professions_for_merging_and_mapping(professions_file, senses_file, soc_
 
             if professional_senses:
                 for sense in professional_senses:
-                    records.append([profession, "", sense.name(), sense.definition(), 1, 1, soc_name])
+                    records.append([profession, "", sense, inventory.definition(sense), 1, 1, soc_name])
             else:
                 records.append([profession, "", "", "", 1, 1, soc_name])
         else:
@@ -76,7 +78,8 @@ def list_professions_for_merging_and_mapping(professions_file, senses_file, soc_
             
             if professional_senses:
                 for sense in professional_senses:
-                    records.append([profession, "", sense.name(), sense.definition(), len(soc_data), fraction, soc_name])
+                    records.append([profession, "", sense, inventory.definition(sense), len(soc_data), fraction, \
+                        soc_name])
             else:
                 records.append([profession, "", "", "", len(soc_data), fraction, soc_name])
 
@@ -86,6 +89,30 @@ def list_professions_for_merging_and_mapping(professions_file, senses_file, soc_
     json.dump(media_profession_soc_data, open(out_soc_data_file, "w"), indent=2)
 
 if __name__ == "__main__":
-    list_professions_for_merging_and_mapping("data/mentions/professions.word_filtered.sense_filtered.csv", \
-        "data/gazetteer/wn.syn.mention.txt", "data/gazetteer/soc.csv", "data/gazetteer/soc.definition.csv", \
-            "data/mentions/professions.soc.map.csv", "data/mentions/professions.soc.data.json")
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="List the top professions and their senses for merging and SOC \
+        mapping", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--professions", default="data/mentions/professions.word_filtered.sense_filtered.csv", \
+        help="csv file of professions")
+    parser.add_argument("--senses", default="data/gazetteer/wn.syn.mention.txt", help="txt file of professional \
+        senses")
+    parser.add_argument("--soc_titles", default="data/gazetteer/soc.csv", help="csv file of SOC titles")
+    parser.add_argument("--soc_definitions", default="data/gazetteer/soc.definition.csv", help="csv file of SOC \
+        definitions")
+    parser.add_argument("--out_map", default="data/mentions/professions.soc.map.csv", help="csv file to which the \
+        profession map is written")
+    parser.add_argument("--out_soc_data", default="data/mentions/professions.soc.data.json", help="json file to which \
+        the SOC data of the professions is written")
+    parser.add_argument("--inventory", default="data/gazetteer/sense_inventory.json", help="json file of the sense \
+        inventory created by sense_inventory.py. Words that are not in it are looked up in WordNet")
+
+    args = parser.parse_args()
+    professions_file = args.professions
+    senses_file = args.senses
+    soc_titles_file = args.soc_titles
+    soc_definitions_file = args.soc_definitions
+    out_map_file = args.out_map
+    out_soc_data_file = args.out_soc_data
+    inventory_file = args.inventory
+
+    list_professions_for_merging_and_mapping(professions_file, senses_file, soc_titles_file, soc_definitions_file, \
+        out_map_file, out_soc_data_file, inventory_file)
\ No newline at end of file
@@ -0,0 +1,188 @@
+import os
+import json
+import sqlite3
+import hashlib
+import numpy as np
+
+def file_sha256(filepath, chunk_size=1 << 24):
+    """Returns the sha256 hex digest of the file
+    """
+    digest = hashlib.sha256()
+    with open(filepath, "rb") as reader:
+        for chunk in iter(lambda: reader.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class LogitCache:
+    """Persistent sqlite cache of the top-k WSD logits of the tokens of a sentence.
+
+    The entries are keyed by the hash of the token sequence of the sentence, so repeated sentences of the subtitle
+    corpus are scored once, and reruns of WSD after the gazetteer or sense inventory changes skip the forward pass.
+    An entry holds the `(n_tokens, top_k)` output indices and logits of the tokens, after the special outputs are
+    masked. The cache is cleared if it was created with a different checkpoint or `top_k`. If it has more than
+    `max_entries` entries, the least recently used entries are evicted.
+
+    The cached best candidate of a token is exact if some candidate is in the top-k outputs of the token with a
+    logit greater than the smallest top-k logit, because every other candidate then has a smaller logit.
+    Otherwise the sentence has to be scored again.
+
+    Each process opens its own sqlite connection, so the cache can be shared by forked workers. The puts are
+    committed every `commit_every` puts and at `close`, so the last uncommitted puts are lost if the process is
+    killed. The number of entries is counted when the connection is opened and then tracked by the process, so it
+    does not include the entries that other processes add in the meantime.
+
+    Parameters
+    ----------
+    filepath : str \\
+        sqlite filepath of the cache
+
+    checkpoint_hash : str \\
+        sha256 hex digest of the model checkpoint file
+
+    top_k : int \\
+        Number of logits saved per token
+
+    max_entries : int \\
+        Maximum number of sentences in the cache
+
+    evict_every : int \\
+        Number of puts between evictions
+
+    commit_every : int \\
+        Number of puts between commits
+    """
+
+    def __init__(self, filepath, checkpoint_hash, top_k=16, max_entries=2000000, evict_every=1000, commit_every=100):
+        self.filepath = filepath
+        self.top_k = top_k
+        self.max_entries = max_entries
+        self.evict_every = evict_every
+        self.commit_every = commit_every
+        self.pid = None
+        self.n_puts = 0
+
+        meta = json.dumps(dict(checkpoint=checkpoint_hash, top_k=top_k))
+        connection = self.connection
+        connection.execute("create table if not exists meta (name text primary key, value text)")
+        connection.execute("create table if not exists logits (key blob primary key, n_tokens integer, indices blob, \
+            logits blob, last_used integer) without rowid")
+        connection.execute("create index if not exists logits_last_used on logits (last_used)")
+        row = connection.execute("select value from meta where name = 'meta'").fetchone()
+        if row is None or row[0] != meta:
+            if row is not None:
+                print("checkpoint or top-k of the logit cache changed, clearing it")
+            connection.execute("delete from logits")
+            connection.execute("insert or replace into meta values ('meta', ?)", (meta,))
+            self.n_entries = 0
+        connection.commit()
+
+    @property
+    def connection(self):
+        if self.pid != os.getpid():
+            self._connection = sqlite3.connect(self.filepath, timeout=600)
+            self._connection.execute("pragma journal_mode = wal")
+            self._connection.execute("pragma synchronous = normal")
+            self.pid = os.getpid()
+            self.clock, self.n_entries = self._connection.execute("select max(last_used), count(*) from logits")\
+                .fetchone() if self._has_logits_table() else (None, 0)
+            self.clock = self.clock or 0
+        return self._connection
+
+    def _has_logits_table(self):
+        return self._connection.execute("select 1 from sqlite_master where name = 'logits'").fetchone() is not None
+
+    def commit(self):
+        """Commit the puts and the usage updates of this process
+        """
+        self.connection.commit()
+
+    def close(self):
+        """Commit and close the connection of this process. It is reopened when the cache is used again.
+        """
+        if self.pid == os.getpid():
+            self._connection.commit()
+            self._connection.close()
+        self.pid = None
+
+    def __len__(self):
+        # the entries are counted when the connection of this process is opened
+        self.connection
+        return self.n_entries
+
+    @staticmethod
+    def key(tokens):
+        """Returns the cache key of the token sequence
+        """
+        return hashlib.blake2b("\n".join(tokens).encode("utf-8"), digest_size=16).digest()
+
+    def get(self, keys):
+        """Returns the dictionary of key to `(indices, logits)` arrays of the cached keys, and marks them as used
+        """
+        connection = self.connection
+        entries = {}
+        for i in range(0, len(keys), 500):
+            chunk = list(set(keys[i: i + 500]))
+            rows = connection.execute(f"select key, n_tokens, indices, logits from logits where key in \
+                ({','.join('?' * len(chunk))})", chunk).fetchall()
+            for key, n_tokens, indices, logits in rows:
+                indices = np.frombuffer(indices, dtype=np.int32)
+                logits = np.frombuffer(logits, dtype=np.float32)
+                entries[key] = (indices.reshape(n_tokens, len(indices) // max(n_tokens, 1)), \
+                    logits.reshape(n_tokens, len(logits) // max(n_tokens, 1)))
+        if entries:
+            self.clock += 1
+            connection.executemany("update logits set last_used = ? where key = ?", \
+                [(self.clock, key) for key in entries])
+        return entries
+
+    def put(self, keys, indices, logits, lengths):
+        """Save the top-k outputs of a batch of sentences. The sentences that are already in the cache, for example
+        because another process put them after they were looked up, are kept as they are.
+
+        Parameters
+        ----------
+        keys : list \\
+            Cache keys of the sentences
+
+        indices, logits : np.ndarray \\
+            `(n_sentences, maxlen, top_k)` int and float arrays of the top-k output indices and logits
+
+        lengths : list \\
+            Number of tokens of the sentences
+        """
+        self.clock += 1
+        rows = [(key, length, indices[i, :length].astype(np.int32).tobytes(), \
+            logits[i, :length].astype(np.float32).tobytes(), self.clock) \
+            for i, (key, length) in enumerate(zip(keys, lengths))]
+        connection = self.connection
+        self.n_entries += connection.executemany("insert or ignore into logits values (?, ?, ?, ?, ?)", rows).rowcount
+        self.n_puts += 1
+        if self.n_puts % self.commit_every == 0:
+            connection.commit()
+        if self.n_puts % self.evict_every == 0:
+            self.evict()
+
+    def evict(self):
+        """Remove the least recently used entries over `max_entries`
+        """
+        n_excess = len(self) - self.max_entries
+        if n_excess > 0:
+            connection = self.connection
+            n_deleted = connection.execute("delete from logits where key in (select key from logits order by \
+                last_used limit ?)", (n_excess,)).rowcount
+            connection.commit()
+            self.n_entries -= n_deleted
+
+    def best(self, indices, logits, output_indices):
+        """Returns the position in `output_indices` of the first candidate with the maximum logit, given the top-k
+        `indices` and `logits` of the token. Returns None if it cannot be found exactly from the top-k outputs.
+        """
+        found = np.flatnonzero(np.isin(output_indices, indices))
+        if not len(found):
+            return None
+        lookup = dict(zip(indices.tolist(), logits.tolist()))
+        values = [lookup[output_indices[k]] for k in found.tolist()]
+        best = max(values)
+        if best <= logits.min() and len(indices) == self.top_k:
+            return None
+        return found[values.index(best)]
@@ -1,7 +1,7 @@
 import pandas as pd
 import numpy as np
-from tqdm import tqdm
 from collections import defaultdict
+from mention_store import read_mentions, write_mentions
 
 soc_names = [
 "Management",
@@ -45,26 +45,16 @@ def map_profession_to_soc(map_file, soc_file, in_mentions_file, in_professions_f
         soc_dict[row.profession].add(row.major_code)
 
     print("reading mentions file")
-    mentions_df = pd.read_csv(in_mentions_file, index_col=None)
+    mentions_df = read_mentions(in_mentions_file)
 
     print("reading professions file")
     professions_df = pd.read_csv(in_professions_file, index_col=None)
 
-    profession_arr = mentions_df.profession.values
-    profession_arr_2 = professions_df.profession.values
-    sense_arr = mentions_df.no_pos_sense.values
-    
-    map_soc_code_arr = np.empty(len(mentions_df), dtype="<U100")
-    map_soc_name_arr = np.empty(len(mentions_df), dtype="<U1000")
-    merge_profession_arr = profession_arr[:]
-    merge_profession_arr_2 = profession_arr_2[:]
-
-    print("mapping and merging")
-    for _, row in tqdm(map_df.iterrows(), total=len(map_df)):
-        profession, profession_merge, sense, primary_soc, secondary_soc = row.profession, row.profession_merge, \
-            row.sense_name, row.primary_soc, row.secondary_soc
-        merge_profession_arr[profession_arr == profession] = profession_merge
-        merge_profession_arr_2[profession_arr_2 == profession] = profession_merge
+    print("finding soc codes and names of the map rows")
+    records = []
+    for i, row in enumerate(map_df.itertuples(index=False)):
+        profession, sense, primary_soc, secondary_soc = row.profession, row.sense_name, row.primary_soc, \
+            row.secondary_soc
         soc_codes = set()
 
         if pd.notna(primary_soc) and primary_soc != "Can't Say" and primary_soc != "General":
@@ -79,22 +69,37 @@ def map_profession_to_soc(map_file, soc_file, in_mentions_file, in_professions_f
         soc_codes = list(soc_codes)
         soc_codes_str = ";".join([str(x) for x in soc_codes])
         soc_names_str = ";".join([soc_names[(x - 11)//2] for x in soc_codes])
+        records.append([i, profession, sense, soc_codes_str, soc_names_str])
+    soc_map_df = pd.DataFrame(records, columns=["map_row", "profession", "no_pos_sense", "soc_code", "soc_name"])
+
+    # a mention takes the soc of the last map row of its profession and no pos sense, or of the last map row of its
+    # profession without sense, whichever comes later in the map file
+    print("mapping")
+    sense_map_df = soc_map_df[soc_map_df.no_pos_sense.notna()].drop_duplicates(["profession", "no_pos_sense"], \
+        keep="last")
+    profession_map_df = soc_map_df[soc_map_df.no_pos_sense.isna()].drop_duplicates("profession", keep="last")\
+        .drop(columns="no_pos_sense")
+    sense_soc_df = mentions_df[["profession", "no_pos_sense"]].merge(sense_map_df, how="left", \
+        on=["profession", "no_pos_sense"])
+    profession_soc_df = mentions_df[["profession"]].merge(profession_map_df, how="left", on="profession")
+    use_sense = (sense_soc_df.map_row.notna() & ~(profession_soc_df.map_row > sense_soc_df.map_row)).values
+    soc_code = np.where(use_sense, sense_soc_df.soc_code.values, profession_soc_df.soc_code.values)
+    soc_name = np.where(use_sense, sense_soc_df.soc_name.values, profession_soc_df.soc_name.values)
 
-        if pd.notna(sense):
-            map_soc_code_arr[(profession_arr == profession) & (sense_arr == sense)] = soc_codes_str
-            map_soc_name_arr[(profession_arr == profession) & (sense_arr == sense)] = soc_names_str
-        else:
-            map_soc_code_arr[profession_arr == profession] = soc_codes_str
-            map_soc_name_arr[profession_arr == profession] = soc_names_str
+    # the last map row of a profession gives its merged profession
+    print("merging")
+    merge_sr = map_df.drop_duplicates("profession", keep="last").set_index("profession").profession_merge
 
     print("saving mentions")
-    mentions_df["profession_merge"] = merge_profession_arr
-    mentions_df["soc_code"] = map_soc_code_arr
-    mentions_df["soc_name"] = map_soc_name_arr
-    mentions_df.to_csv(out_mentions_file, index=False)
+    mentions_df["profession_merge"] = pd.Categorical(mentions_df.profession.map(merge_sr)\
+        .where(mentions_df.profession.isin(merge_sr.index), mentions_df.profession))
+    mentions_df["soc_code"] = pd.Categorical(soc_code)
+    mentions_df["soc_name"] = pd.Categorical(soc_name)
+    write_mentions(mentions_df, out_mentions_file)
 
     print("saving professions")
-    professions_df["profession_merge"] = merge_profession_arr_2
+    professions_df["profession_merge"] = professions_df.profession.map(merge_sr)\
+        .where(professions_df.profession.isin(merge_sr.index), professions_df.profession)
     professions_df.to_csv(out_professions_file, index=False)
 
 if __name__ == "__main__":
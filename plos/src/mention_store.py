@@ -0,0 +1,129 @@
+import operator
+import argparse
+import pandas as pd
+
+# low-cardinality string columns are dictionary encoded in parquet
+categorical_columns = ["profession", "profession_merge", "mention", "pos", "ner", "sense", "no_pos_sense", "soc_code", \
+    "soc_name"]
+
+filter_operators = {"==": operator.eq, "=": operator.eq, "!=": operator.ne, "<": operator.lt, "<=": operator.le, \
+    ">": operator.gt, ">=": operator.ge}
+
+def is_parquet(filepath):
+    """Returns True if the mentions filepath is a parquet file or directory
+    """
+    return filepath.rstrip("/").endswith(".parquet")
+
+def apply_filters(mentions_df, filters):
+    """Returns the mentions that satisfy all the `(column, op, value)` filters. `op` is one of `==`, `!=`, `<`,
+    `<=`, `>`, `>=`, `in` and `not in`. As in parquet, missing values satisfy `not in` but no comparison.
+    """
+    mask = pd.Series(True, index=mentions_df.index)
+    for column, op, value in filters:
+        if op == "in":
+            mask &= mentions_df[column].isin(value)
+        elif op == "not in":
+            mask &= ~mentions_df[column].isin(value)
+        else:
+            mask &= filter_operators[op](mentions_df[column], value) & mentions_df[column].notna()
+    return mentions_df[mask]
+
+def read_mentions(mentions_filepath, columns=None, filters=None, dtype=None, categorical=True):
+    """Read the mentions of a csv file or a parquet file (or directory) written by `write_mentions`.
+
+    Parameters
+    ----------
+    mentions_filepath : str \\
+        csv or parquet filepath of mentions. Parquet filepaths end with `.parquet`
+
+    columns : list \\
+        Columns to read. Default is all the columns. Parquet only reads the column chunks of these columns
+
+    filters : list \\
+        List of `(column, op, value)` filters, such as `[("profession", "in", professions)]`, that the returned
+        mentions satisfy. Parquet pushes them down and skips the row groups that cannot satisfy them. The filter
+        columns do not need to be in `columns`
+
+    dtype : dict \\
+        dtypes of the csv columns, such as `{"soc_code":str}`. Parquet columns are already typed
+
+    categorical : bool \\
+        If True, the `categorical_columns` are returned as categoricals, for csv as well as parquet. Otherwise, they
+        are returned as object columns. Group by categorical columns with `observed=True`
+    """
+    if is_parquet(mentions_filepath):
+        import pyarrow.parquet as pq
+        table = pq.read_table(mentions_filepath, columns=columns, filters=filters if filters else None)
+        mentions_df = table.to_pandas()
+        if not categorical:
+            for column in mentions_df.columns:
+                if isinstance(mentions_df[column].dtype, pd.CategoricalDtype):
+                    mentions_df[column] = mentions_df[column].astype(object)
+        return mentions_df.reset_index(drop=True)
+
+    usecols = None
+    if columns is not None:
+        usecols = list(columns) + [column for column, _, _ in filters or [] if column not in columns]
+    mentions_df = pd.read_csv(mentions_filepath, index_col=None, usecols=usecols, dtype=dtype)
+    if filters:
+        mentions_df = apply_filters(mentions_df, filters)
+        if columns is not None:
+            mentions_df = mentions_df[list(columns)]
+        mentions_df = mentions_df.reset_index(drop=True)
+    elif columns is not None:
+        mentions_df = mentions_df[list(columns)]
+    if categorical:
+        for column in categorical_columns:
+            if column in mentions_df.columns:
+                mentions_df[column] = mentions_df[column].astype("category")
+    return mentions_df
+
+def write_mentions(mentions_df, mentions_filepath, row_group_size=1 << 18):
+    """Write the mentions to a csv or parquet file.
+
+    The parquet file stores the mentions in their input order in row groups of `row_group_size` mentions.
+    `find_mentions` writes the mentions grouped by profession, and the later stages keep their order, so a row group
+    spans few professions and readers that filter by profession skip most row groups. The profession, sense and soc
+    columns are dictionary-encoded categoricals, the left and right context are plain string columns, and the IMDb
+    id is an integer. Empty strings are saved as nulls. Both are as they are when read from csv.
+    """
+    if not is_parquet(mentions_filepath):
+        mentions_df.to_csv(mentions_filepath, index=False)
+        return
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    mentions_df = mentions_df.copy()
+    if "imdb" in mentions_df.columns and not pd.api.types.is_integer_dtype(mentions_df["imdb"]):
+        mentions_df["imdb"] = mentions_df["imdb"].astype(int)
+    for column in mentions_df.columns:
+        if pd.api.types.is_string_dtype(mentions_df[column]):
+            # empty strings are read as missing values from csv, so they are saved as nulls
+            column_values = mentions_df[column]
+            mentions_df[column] = column_values.mask(column_values == "")
+            if column in categorical_columns:
+                mentions_df[column] = mentions_df[column].astype("category")
+    table = pa.Table.from_pandas(mentions_df, preserve_index=False)
+    pq.write_table(table, mentions_filepath, row_group_size=row_group_size)
+
+def convert_mentions(in_mentions_filepath, out_mentions_filepath, dtype=None):
+    """Convert the mentions between csv and parquet
+    """
+    print("reading mentions")
+    mentions_df = read_mentions(in_mentions_filepath, dtype=dtype)
+    print(f"{len(mentions_df)} mentions")
+    print("writing mentions")
+    write_mentions(mentions_df, out_mentions_filepath)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert the mentions file between csv and parquet", \
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--in_mentions", default="data/mentions/mentions.csv", help="csv or parquet mentions file")
+    parser.add_argument("--out_mentions", default="data/mentions/mentions.parquet", help="csv or parquet mentions \
+        file. Parquet filepaths end with .parquet")
+
+    args = parser.parse_args()
+    in_mentions_filepath = args.in_mentions
+    out_mentions_filepath = args.out_mentions
+
+    convert_mentions(in_mentions_filepath, out_mentions_filepath, dtype={"soc_code":str, "soc_name":str})
@@ -1,19 +1,43 @@
+import os
 import json
-import jsonlines
 from tqdm import tqdm
 
-def merge_finegrained_processed(processed_filepaths, merged_filepath):
-    docs = []
-
-    for filepath in tqdm(processed_filepaths, desc="reading docs"):
-        doc = json.load(open(filepath))
-        docs.extend(doc)
+def read_shard_size(processed_filepath):
+    """Returns the number of bytes of the complete docs of the processed JSONLINES shard. Raises an error if its
+    checkpoint does not record that all the docs of its sentence range are processed.
+    """
+    checkpoint_filepath = processed_filepath + ".checkpoint"
+    if not os.path.exists(processed_filepath) or not os.path.exists(checkpoint_filepath):
+        raise RuntimeError(f"{processed_filepath} or its checkpoint does not exist. Run find_ner_pos.py to create it.")
+    checkpoint = json.load(open(checkpoint_filepath))
+    if checkpoint["n_docs"] != checkpoint.get("n_expected_docs"):
+        raise RuntimeError(f"{processed_filepath} is incomplete: {checkpoint['n_docs']} of "
+            f"{checkpoint.get('n_expected_docs', 'unknown')} docs processed. Run find_ner_pos.py again to resume.")
+    return checkpoint["offset"]
 
-    with jsonlines.open(merged_filepath, "w") as writer:
-        for doc in tqdm(docs, desc="writing docs"):
-            writer.write(doc)
+def merge_finegrained_processed(processed_filepaths, merged_filepath):
+    """Concatenate the processed JSONLINES shards into one JSONLINES file by streaming.
+    Only the checkpointed docs of a shard are copied, and the merge fails before writing anything if some shard
+    is incomplete, because the docs of the following shards would get the wrong rsi. Legacy JSON shards, which
+    contain a list of docs, are also accepted.
+    """
+    sizes = [read_shard_size(filepath) if filepath.endswith(".jsonl") else None for filepath in processed_filepaths]
+    with open(merged_filepath, "wb") as writer:
+        for filepath, size in tqdm(zip(processed_filepaths, sizes), total=len(processed_filepaths), \
+            desc="merging docs"):
+            if filepath.endswith(".jsonl"):
+                with open(filepath, "rb") as reader:
+                    while size > 0:
+                        chunk = reader.read(min(size, 1 << 24))
+                        if not chunk:
+                            break
+                        writer.write(chunk)
+                        size -= len(chunk)
+            else:
+                for doc in json.load(open(filepath)):
+                    writer.write((json.dumps(doc) + "\n").encode("utf-8"))
 
 if __name__ == "__main__":
-    processed_filepaths = [f"data/mentions/processed_finegrained_{i}.json" for i in range(10)]
+    processed_filepaths = [f"data/mentions/processed_finegrained_{i}.jsonl" for i in range(10)]
     merged_filepath = "data/mentions/processed_finegrained.jsonl"
-    merge_finegrained_processed(processed_filepaths, merged_filepath)
\ No newline at end of file
+    merge_finegrained_processed(processed_filepaths, merged_filepath)
@@ -3,11 +3,23 @@ from tqdm import tqdm
 import argparse
 import json
 import re
+from mention_store import read_mentions, write_mentions
+
+def character_name_tokens(characters_data):
+    """Returns the dataframe of the unique `(imdb, name_token)` pairs of the lowercased tokens of the character
+    names of each movie
+    """
+    records = set()
+    for imdb, characters in tqdm(characters_data.items(), total=len(characters_data)):
+        for character in characters:
+            for name_token in character.lower().split():
+                records.add((imdb, name_token))
+    return pd.DataFrame(sorted(records), columns=["imdb", "name_token"])
 
 def is_profession(mentions_file, professions_file, professional_senses_file, characters_file, out_mentions_file, \
     out_professions_file):
     print("reading mentions")
-    mentions_df = pd.read_csv(mentions_file, index_col=None)
+    mentions_df = read_mentions(mentions_file)
 
     print("reading professions")
     professions_df = pd.read_csv(professions_file, index_col=None)
@@ -39,19 +51,10 @@ def is_profession(mentions_file, professions_file, professional_senses_file, cha
     print("is_profession, is_nopos_profession = 0 if mention.ner = PERSON and character.name contains \
         mention.mention for some character in the movie")
     mentions_df.imdb = mentions_df.imdb.astype(str).str.zfill(7)
-    imdb_list, mention_list = mentions_df.imdb.values, mentions_df.mention.values
-    is_person_list = []
-    
-    for imdb, mention in tqdm(zip(imdb_list, mention_list), total=len(imdb_list)):
-        is_person = False
-        if imdb in characters_data:
-            for character in characters_data[imdb]:
-                if mention.strip().lower() in character.strip().lower().split():
-                    is_person = True
-                    break
-        is_person_list.append(is_person)
-
-    mentions_df["is_person"] = is_person_list
+    name_tokens_df = character_name_tokens(characters_data)
+    name_tokens_index = pd.MultiIndex.from_frame(name_tokens_df)
+    mention_index = pd.MultiIndex.from_arrays([mentions_df.imdb, mentions_df.mention.str.strip().str.lower()])
+    mentions_df["is_person"] = mention_index.isin(name_tokens_index)
     mentions_df.loc[mentions_df.is_person & (mentions_df.ner == "PERSON"), ["is_profession", "is_nopos_profession"]] = 0
 
     print("is_profession, is_nopos_profession = 0 if mention.ner = ORGANIZATION")
@@ -60,7 +63,7 @@ def is_profession(mentions_file, professions_file, professional_senses_file, cha
     print("updating n_mentions in professions file")
     profession_counts = dict([(profession, 0) for profession in professions_df.profession])
     
-    for profession, df in mentions_df[mentions_df.is_profession == 1].groupby("profession"):
+    for profession, df in mentions_df[mentions_df.is_profession == 1].groupby("profession", observed=True):
         profession_counts[profession] = len(df)
 
     n_mentions_list = [profession_counts[profession] for profession in professions_df.profession]
@@ -84,17 +87,18 @@ def is_profession(mentions_file, professions_file, professional_senses_file, cha
     professions_df.to_csv(out_professions_file, index=False)
 
     print("saving mentions")
-    mentions_df.to_csv(out_mentions_file, index=False)
+    write_mentions(mentions_df, out_mentions_file)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="add is_person and is_profession column", \
         formatter_class=argparse.ArgumentDefaultsHelpFormatter)
     
-    parser.add_argument("--in_mentions", default="data/mentions/mentions.word_filtered.csv", help="mentions file")
+    parser.add_argument("--in_mentions", default="data/mentions/mentions.word_filtered.csv", help="mentions file \
+        (csv or parquet)")
     parser.add_argument("--in_professions", default="data/mentions/professions.word_filtered.csv", help="professions \
         file")
     parser.add_argument("--out_mentions", default="data/mentions/mentions.word_filtered.prediction_added.csv", \
-        help="mentions file containing is_person and is_profession columns")
+        help="mentions file containing is_person and is_profession columns (csv or parquet)")
     parser.add_argument("--out_professions", default="data/mentions/professions.word_filtered.prediction_added.csv", \
         help="professions file containing updated n_mentions")
     parser.add_argument("--professional_senses", default="data/gazetteer/wn.syn.mention.txt", help="contains \
@@ -0,0 +1,227 @@
+import os
+import re
+import json
+import argparse
+import pandas as pd
+from tqdm import tqdm
+
+# WordNet POS tags of the synsets: noun, verb, adjective, adjective satellite and adverb
+wordnet_pos = ["n", "v", "a", "s", "r"]
+
+class SenseInventory:
+    """Persisted table of the WordNet senses of profession words, shared by the gazetteer, listing and filtering
+    scripts so that they do not walk WordNet, or even load it, every time.
+
+    A word is normalized by lowercasing it and replacing whitespace by underscores. For each word the table holds
+    the names of all its synsets and of its synsets of each WordNet POS, in WordNet order. For each synset of a
+    word, and for their hyponyms, it holds the lexname, definition, lemma names and hyponym names. Synset names
+    that are not the canonical name of their synset, such as `doc.n.01` for `doctor.n.01`, are mapped to the
+    canonical name. The canonical names of the professional senses are saved with the table.
+
+    The table is created and extended by `create_sense_inventory`, which is the only writer of the file. Words and
+    synsets that are not in the table are looked up in WordNet when they are first used and added to the table in
+    memory, but the scripts that use the table do not save it.
+
+    Parameters
+    ----------
+    words : dict \\
+        `{word:{"synsets":[name], "pos_synsets":{pos:[name]}}}`
+
+    synsets : dict \\
+        `{name:{"lexname":str, "definition":str, "lemma_names":[str], "hyponyms":[name]}}`
+
+    professional_senses : list \\
+        Names of the professional senses
+
+    aliases : dict \\
+        `{name:canonical_name}` of the synset names that are not canonical
+    """
+
+    def __init__(self, words=None, synsets=None, professional_senses=None, aliases=None):
+        self.words = words if words is not None else {}
+        self.synset_data = synsets if synsets is not None else {}
+        self.professional_senses = set(professional_senses) if professional_senses is not None else set()
+        self.aliases = aliases if aliases is not None else {}
+        self.changed = False
+
+    @classmethod
+    def load(cls, filepath):
+        """Load the table saved in `filepath`. An empty table is returned if the file does not exist.
+        """
+        if not os.path.exists(filepath):
+            return cls()
+        data = json.load(open(filepath))
+        return cls(data["words"], data["synsets"], data["professional_senses"], data.get("aliases", {}))
+
+    def save(self, filepath):
+        """Save the table to `filepath` if it changed since it was loaded
+        """
+        if not self.changed:
+            return
+        data = dict(words=self.words, synsets=self.synset_data, professional_senses=sorted(self.professional_senses), \
+            aliases=self.aliases)
+        # several scripts might save the table at the same time, so write to a temporary file and rename
+        temporary_filepath = f"{filepath}.{os.getpid()}.tmp"
+        json.dump(data, open(temporary_filepath, "w"))
+        os.replace(temporary_filepath, filepath)
+        self.changed = False
+
+    @staticmethod
+    def key(word):
+        """Returns the WordNet lookup key of the word
+        """
+        return re.sub(r"\s+", "_", word.strip().lower())
+
+    def _add_synset(self, synset, with_hyponyms=False):
+        name = synset.name()
+        if name not in self.synset_data:
+            self.synset_data[name] = dict(lexname=synset.lexname(), definition=synset.definition(), \
+                lemma_names=synset.lemma_names(), hyponyms=[hyponym.name() for hyponym in synset.hyponyms()])
+            self.changed = True
+        if with_hyponyms:
+            for hyponym in synset.hyponyms():
+                self._add_synset(hyponym)
+
+    def _add_word(self, key):
+        from nltk.corpus import wordnet as wn
+        synsets = wn.synsets(key)
+        for synset in synsets:
+            self._add_synset(synset, with_hyponyms=True)
+        self.words[key] = dict(synsets=[synset.name() for synset in synsets], \
+            pos_synsets=dict((pos, [synset.name() for synset in wn.synsets(key, pos=pos)]) for pos in wordnet_pos))
+        self.changed = True
+
+    def add_words(self, words):
+        """Add the words that are not in the table
+        """
+        for word in tqdm(words, desc="finding senses"):
+            key = self.key(word)
+            if key not in self.words or "pos_synsets" not in self.words[key]:
+                self._add_word(key)
+
+    def synsets(self, word, pos=None):
+        """Returns the synset names of the word. If `pos` is one of the WordNet POS tags `n`, `v`, `a`, `s` and `r`,
+        only the synsets that WordNet finds for the word with that POS are returned.
+        """
+        if pos is not None and pos not in wordnet_pos:
+            raise ValueError(f"unsupported WordNet POS {pos!r}, it should be one of {wordnet_pos} or None")
+        key = self.key(word)
+        # words saved by earlier versions of the table do not have the synsets per POS
+        if key not in self.words or "pos_synsets" not in self.words[key]:
+            self._add_word(key)
+        if pos is None:
+            return list(self.words[key]["synsets"])
+        return list(self.words[key]["pos_synsets"][pos])
+
+    def canonical_name(self, name):
+        """Returns the canonical name of the synset that `name` refers to, as `wn.synset(name).name()` does
+        """
+        if name in self.aliases:
+            return self.aliases[name]
+        if name not in self.synset_data:
+            from nltk.corpus import wordnet as wn
+            synset = wn.synset(name)
+            self._add_synset(synset)
+            if name != synset.name():
+                self.aliases[name] = synset.name()
+                self.changed = True
+            return synset.name()
+        return name
+
+    def synset(self, name):
+        """Returns the dictionary of the lexname, definition, lemma names and hyponym names of the synset
+        """
+        return self.synset_data[self.canonical_name(name)]
+
+    def lexname(self, name):
+        return self.synset(name)["lexname"]
+
+    def definition(self, name):
+        return self.synset(name)["definition"]
+
+    def lemma_names(self, name):
+        return list(self.synset(name)["lemma_names"])
+
+    def hyponyms(self, name):
+        return list(self.synset(name)["hyponyms"])
+
+    def professional_synsets(self, word, professional_senses=None):
+        """Returns the names of the synsets of the word that are professional senses. If `professional_senses` is
+        given, it is used instead of the professional senses saved with the table.
+        """
+        if professional_senses is None:
+            professional_senses = self.professional_senses
+        return [name for name in self.synsets(word) if name in professional_senses]
+
+def read_sense_names(senses_filepath, inventory=None):
+    """Returns the set of synset names of a senses file, whose lines start with a synset name. If a `SenseInventory`
+    is given, the names are normalized to the canonical synset names, so that they match the synset names of words.
+    """
+    names = set(line.split()[0] for line in open(senses_filepath) if line.strip())
+    if inventory is not None:
+        names = set(inventory.canonical_name(name) for name in names)
+    return names
+
+def create_sense_inventory(word_filepaths, professional_senses_filepath, inventory_filepath, synset_filepaths=None):
+    """Create or extend the sense inventory with the words and synsets of the given files.
+
+    Parameters
+    ----------
+    word_filepaths : list \\
+        TXT filepaths with one word per line, or CSV filepaths with a `profession` or `word` column. Files that do not
+        exist yet, such as the gazetteer before it is created, are skipped
+
+    synset_filepaths : list \\
+        TXT filepaths whose lines start with a synset name, such as the filtered WordNet synsets of the gazetteer
+
+    professional_senses_filepath : str \\
+        TXT filepath of the professional senses, whose lines start with a synset name
+
+    inventory_filepath : str \\
+        JSON filepath of the sense inventory
+    """
+    inventory = SenseInventory.load(inventory_filepath)
+
+    words = set()
+    for filepath in word_filepaths:
+        if not os.path.exists(filepath):
+            print(f"{filepath} does not exist, skipping it")
+        elif filepath.endswith(".csv"):
+            df = pd.read_csv(filepath, index_col=None)
+            column = "profession" if "profession" in df.columns else "word"
+            words.update(df[column].dropna().astype(str))
+        else:
+            words.update(line.strip() for line in open(filepath) if line.strip())
+    print(f"{len(words)} words")
+
+    inventory.add_words(sorted(words))
+    for filepath in synset_filepaths or []:
+        read_sense_names(filepath, inventory)
+    professional_senses = read_sense_names(professional_senses_filepath, inventory)
+    if professional_senses != inventory.professional_senses:
+        inventory.professional_senses = professional_senses
+        inventory.changed = True
+    print(f"{len(inventory.words)} words, {len(inventory.synset_data)} synsets, "
+        f"{len(inventory.professional_senses)} professional senses in the sense inventory")
+    inventory.save(inventory_filepath)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create the WordNet sense inventory of profession words", \
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--words", nargs="+", default=["data/gazetteer/soc.txt", "data/gazetteer/bseg.filtered.txt", \
+        "data/gazetteer/final.txt", "data/mentions/professions.csv"], help="txt files of words or csv files with \
+        profession or word column. Files that do not exist are skipped")
+    parser.add_argument("--synsets", nargs="*", default=["data/gazetteer/wn.syn.filtered.txt"], help="txt files whose \
+        lines start with a synset name")
+    parser.add_argument("--professional_senses", default="data/gazetteer/wn.syn.mention.txt", help="file containing \
+        professional senses")
+    parser.add_argument("--inventory", default="data/gazetteer/sense_inventory.json", help="json file of the sense \
+        inventory")
+
+    args = parser.parse_args()
+    word_filepaths = args.words
+    synset_filepaths = args.synsets
+    professional_senses_filepath = args.professional_senses
+    inventory_filepath = args.inventory
+
+    create_sense_inventory(word_filepaths, professional_senses_filepath, inventory_filepath, synset_filepaths)
@@ -0,0 +1,290 @@
+import os
+import json
+import numpy as np
+
+class SentenceIndex:
+    """Compact integer-array replacement of the key_to_si, si_to_key, si_to_rsi and rsi_to_si dictionaries.
+
+    A file sentence index (si) is an `(imdb, sent)` pair. The IMDb ids are interned in the sorted `imdbs` table,
+    and the unique si are stored as sorted `(si_imdb, si_sent)` int32 arrays, so si -> position lookups are
+    vectorized binary searches. The other mappings are arrays aligned to the si table or CSR postings over it.
+
+    Attributes
+    ----------
+    imdbs : np.ndarray \\
+        Sorted IMDb ids (str)
+
+    keys : list \\
+        Keys of the profession gazetteer
+
+    si_imdb, si_sent : np.ndarray \\
+        int32 arrays of the IMDb id index and the sentence index of the unique si, sorted by `(si_imdb, si_sent)`
+
+    si_rsi : np.ndarray \\
+        int32 array of the flattened sentence index (rsi) of each si. It is -1 if the rsi is not assigned yet
+
+    key_offsets, key_postings : np.ndarray \\
+        CSR postings of key -> si positions. The si positions of `keys[k]` are
+        `key_postings[key_offsets[k]: key_offsets[k + 1]]`
+
+    si_key_offsets, si_key_postings : np.ndarray \\
+        CSR postings of si position -> key ids
+
+    rsi_offsets, rsi_postings : np.ndarray \\
+        CSR postings of rsi -> si positions
+    """
+
+    arrays = ["si_imdb", "si_sent", "si_rsi", "key_offsets", "key_postings", "si_key_offsets", "si_key_postings", \
+        "rsi_offsets", "rsi_postings"]
+
+    def __init__(self, imdbs, keys, **arrays):
+        self.imdbs = np.array(imdbs, dtype=str)
+        self.keys = list(keys)
+        self.key_to_id = dict((key, k) for k, key in enumerate(self.keys))
+        for name in self.arrays:
+            setattr(self, name, arrays[name])
+        self.si_code = (self.si_imdb.astype(np.int64) << 32) | self.si_sent.astype(np.int64)
+
+    @classmethod
+    def from_postings(cls, keys, key_ids, imdbs, sents):
+        """Create the index from key -> si postings.
+
+        Parameters
+        ----------
+        keys : list \\
+            Keys of the profession gazetteer
+
+        key_ids, imdbs, sents : list \\
+            Postings as aligned lists of key id (index into `keys`), IMDb id (str) and sentence index (int).
+            Duplicate postings are removed.
+        """
+        imdb_table = np.array(sorted(set(imdbs)), dtype=str)
+        imdb_idx = np.searchsorted(imdb_table, np.array(imdbs, dtype=str)).astype(np.int64)
+        codes = (imdb_idx << 32) | np.array(sents, dtype=np.int64)
+        si_code, si = np.unique(codes, return_inverse=True)
+        return cls._from_codes(imdb_table, keys, si_code, np.full(len(si_code), -1, dtype=np.int32), \
+            np.array(key_ids, dtype=np.int64), si.reshape(-1))
+
+    @classmethod
+    def _from_codes(cls, imdb_table, keys, si_code, si_rsi, posting_key, posting_si):
+        """Create the index from the sorted unique si codes `(imdb index << 32) | sent`, their rsi, and the
+        key -> si postings as aligned arrays of key id and si position. Duplicate postings are removed.
+        """
+        n_si = len(si_code)
+
+        # dedupe the postings and sort them by key
+        postings = np.unique(posting_key.astype(np.int64) * n_si + posting_si)
+        posting_key, posting_si = postings // n_si, postings % n_si
+
+        arrays = dict(si_imdb=(si_code >> 32).astype(np.int32), si_sent=(si_code & 0xffffffff).astype(np.int32), \
+            si_rsi=np.asarray(si_rsi, dtype=np.int32))
+        arrays["key_offsets"] = np.searchsorted(posting_key, np.arange(len(keys) + 1)).astype(np.int64)
+        arrays["key_postings"] = posting_si.astype(np.int32)
+
+        order = np.lexsort((posting_key, posting_si))
+        arrays["si_key_offsets"] = np.concatenate([[0], np.cumsum(np.bincount(posting_si, minlength=n_si))])\
+            .astype(np.int64)
+        arrays["si_key_postings"] = posting_key[order].astype(np.int32)
+        arrays["rsi_offsets"] = np.zeros(1, dtype=np.int64)
+        arrays["rsi_postings"] = np.zeros(0, dtype=np.int32)
+        return cls(imdb_table, keys, **arrays)
+
+    @classmethod
+    def from_key_to_si(cls, key_to_si):
+        """Create the index from the key to file sentence index dictionary of the form `{key:[[imdb, sent]]}`
+        """
+        keys = list(key_to_si.keys())
+        key_ids, imdbs, sents = [], [], []
+        for k, key in enumerate(keys):
+            for imdb, sent in key_to_si[key]:
+                key_ids.append(k)
+                imdbs.append(str(imdb))
+                sents.append(int(sent))
+        return cls.from_postings(keys, key_ids, imdbs, sents)
+
+    @classmethod
+    def load(cls, index_dir):
+        """Load the index saved in `index_dir`. The arrays are memory-mapped.
+        """
+        imdbs = json.load(open(os.path.join(index_dir, "imdbs.json")))
+        keys = json.load(open(os.path.join(index_dir, "keys.json")))
+        arrays = dict((name, np.load(os.path.join(index_dir, f"{name}.npy"), mmap_mode="r")) for name in cls.arrays)
+        return cls(imdbs, keys, **arrays)
+
+    def save(self, index_dir):
+        os.makedirs(index_dir, exist_ok=True)
+        json.dump(self.imdbs.tolist(), open(os.path.join(index_dir, "imdbs.json"), "w"))
+        json.dump(self.keys, open(os.path.join(index_dir, "keys.json"), "w"))
+        for name in self.arrays:
+            # the arrays might be memory-mapped from the same files, so write to a temporary file and rename
+            filepath = os.path.join(index_dir, f"{name}.npy")
+            np.save(f"{filepath}.tmp.npy", np.asarray(getattr(self, name)))
+            os.replace(f"{filepath}.tmp.npy", filepath)
+
+    def replace(self, imdbs, index):
+        """Returns a new index in which the si of the IMDb ids are replaced by the si of another index. The si, their
+        rsi and their key postings are spliced with vectorized array operations, so the existing postings are not
+        decoded. The rsi -> si postings are not created; call `set_rsi`.
+
+        Parameters
+        ----------
+        imdbs : list \\
+            IMDb ids (str) whose si are removed
+
+        index : SentenceIndex \\
+            Index of the si that are added. Its keys are merged into the keys of this index
+        """
+        keys = list(self.keys) + [key for key in index.keys if key not in self.key_to_id]
+        key_to_id = dict((key, k) for k, key in enumerate(keys))
+        key_map = np.array([key_to_id[key] for key in index.keys], dtype=np.int64)
+        keep = ~np.isin(self.imdbs[self.si_imdb], np.array(list(imdbs), dtype=str))
+        imdb_table = np.union1d(self.imdbs[np.unique(self.si_imdb[keep])], index.imdbs).astype(str)
+
+        # si codes of the kept and added si, re-keyed to the merged IMDb id table
+        codes = np.concatenate([
+            (np.searchsorted(imdb_table, self.imdbs).astype(np.int64)[self.si_imdb[keep]] << 32) | \
+                self.si_sent[keep].astype(np.int64),
+            (np.searchsorted(imdb_table, index.imdbs).astype(np.int64)[index.si_imdb] << 32) | \
+                index.si_sent.astype(np.int64)])
+        order = np.argsort(codes, kind="stable")
+        si_code = codes[order]
+        assert np.all(np.diff(si_code) > 0), "the added si should not be in the kept si"
+        si_rsi = np.concatenate([self.si_rsi[keep], index.si_rsi])[order]
+
+        # si position in the merged table of the kept si and the added si
+        new_position = np.empty(len(order), dtype=np.int64)
+        new_position[order] = np.arange(len(order))
+        old_position = np.full(len(self.si_imdb), -1, dtype=np.int64)
+        n_kept = int(keep.sum())
+        old_position[keep] = new_position[:n_kept]
+        added_position = new_position[n_kept:]
+
+        old_key = np.repeat(np.arange(len(self.keys)), np.diff(self.key_offsets))
+        old_si = old_position[self.key_postings]
+        added_key = key_map[np.repeat(np.arange(len(index.keys)), np.diff(index.key_offsets))]
+        added_si = added_position[index.key_postings]
+        posting_key = np.concatenate([old_key[old_si >= 0], added_key])
+        posting_si = np.concatenate([old_si[old_si >= 0], added_si])
+        return self._from_codes(imdb_table, keys, si_code, si_rsi, posting_key, posting_si)
+
+    def set_rsi(self, si_rsi, n_rsi=None):
+        """Assign the flattened sentence index of each si and create the rsi -> si postings.
+
+        Parameters
+        ----------
+        si_rsi : np.ndarray \\
+            int array of rsi aligned to the si table
+
+        n_rsi : int \\
+            Number of flattened sentences. Default is `max(si_rsi) + 1`. An rsi that is not assigned to any si
+            has no si
+        """
+        self.si_rsi = np.asarray(si_rsi, dtype=np.int32)
+        if n_rsi is None:
+            n_rsi = int(self.si_rsi.max()) + 1 if len(self.si_rsi) else 0
+        self.rsi_postings = np.argsort(self.si_rsi, kind="stable").astype(np.int32)
+        self.rsi_offsets = np.concatenate([[0], np.cumsum(np.bincount(self.si_rsi, minlength=n_rsi))])\
+            .astype(np.int64)
+
+    def __len__(self):
+        """Returns the number of flattened sentences (rsi)
+        """
+        return len(self.rsi_offsets) - 1
+
+    def find(self, imdbs, sents):
+        """Vectorized lookup of si positions. Returns -1 for si that are not in the index.
+
+        Parameters
+        ----------
+        imdbs : list or np.ndarray \\
+            IMDb ids (str)
+
+        sents : list or np.ndarray \\
+            Sentence indices (int)
+        """
+        imdbs = np.array(imdbs, dtype=str).reshape(-1)
+        sents = np.array(sents, dtype=np.int64).reshape(-1)
+        imdb_idx = np.searchsorted(self.imdbs, imdbs)
+        found = imdb_idx < len(self.imdbs)
+        found[found] = self.imdbs[imdb_idx[found]] == imdbs[found]
+        codes = (imdb_idx.astype(np.int64) << 32) | sents
+        positions = np.searchsorted(self.si_code, codes)
+        found &= positions < len(self.si_code)
+        found[found] = self.si_code[positions[found]] == codes[found]
+        return np.where(found, positions, -1)
+
+    def si_to_rsi(self, imdbs, sents):
+        """Vectorized si -> rsi lookup. Returns -1 for si that are not in the index.
+        """
+        positions = self.find(imdbs, sents)
+        return np.where(positions >= 0, self.si_rsi[positions], -1)
+
+    def postings(self):
+        """Returns the key -> si postings as aligned `(key_ids, imdbs, sents)` lists
+        """
+        key_ids = np.repeat(np.arange(len(self.keys)), np.diff(self.key_offsets)).tolist()
+        imdbs, sents = zip(*self._si(self.key_postings)) if len(self.key_postings) else ([], [])
+        return key_ids, list(imdbs), list(sents)
+
+    def _si(self, positions):
+        return [(str(self.imdbs[self.si_imdb[p]]), int(self.si_sent[p])) for p in positions]
+
+    def key_si(self, key):
+        """Returns the list of `(imdb, sent, rsi)` of the key
+        """
+        if key not in self.key_to_id:
+            return []
+        k = self.key_to_id[key]
+        positions = self.key_postings[self.key_offsets[k]: self.key_offsets[k + 1]]
+        return [(imdb, sent, int(rsi)) for (imdb, sent), rsi in zip(self._si(positions), self.si_rsi[positions])]
+
+    def rsi_si(self, rsi):
+        """Returns the list of `(imdb, sent)` of the rsi
+        """
+        return self._si(self.rsi_postings[self.rsi_offsets[rsi]: self.rsi_offsets[rsi + 1]])
+
+    def rsi_si_keys(self, rsi):
+        """Returns the list of `(imdb, sent, keys)` of the rsi
+        """
+        records = []
+        for p in self.rsi_postings[self.rsi_offsets[rsi]: self.rsi_offsets[rsi + 1]]:
+            keys = [self.keys[k] for k in self.si_key_postings[self.si_key_offsets[p]: self.si_key_offsets[p + 1]]]
+            records.append((str(self.imdbs[self.si_imdb[p]]), int(self.si_sent[p]), keys))
+        return records
+
+class DictSentenceIndex:
+    """Same lookup API as `SentenceIndex` over the JSON dictionaries. Only the dictionaries required by the
+    lookups that are used need to be given.
+
+    Parameters
+    ----------
+    key_to_si : dict \\
+        `{key:[[imdb, sent]]}`, used by `key_si`
+
+    si_to_rsi : dict \\
+        `{imdb:{sent:rsi}}`, used by `key_si`
+
+    rsi_to_si : dict \\
+        `{rsi:[[imdb, sent]]}`, used by `rsi_si` and `rsi_si_keys`
+
+    si_to_key : dict \\
+        `{imdb:{sent:[key]}}`, used by `rsi_si_keys`
+    """
+
+    def __init__(self, key_to_si=None, si_to_rsi=None, rsi_to_si=None, si_to_key=None):
+        self.key_to_si = key_to_si
+        self.si_to_rsi = si_to_rsi
+        self.rsi_to_si = rsi_to_si
+        self.si_to_key = si_to_key
+
+    def __len__(self):
+        return len(self.rsi_to_si)
+
+    def key_si(self, key):
+        return [(imdb, sent, self.si_to_rsi[imdb][str(sent)]) for imdb, sent in self.key_to_si[key]]
+
+    def rsi_si(self, rsi):
+        return [(imdb, sent) for imdb, sent in self.rsi_to_si[str(rsi)]]
+
+    def rsi_si_keys(self, rsi):
+        return [(imdb, sent, self.si_to_key.get(imdb, {}).get(str(sent), [])) for imdb, sent in self.rsi_si(rsi)]
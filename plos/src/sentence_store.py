@@ -0,0 +1,116 @@
+import os
+import mmap
+import numpy as np
+import argparse
+
+def create_line_index(filepath, index_filepath=None, chunk_size=1 << 26):
+    """Find the byte offsets of the lines of a text file and save them as a uint64 numpy array.
+    The array has `n_lines + 1` elements; line `i` spans the bytes `offsets[i]` to `offsets[i + 1]`,
+    including its trailing newline.
+
+    Parameters
+    ----------
+    filepath : str \\
+        TEXT filepath whose lines are separated by `\\n`
+
+    index_filepath : str \\
+        NPY filepath to which the offsets are saved. Default is `filepath + ".idx.npy"`
+
+    chunk_size : int \\
+        Number of bytes scanned at a time
+    """
+    if index_filepath is None:
+        index_filepath = filepath + ".idx.npy"
+
+    offsets = [np.zeros(1, dtype=np.uint64)]
+    size = os.path.getsize(filepath)
+
+    with open(filepath, "rb") as reader:
+        position = 0
+        while True:
+            chunk = reader.read(chunk_size)
+            if not chunk:
+                break
+            newlines = np.flatnonzero(np.frombuffer(chunk, dtype=np.uint8) == 10)
+            offsets.append((newlines + position + 1).astype(np.uint64))
+            position += len(chunk)
+
+    offsets = np.concatenate(offsets)
+    if offsets[-1] != size:
+        offsets = np.append(offsets, np.uint64(size))
+
+    # several batch jobs might create the index at the same time, so write to a temporary file and rename
+    temporary_filepath = f"{index_filepath}.{os.getpid()}.npy"
+    np.save(temporary_filepath, offsets)
+    os.replace(temporary_filepath, index_filepath)
+
+class SentenceStore:
+    """Random-access view of the lines of a text file, such as the subtitle sentences file.
+
+    The file is memory-mapped and a sidecar line offset index is used to fetch the sentence
+    of any flattened sentence index `rsi`, or of a contiguous rsi range, in O(1), without reading
+    the whole file into a list of strings. The index is created if it does not exist or is older
+    than the file.
+
+    Parameters
+    ----------
+    sentences_filepath : str \\
+        TEXT filepath containing one sentence per line
+
+    index_filepath : str \\
+        NPY filepath of the line offset index. Default is `sentences_filepath + ".idx.npy"`
+    """
+
+    def __init__(self, sentences_filepath, index_filepath=None):
+        if index_filepath is None:
+            index_filepath = sentences_filepath + ".idx.npy"
+        if not os.path.exists(index_filepath) or os.path.getmtime(index_filepath) < os.path.getmtime(sentences_filepath):
+            create_line_index(sentences_filepath, index_filepath)
+
+        # the file might have been appended to within the same modification time
+        self.offsets = np.load(index_filepath, mmap_mode="r")
+        if int(self.offsets[-1]) != os.path.getsize(sentences_filepath):
+            create_line_index(sentences_filepath, index_filepath)
+            self.offsets = np.load(index_filepath, mmap_mode="r")
+        self.file = open(sentences_filepath, "rb")
+        if os.path.getsize(sentences_filepath):
+            self.text = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self.text = b""
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, rsi):
+        if rsi < 0:
+            rsi += len(self)
+        if not 0 <= rsi < len(self):
+            raise IndexError("sentence index out of range")
+        line = self.text[int(self.offsets[rsi]): int(self.offsets[rsi + 1])]
+        return line.decode("utf-8").rstrip("\n")
+
+    def range(self, start, end):
+        """Returns the list of sentences from `start` (inclusive) to `end` (exclusive)
+        """
+        start, end = max(0, start), min(len(self), end)
+        if start >= end:
+            return []
+        text = self.text[int(self.offsets[start]): int(self.offsets[end])].decode("utf-8")
+        if text.endswith("\n"):
+            text = text[:-1]
+        return text.split("\n")
+
+    def __iter__(self):
+        for rsi in range(len(self)):
+            yield self[rsi]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create the line offset index of the subtitle sentences file", \
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--sent", type=str, help="txt file of subtitle sentences", \
+        default="/proj/sbaruah/subtitle/profession/csl/data/mentions/sentences.txt", dest="sent")
+
+    args = parser.parse_args()
+    sentences_filepath = args.sent
+
+    create_line_index(sentences_filepath)
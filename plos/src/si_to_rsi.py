@@ -1,9 +1,163 @@
 import os
 import json
+import hashlib
+import itertools
+from collections import deque
+from multiprocessing import Pool
 from tqdm import tqdm
 import argparse
+import numpy as np
+from sentence_index import SentenceIndex
 
-def find_sentences(key_to_si_filepath, subtitle_directory, sentences_filepath, si_to_rsi_filepath, rsi_to_si_filepath):
+def hash_sentence(sentence):
+    """Returns the 16-byte blake2b digest of the sentence, used as its dedup key
+    """
+    return hashlib.blake2b(sentence.encode("utf-8"), digest_size=16).digest()
+
+def extract_sentences(task):
+    """Read the subtitle file and return the `(sentence, hash)` pairs of the file sentence indices.
+    Run by the pool workers.
+    """
+    filepath, fsi_list = task
+    text = open(filepath).read().strip().split("\n")
+    return [(text[fsi], hash_sentence(text[fsi])) for fsi in fsi_list]
+
+def extract_chunk_sentences(chunk):
+    """Run `extract_sentences` on a chunk of tasks. Run by the pool workers.
+    """
+    return [extract_sentences(task) for task in chunk]
+
+def iter_file_sentences(imdb_fsi_lists, subtitle_directory, n_workers=1, window=256, chunk_size=16):
+    """Iterate over the `(sentence, hash)` pairs of the file sentence indices of each IMDb id, in the order of
+    `imdb_fsi_lists`.
+
+    Parameters
+    ----------
+    imdb_fsi_lists : iterable \\
+        Iterable of `(imdb, fsi_list)` tuples
+
+    subtitle_directory : str \\
+        Directory containing the subtitle text files
+
+    n_workers : int \\
+        Number of worker processes. If 1, the files are read in the main process
+
+    window : int \\
+        Maximum number of files in flight per worker. The files are submitted to the workers in chunks of
+        `chunk_size` files, and a chunk is only submitted when the oldest chunk in flight is yielded
+
+    chunk_size : int \\
+        Number of files sent to a worker at a time
+
+    Yields
+    ------
+    item : tuple \\
+        `(imdb, fsi_list, sentence_hashes)`
+    """
+    tasks = ((imdb, fsi_list, os.path.join(subtitle_directory, f"{imdb}.txt")) for imdb, fsi_list in imdb_fsi_lists)
+    if n_workers == 1:
+        for imdb, fsi_list, filepath in tasks:
+            yield imdb, fsi_list, extract_sentences((filepath, fsi_list))
+        return
+
+    # the chunks are submitted from this thread, so the number of files in flight is bounded without blocking the
+    # pool, and an error of a worker is raised here when its chunk is yielded
+    n_in_flight = max(n_workers * window // chunk_size, n_workers, 1)
+    in_flight = deque()
+    with Pool(n_workers) as pool:
+        while True:
+            chunk = list(itertools.islice(tasks, chunk_size))
+            if chunk:
+                in_flight.append((chunk, pool.apply_async(extract_chunk_sentences, \
+                    ([(filepath, fsi_list) for _, fsi_list, filepath in chunk],))))
+            if in_flight and (not chunk or len(in_flight) == n_in_flight):
+                chunk_tasks, result = in_flight.popleft()
+                for (imdb, fsi_list, _), sentence_hashes in zip(chunk_tasks, result.get()):
+                    yield imdb, fsi_list, sentence_hashes
+            elif not chunk:
+                break
+
+class SentenceTable:
+    """Dedup table of sentences, keyed by their hash. Each new sentence gets the next flattened sentence index (rsi)
+    and is written to the sentences file, so the rsi assignment only depends on the order in which the sentences
+    are added. The table lives in the main process; the workers only read the files and hash the sentences.
+    """
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.sentence_to_rsi = {}
+
+    def add(self, sentence, sentence_hash):
+        """Returns the rsi of the sentence
+        """
+        rsi = self.sentence_to_rsi.get(sentence_hash)
+        if rsi is None:
+            rsi = len(self.sentence_to_rsi)
+            self.sentence_to_rsi[sentence_hash] = rsi
+            self.writer.write(("\n" if rsi else "") + sentence)
+        return rsi
+
+class SentenceHashTable:
+    """Hashes of the sentences of the sentences file and their flattened sentence index (rsi), as a structured array
+    sorted by hash. It is saved in the directory of the compact sentence index, so that an update can find which of
+    its sentences are already in the sentences file without hashing the file again.
+    """
+
+    dtype = np.dtype([("hash", "S16"), ("rsi", np.int32)])
+    filename = "sentence_hashes.npy"
+
+    def __init__(self, table):
+        self.table = table
+
+    def __len__(self):
+        return len(self.table)
+
+    @classmethod
+    def from_dict(cls, sentence_to_rsi):
+        """Create the table from the `{hash:rsi}` dictionary of a `SentenceTable`
+        """
+        table = np.array(list(sentence_to_rsi.items()), dtype=cls.dtype)
+        return cls(np.sort(table, order="hash"))
+
+    @classmethod
+    def load(cls, index_dir):
+        """Load the table saved in `index_dir`, memory-mapped. Returns None if it does not exist.
+        """
+        filepath = os.path.join(index_dir, cls.filename)
+        if not os.path.exists(filepath):
+            return None
+        return cls(np.load(filepath, mmap_mode="r"))
+
+    def save(self, index_dir):
+        filepath = os.path.join(index_dir, self.filename)
+        np.save(f"{filepath}.tmp.npy", np.asarray(self.table))
+        os.replace(f"{filepath}.tmp.npy", filepath)
+
+    def find(self, sentence_hashes):
+        """Vectorized hash -> rsi lookup. Returns -1 for sentences that are not in the table.
+        """
+        hashes = np.array(sentence_hashes, dtype="S16").reshape(-1)
+        rsi = np.full(len(hashes), -1, dtype=np.int32)
+        positions = np.searchsorted(self.table["hash"], hashes)
+        found = positions < len(self.table)
+        found[found] = self.table["hash"][positions[found]] == hashes[found]
+        rsi[found] = self.table["rsi"][positions[found]]
+        return rsi
+
+    def extend(self, sentence_hashes):
+        """Returns a new table in which the hashes of sentences appended to the sentences file get the next rsi, in
+        order. The hashes should not be in the table.
+        """
+        hashes = np.array(sentence_hashes, dtype="S16").reshape(-1)
+        added = np.empty(len(hashes), dtype=self.dtype)
+        added["hash"] = hashes
+        added["rsi"] = np.arange(len(self.table), len(self.table) + len(hashes))
+        added = np.sort(added, order="hash")
+        table = np.insert(np.asarray(self.table), np.searchsorted(self.table["hash"], added["hash"]), added)
+        assert np.all(table["hash"][1:] != table["hash"][:-1]), "the appended sentences should be new"
+        return SentenceHashTable(table)
+
+def find_sentences(key_to_si_filepath, subtitle_directory, sentences_filepath, si_to_rsi_filepath, rsi_to_si_filepath, index_dir=None, n_workers=1):
     """
     Save subtitle sentences that contain some key (from `key_to_si_filepath` json) in `sentences_filepath` text file.
     Find the mapping between sentence index in the text file and file sentence index and save them.
@@ -33,8 +187,22 @@ def find_sentences(key_to_si_filepath, subtitle_directory, sentences_filepath, s
         JSON filepath containing the flattened sentence index to
         file sentence index map.
         It is of the form {`rsi`:[[`imdb`,`sent`]]}
+
+    index_dir : str
+        Directory of the compact sentence index created by `key_to_si_merge`.
+        If given, the key to file sentence index postings are read from it instead of
+        `key_to_si_filepath`, the flattened sentence indices are saved to it, and the
+        two JSON dictionaries are not saved.
+
+    n_workers : int
+        Number of worker processes reading the subtitle files.
+        The output does not depend on it.
     """
 
+    if index_dir is not None:
+        find_sentences_with_index(index_dir, subtitle_directory, sentences_filepath, n_workers=n_workers)
+        return
+
     # read key to sentence index dictionary
     print("opening key to sentence index dictionary")
     key_to_si = json.load(open(key_to_si_filepath))
@@ -51,37 +219,59 @@ def find_sentences(key_to_si_filepath, subtitle_directory, sentences_filepath, s
     # find sentence to flattened sentence index (sentence_to_rsi)
     # find file sentence index to flattened sentence index (si_to_rsi)
     # find flattened sentence index to file sentence index (rsi_to_si)
+    # the sentences are saved as they are found
     print("finding dictionary: sentence index <-> flattened sentence index")
-    sentence_to_rsi = {}
     si_to_rsi = {}
     rsi_to_si = {}
 
-    for imdb, fsi_list in tqdm(imdb_to_fsi.items(), desc = "creating maps"):
-        # text = open(f"/proj/sbaruah/subtitle/profession/data/text/{imdb}.txt").read().strip().split("\n")
-        text = open(os.path.join(subtitle_directory, f"{imdb}.txt")).read().strip().split("\n")
-        si_to_rsi[imdb] = {}
-
-        for fsi in fsi_list:
-            sentence = text[fsi]
-            
-            if sentence not in sentence_to_rsi:
-                rsi = len(sentence_to_rsi)
-                sentence_to_rsi[sentence] = rsi
-                rsi_to_si[rsi] = []
-            
-            rsi = sentence_to_rsi[sentence]
-            rsi_to_si[rsi].append((imdb, fsi))
-            si_to_rsi[imdb][fsi] = rsi
+    with open(sentences_filepath, "w") as writer:
+        sentence_table = SentenceTable(writer)
+        imdb_fsi_lists = ((imdb, list(fsi_set)) for imdb, fsi_set in imdb_to_fsi.items())
+
+        for imdb, fsi_list, sentence_hashes in tqdm(iter_file_sentences(imdb_fsi_lists, subtitle_directory, \
+            n_workers), total=len(imdb_to_fsi), desc = "creating maps"):
+            si_to_rsi[imdb] = {}
+
+            for fsi, (sentence, sentence_hash) in zip(fsi_list, sentence_hashes):
+                rsi = sentence_table.add(sentence, sentence_hash)
+                if rsi not in rsi_to_si:
+                    rsi_to_si[rsi] = []
+                rsi_to_si[rsi].append((imdb, fsi))
+                si_to_rsi[imdb][fsi] = rsi
 
     # save dictionaries
     print("saving dictionaries: sentence index <-> flattened sentence index")
     json.dump(si_to_rsi, open(si_to_rsi_filepath, "w"))
     json.dump(rsi_to_si, open(rsi_to_si_filepath, "w"))
 
-    # save text
-    print("saving sentences")
-    sentences = sorted(sentence_to_rsi.keys(), key = lambda x: sentence_to_rsi[x])
-    open(sentences_filepath, "w").write("\n".join(sentences))
+def find_sentences_with_index(index_dir, subtitle_directory, sentences_filepath, n_workers=1):
+    """Same as `find_sentences`, but read the file sentence indices from the compact sentence index and save
+    the flattened sentence indices to it.
+    """
+
+    # read the compact sentence index
+    print("opening sentence index")
+    index = SentenceIndex.load(index_dir)
+
+    # the si table is sorted by imdb, so the file sentence indices of an imdb are contiguous
+    imdb_offsets = np.searchsorted(index.si_imdb, np.arange(len(index.imdbs) + 1))
+    si_rsi = np.full(len(index.si_imdb), -1, dtype=np.int32)
+    imdb_fsi_lists = ((imdb, index.si_sent[imdb_offsets[i]: imdb_offsets[i + 1]].tolist()) for i, imdb in \
+        enumerate(index.imdbs))
+
+    # the sentences are saved as they are found
+    with open(sentences_filepath, "w") as writer:
+        sentence_table = SentenceTable(writer)
+        for i, (_, _, sentence_hashes) in enumerate(tqdm(iter_file_sentences(imdb_fsi_lists, subtitle_directory, \
+            n_workers), total=len(index.imdbs), desc = "creating maps")):
+            for p, (sentence, sentence_hash) in zip(range(imdb_offsets[i], imdb_offsets[i + 1]), sentence_hashes):
+                si_rsi[p] = sentence_table.add(sentence, sentence_hash)
+
+    # save the flattened sentence indices and the sentence hashes
+    print("saving sentence index")
+    index.set_rsi(si_rsi)
+    index.save(index_dir)
+    SentenceHashTable.from_dict(sentence_table.sentence_to_rsi).save(index_dir)
 
 def flatten_sentences():
     parser = argparse.ArgumentParser(description="Create text file containing all sentences that include some professional word, and create dictionaries to map index of the sentence in the text file to the file sentence index", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
@@ -89,6 +279,8 @@ def flatten_sentences():
     parser.add_argument("--data", type=str, help="subtitle text directory", default="/proj/sbaruah/subtitle/profession/data/text/", dest="data")
     parser.add_argument("--out", type=str, help="txt filepath containing subtitle sentences that contain some professional word", default="/proj/sbaruah/subtitle/profession/csl/data/mentions/sentences.txt", dest="out")
     parser.add_argument("--s2r", type=str, help="json filepath containing file sentence index to flattened sentence index", default="/proj/sbaruah/subtitle/profession/csl/data/mentions/si_to_rsi.json", dest="s2r")
+    parser.add_argument("--index", type=str, help="directory of the compact sentence index. If given, it is used instead of the json dictionaries", default=None, dest="index")
+    parser.add_argument("--workers", type=int, help="number of worker processes reading the subtitle files", default=1, dest="workers")
     parser.add_argument("--r2s", type=str, help="json filepath containing flattened sentence index to file sentence index", default="/proj/sbaruah/subtitle/profession/csl/data/mentions/rsi_to_si.json", dest="r2s")
 
     args = parser.parse_args()
@@ -97,8 +289,10 @@ def flatten_sentences():
     sentences_filepath = args.out
     si_to_rsi_filepath = args.s2r
     rsi_to_si_filepath = args.r2s
+    index_dir = args.index
+    n_workers = args.workers
 
-    find_sentences(key_to_si_filepath, subtitle_directory, sentences_filepath, si_to_rsi_filepath, rsi_to_si_filepath)
+    find_sentences(key_to_si_filepath, subtitle_directory, sentences_filepath, si_to_rsi_filepath, rsi_to_si_filepath, index_dir=index_dir, n_workers=n_workers)
 
 if __name__ == "__main__":
     flatten_sentences()
\ No newline at end of file
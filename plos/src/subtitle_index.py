@@ -0,0 +1,362 @@
+import os
+import re
+import functools
+import numpy as np
+import pandas as pd
+from multiprocessing import Pool
+from tqdm import tqdm
+import argparse
+from pattern.text.en import singularize
+
+token_pattern = re.compile(r"\w+|[^\w\s]+")
+
+@functools.lru_cache(maxsize=1 << 20)
+def singularize_term(term):
+    return singularize(term)
+
+def tokenize(sentence):
+    """Returns the index terms of the sentence. The analysis is the same as the Whoosh analyzer of `key_to_si`:
+    regex tokenization, lowercasing and singularization.
+    """
+    return [singularize_term(token.lower()) for token in token_pattern.findall(sentence)]
+
+# restricted vocabulary of the worker process
+worker_vocabulary = None
+
+def init_tokenize_worker(vocabulary):
+    global worker_vocabulary
+    worker_vocabulary = vocabulary
+
+def tokenize_file(filepath):
+    """Worker of `create_subtitle_index`. Tokenize the sentences of a subtitle file.
+
+    Returns
+    -------
+    result : tuple \\
+        `(n_sentences, terms, term_ids, sents, positions)`. `terms` is the list of unique terms of the file, and
+        `term_ids`, `sents` and `positions` are aligned arrays of the term (index into `terms`), sentence index and
+        token position of each posting
+    """
+    text = open(filepath).read().strip().split("\n")
+    terms, term_to_id = [], {}
+    term_ids, sents, positions = [], [], []
+    for sent, sentence in enumerate(text):
+        for position, term in enumerate(tokenize(sentence)):
+            if worker_vocabulary is not None and term not in worker_vocabulary:
+                continue
+            if term not in term_to_id:
+                term_to_id[term] = len(terms)
+                terms.append(term)
+            term_ids.append(term_to_id[term])
+            sents.append(sent)
+            positions.append(position)
+    return len(text), terms, np.array(term_ids, dtype=np.int32), np.array(sents, dtype=np.int64), \
+        np.array(positions, dtype=np.int64)
+
+def read_keys(profession_filepath):
+    """Returns the sorted list of singular and plural keys of the profession gazetteer
+    """
+    profession_df = pd.read_csv(profession_filepath, index_col = None)
+    return sorted(set(profession_df["singular_key"].dropna().tolist() + profession_df["plural_key"].dropna().tolist()))
+
+def file_stats(filepaths):
+    """Returns the modification times (ns) and sizes of the files as int64 arrays
+    """
+    stats = [os.stat(filepath) for filepath in filepaths]
+    return np.array([stat.st_mtime_ns for stat in stats], dtype=np.int64), \
+        np.array([stat.st_size for stat in stats], dtype=np.int64)
+
+def index_files(filepaths, vocabulary, n_workers, term_to_id, sentence_start=0):
+    """Tokenize the files in parallel and return their postings.
+
+    Parameters
+    ----------
+    filepaths : list \\
+        Subtitle text filepaths
+
+    vocabulary : set \\
+        Terms to index. If None, all the terms are indexed
+
+    n_workers : int \\
+        Number of worker processes
+
+    term_to_id : dict \\
+        Term to term id dictionary. New terms are added to it
+
+    sentence_start : int \\
+        Global sentence id of the first sentence of the first file
+
+    Returns
+    -------
+    postings : tuple \\
+        `(term_ids, sentences, positions, sentence_offsets)`. The first three are aligned arrays of term id,
+        global sentence id and token position. `sentence_offsets` is the list of the global sentence ids of the
+        first sentence of each file, followed by the end
+    """
+    sentence_offsets = [sentence_start]
+    term_id_arrays = [np.zeros(0, dtype=np.int32)]
+    sentence_arrays, position_arrays = [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.int64)]
+    with Pool(n_workers, initializer=init_tokenize_worker, initargs=(vocabulary,)) as pool:
+        for n_sentences, terms, term_ids, sents, positions in tqdm(pool.imap(tokenize_file, filepaths, chunksize=16), \
+            total=len(filepaths), desc="indexing"):
+            for term in terms:
+                if term not in term_to_id:
+                    term_to_id[term] = len(term_to_id)
+            local_to_global = np.array([term_to_id[term] for term in terms], dtype=np.int32)
+            term_id_arrays.append(local_to_global[term_ids])
+            sentence_arrays.append(sents + sentence_offsets[-1])
+            position_arrays.append(positions)
+            sentence_offsets.append(sentence_offsets[-1] + n_sentences)
+    return np.concatenate(term_id_arrays), np.concatenate(sentence_arrays), np.concatenate(position_arrays), \
+        sentence_offsets
+
+def save_subtitle_index(subtitle_index_filepath, term_to_id, term_ids, sentences, positions, imdbs, sentence_offsets, \
+    mtimes, sizes):
+    """Sort the postings by term and code, renumber the terms in sorted order, and save the index
+    """
+    # leave an unused position after the last token of every sentence, so phrases cannot match across sentences
+    max_position = int(positions.max()) + 2 if len(positions) else 2
+    codes = sentences * max_position + positions
+    terms = np.array(sorted(term_to_id, key=term_to_id.get), dtype=str)
+    term_order = np.argsort(terms)
+    term_rank = np.empty(len(terms), dtype=np.int32)
+    term_rank[term_order] = np.arange(len(terms), dtype=np.int32)
+    term_ids = term_rank[term_ids]
+    order = np.lexsort((codes, term_ids))
+
+    print(f"saving subtitle index: {len(imdbs)} files, {sentence_offsets[-1]} sentences, {len(terms)} terms, "
+        f"{len(codes)} postings")
+    temporary_filepath = f"{subtitle_index_filepath}.{os.getpid()}.npz"
+    np.savez_compressed(temporary_filepath, terms=terms[term_order], \
+        term_offsets=np.searchsorted(term_ids[order], np.arange(len(terms) + 1)).astype(np.int64), \
+            codes=codes[order], imdbs=np.array(imdbs, dtype=str), \
+                sentence_offsets=np.array(sentence_offsets, dtype=np.int64), max_position=np.int64(max_position), \
+                    mtimes=mtimes, sizes=sizes)
+    os.replace(temporary_filepath, subtitle_index_filepath)
+
+def read_vocabulary(profession_filepath):
+    """Returns the set of terms of the gazetteer keys, or None if `profession_filepath` is None
+    """
+    if profession_filepath is None:
+        return None
+    vocabulary = set(term for key in read_keys(profession_filepath) for term in tokenize(key))
+    print(f"restricting the index to {len(vocabulary)} terms of the gazetteer keys")
+    return vocabulary
+
+def create_subtitle_index(subtitle_directory, subtitle_index_filepath, profession_filepath=None, n_workers=10):
+    """Create a positional inverted index of the sentences of the subtitle text files. It can be used instead of
+    the Whoosh search indices to find the file sentence indices of the gazetteer keys.
+
+    A sentence is a line of `{imdb}.txt`. Each sentence gets a global sentence id, which is the sentence index plus
+    the number of sentences of the preceding files. The postings of a term are sorted int64 codes
+    `global_sentence_id * max_position + token_position`. `max_position` is at least one more than the number of
+    tokens of the longest sentence, so the last token of a sentence is not adjacent to the first token of the next.
+
+    Parameters
+    ----------
+    subtitle_directory : str \\
+        Directory containing the subtitle text files named `{imdb}.txt`
+
+    subtitle_index_filepath : str \\
+        NPZ filepath to which the compressed index is saved. It contains the arrays:
+
+        1. terms: the index terms, sorted
+        2. term_offsets: int64 array of length `n_terms + 1`. The postings of `terms[t]` are
+            `codes[term_offsets[t]: term_offsets[t + 1]]`
+        3. codes: int64 postings
+        4. imdbs: IMDb ids of the files
+        5. sentence_offsets: int64 array of length `n_files + 1`. The global sentence ids of `imdbs[i]` are
+            `sentence_offsets[i]` to `sentence_offsets[i + 1]`
+        6. max_position: the position multiplier of the codes
+        7. mtimes, sizes: modification times (ns) and sizes of the files, used by `update_subtitle_index`
+
+    profession_filepath : str \\
+        CSV file containing the profession gazetteer. If given, only the terms of the gazetteer keys are indexed
+
+    n_workers : int \\
+        Number of worker processes
+    """
+    filenames = sorted(filename for filename in os.listdir(subtitle_directory) if filename.endswith(".txt"))
+    imdbs = [filename[:-4] for filename in filenames]
+    filepaths = [os.path.join(subtitle_directory, filename) for filename in filenames]
+
+    vocabulary = read_vocabulary(profession_filepath)
+    term_to_id = {}
+    term_ids, sentences, positions, sentence_offsets = index_files(filepaths, vocabulary, n_workers, term_to_id)
+    mtimes, sizes = file_stats(filepaths)
+    save_subtitle_index(subtitle_index_filepath, term_to_id, term_ids, sentences, positions, imdbs, sentence_offsets, \
+        mtimes, sizes)
+
+def update_subtitle_index(subtitle_directory, subtitle_index_filepath, profession_filepath=None, n_workers=10, \
+    out_filepath=None):
+    """Index the subtitle files that are new or changed since the index was created or last updated.
+
+    The sentences of the new and changed files get global sentence ids after the existing ones, so the global
+    sentence ids of the other files do not change. The postings of the previous version of a changed file are
+    removed, but its entry is kept, so an IMDb id can appear more than once in `imdbs`; the last entry is the
+    current one. Deleted files are not removed from the index.
+
+    Parameters
+    ----------
+    subtitle_directory, subtitle_index_filepath, n_workers : \\
+        Same as `create_subtitle_index`
+
+    profession_filepath : str \\
+        CSV file containing the profession gazetteer. It should be the same as the one used to create the index
+
+    out_filepath : str \\
+        NPZ filepath to which the updated index is saved. Default is `subtitle_index_filepath`. Nothing is saved
+        if there are no new or changed files
+
+    Returns
+    -------
+    update : tuple \\
+        `(sentence_start, new_imdbs, changed_imdbs)`. `sentence_start` is the global sentence id of the first
+        sentence of the indexed files
+    """
+    data = np.load(subtitle_index_filepath)
+    imdbs = data["imdbs"].tolist()
+    sentence_offsets = data["sentence_offsets"].tolist()
+    mtimes = data["mtimes"] if "mtimes" in data.files else np.full(len(imdbs), -1, dtype=np.int64)
+    sizes = data["sizes"] if "sizes" in data.files else np.full(len(imdbs), -1, dtype=np.int64)
+    current = dict((imdb, i) for i, imdb in enumerate(imdbs))
+
+    # find the new and changed files
+    filenames = sorted(filename for filename in os.listdir(subtitle_directory) if filename.endswith(".txt"))
+    filepaths = [os.path.join(subtitle_directory, filename) for filename in filenames]
+    file_mtimes, file_sizes = file_stats(filepaths)
+    new_imdbs, changed_imdbs, update_filepaths, update = [], [], [], []
+    for filename, filepath, mtime, size in zip(filenames, filepaths, file_mtimes, file_sizes):
+        imdb = filename[:-4]
+        if imdb not in current:
+            new_imdbs.append(imdb)
+        elif mtimes[current[imdb]] != mtime or sizes[current[imdb]] != size:
+            changed_imdbs.append(imdb)
+        else:
+            continue
+        update_filepaths.append(filepath)
+        update.append((imdb, mtime, size))
+    print(f"{len(new_imdbs)} new files, {len(changed_imdbs)} changed files")
+    if not update:
+        return sentence_offsets[-1], new_imdbs, changed_imdbs
+
+    # decode the existing postings, and remove the postings of the previous versions of the changed files
+    max_position = int(data["max_position"])
+    codes = data["codes"]
+    term_offsets = data["term_offsets"]
+    term_to_id = dict((term, t) for t, term in enumerate(data["terms"].tolist()))
+    term_ids = np.repeat(np.arange(len(term_to_id), dtype=np.int32), np.diff(term_offsets))
+    sentences, positions = codes // max_position, codes % max_position
+    keep = np.ones(len(codes), dtype=bool)
+    for imdb in changed_imdbs:
+        i = current[imdb]
+        keep &= (sentences < sentence_offsets[i]) | (sentences >= sentence_offsets[i + 1])
+    term_ids, sentences, positions = term_ids[keep], sentences[keep], positions[keep]
+
+    # index the new and changed files
+    sentence_start = sentence_offsets[-1]
+    new_term_ids, new_sentences, new_positions, new_sentence_offsets = index_files(update_filepaths, \
+        read_vocabulary(profession_filepath), n_workers, term_to_id, sentence_start)
+
+    imdbs.extend([imdb for imdb, _, _ in update])
+    sentence_offsets.extend(new_sentence_offsets[1:])
+    mtimes = np.concatenate([mtimes, np.array([mtime for _, mtime, _ in update], dtype=np.int64)])
+    sizes = np.concatenate([sizes, np.array([size for _, _, size in update], dtype=np.int64)])
+    save_subtitle_index(out_filepath or subtitle_index_filepath, term_to_id, np.concatenate([term_ids, new_term_ids]), \
+        np.concatenate([sentences, new_sentences]), np.concatenate([positions, new_positions]), imdbs, \
+            sentence_offsets, mtimes, sizes)
+    return sentence_start, new_imdbs, changed_imdbs
+
+class SubtitleIndex:
+    """Positional inverted index created by `create_subtitle_index`, used to find exact phrase matches.
+
+    Parameters
+    ----------
+    subtitle_index_filepath : str \\
+        NPZ filepath of the index
+    """
+
+    def __init__(self, subtitle_index_filepath):
+        data = np.load(subtitle_index_filepath)
+        self.terms = data["terms"]
+        self.term_offsets = data["term_offsets"]
+        self.codes = data["codes"]
+        self.imdbs = data["imdbs"]
+        self.sentence_offsets = data["sentence_offsets"]
+        self.max_position = int(data["max_position"])
+
+    def postings(self, term):
+        """Returns the sorted codes of the term
+        """
+        t = np.searchsorted(self.terms, term)
+        if t == len(self.terms) or self.terms[t] != term:
+            return np.zeros(0, dtype=np.int64)
+        return self.codes[self.term_offsets[t]: self.term_offsets[t + 1]]
+
+    def find_phrase(self, phrase):
+        """Returns the sorted unique global sentence ids of the sentences that contain the phrase
+        """
+        terms = tokenize(phrase)
+        if not terms:
+            return np.zeros(0, dtype=np.int64)
+        postings = [self.postings(term) for term in terms]
+
+        # start from the rarest term and check that the other terms are at the matching positions
+        j = int(np.argmin([len(codes) for codes in postings]))
+        starts = postings[j] - j
+        # the phrase should start and end in the same sentence
+        starts = starts[(starts >= 0) & (starts % self.max_position + len(terms) <= self.max_position)]
+        for i, codes in enumerate(postings):
+            if i == j or not len(starts):
+                continue
+            expected = starts + i
+            positions = np.searchsorted(codes, expected)
+            found = positions < len(codes)
+            found[found] = codes[positions[found]] == expected[found]
+            starts = starts[found]
+        return np.unique(starts // self.max_position)
+
+    def search(self, keys, sentence_start=0):
+        """Find the file sentence indices of the keys in batch. Only the sentences whose global sentence id is
+        at least `sentence_start` are searched.
+
+        Returns
+        -------
+        postings : tuple \\
+            `(key_ids, imdbs, sents)` aligned lists of key id (index into `keys`), IMDb id and sentence index
+        """
+        key_ids, imdbs, sents = [], [], []
+        for k, key in enumerate(tqdm(keys, desc="searching")):
+            sentence_ids = self.find_phrase(key)
+            sentence_ids = sentence_ids[sentence_ids >= sentence_start]
+            files = np.searchsorted(self.sentence_offsets, sentence_ids, side="right") - 1
+            key_ids.extend([k] * len(sentence_ids))
+            imdbs.extend(self.imdbs[files].tolist())
+            sents.extend((sentence_ids - self.sentence_offsets[files]).tolist())
+        return key_ids, imdbs, sents
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create positional inverted index of the subtitle sentences", \
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--data", type=str, help="subtitle text directory", \
+        default="/proj/sbaruah/subtitle/profession/data/text/", dest="data")
+    parser.add_argument("--out", type=str, help="npz filepath to which the index is saved", \
+        default="/proj/sbaruah/subtitle/profession/data/subtitle_index.npz", dest="out")
+    parser.add_argument("--gzt", type=str, help="csv filepath of profession gazetteer. If given, only the terms of \
+        the gazetteer keys are indexed", default=None, dest="gzt")
+    parser.add_argument("--update", action="store_true", help="only index the new and changed subtitle files", \
+        dest="update")
+    parser.add_argument("--workers", type=int, help="number of worker processes", default=10, dest="workers")
+
+    args = parser.parse_args()
+    subtitle_directory = args.data
+    subtitle_index_filepath = args.out
+    profession_filepath = args.gzt
+    n_workers = args.workers
+
+    if args.update:
+        update_subtitle_index(subtitle_directory, subtitle_index_filepath, profession_filepath=profession_filepath, \
+            n_workers=n_workers)
+    else:
+        create_subtitle_index(subtitle_directory, subtitle_index_filepath, profession_filepath=profession_filepath, \
+            n_workers=n_workers)
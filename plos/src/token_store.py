@@ -0,0 +1,154 @@
+import os
+import json
+from array import array
+import numpy as np
+import jsonlines
+from tqdm import tqdm
+import argparse
+from sentence_store import SentenceStore
+
+columns = {"word": np.int32, "lemma": np.int32, "pos": np.uint8, "ner": np.uint8, "start": np.int32, "end": np.int32}
+
+def create_token_store(processed_filepath, token_store_dir):
+    """Convert the NLP processed docs to a columnar token store.
+
+    Parameters
+    ----------
+    processed_filepath : str \\
+        JSONLINES filepath containing NLP processed sentences. Each line is a
+        list of tokens of the form `{lemma:str, word:str, start:int, end:int, pos:str, ner:str}`
+
+    token_store_dir : str \\
+        Directory to which the token store will be saved. It contains one numpy
+        array per token column and a `doc_offsets.npy` array:
+
+        1. word.npy, lemma.npy: int32 ids into the shared word/lemma vocabulary
+        2. pos.npy, ner.npy: uint8 ids into the POS and NER tag vocabularies
+        3. start.npy, end.npy: int32 character offsets
+        4. doc_offsets.npy: int64 array of length `n_docs + 1`. The tokens of the
+            doc `rsi` are at positions `doc_offsets[rsi]` to `doc_offsets[rsi + 1]`
+        5. vocab.json: the word/lemma, POS and NER vocabularies
+    """
+    os.makedirs(token_store_dir, exist_ok=True)
+    vocab = {"word": {}, "pos": {}, "ner": {}}
+    data = {"word": array("i"), "lemma": array("i"), "pos": array("B"), "ner": array("B"), "start": array("i"), \
+        "end": array("i")}
+    doc_offsets = array("q", [0])
+
+    for doc in tqdm(jsonlines.open(processed_filepath), desc="reading processed"):
+        for token in doc:
+            for column, vocab_name in [("word", "word"), ("lemma", "word"), ("pos", "pos"), ("ner", "ner")]:
+                value = token[column]
+                if value not in vocab[vocab_name]:
+                    vocab[vocab_name][value] = len(vocab[vocab_name])
+                data[column].append(vocab[vocab_name][value])
+            data["start"].append(token["start"])
+            data["end"].append(token["end"])
+        doc_offsets.append(len(data["word"]))
+
+    assert len(vocab["pos"]) <= 256 and len(vocab["ner"]) <= 256, "POS and NER vocabularies should fit in uint8"
+
+    print(f"saving token store: {len(doc_offsets) - 1} docs, {len(data['word'])} tokens")
+    for column, dtype in columns.items():
+        np.save(os.path.join(token_store_dir, f"{column}.npy"), np.frombuffer(data[column], dtype=dtype))
+    np.save(os.path.join(token_store_dir, "doc_offsets.npy"), np.frombuffer(doc_offsets, dtype=np.int64))
+    json.dump(dict((name, list(vocab_dict.keys())) for name, vocab_dict in vocab.items()), \
+        open(os.path.join(token_store_dir, "vocab.json"), "w"))
+
+class TokenStore:
+    """Read-only, memory-mapped view of a token store created by `create_token_store`.
+
+    It can be used in place of the list of NLP processed docs: `store[rsi]` returns the doc of
+    the flattened sentence index `rsi` as a list of token dictionaries, in O(1) and without
+    reading the other docs.
+
+    Parameters
+    ----------
+    token_store_dir : str \\
+        Directory of the token store
+    """
+
+    def __init__(self, token_store_dir):
+        self.data = dict((column, np.load(os.path.join(token_store_dir, f"{column}.npy"), mmap_mode="r")) \
+            for column in columns)
+        self.doc_offsets = np.load(os.path.join(token_store_dir, "doc_offsets.npy"), mmap_mode="r")
+        self.vocab = json.load(open(os.path.join(token_store_dir, "vocab.json")))
+
+    def __len__(self):
+        return len(self.doc_offsets) - 1
+
+    def column(self, column, rsi):
+        """Returns the column values of the tokens of the doc `rsi` as a numpy array of ids or offsets
+        """
+        return self.data[column][self.doc_offsets[rsi]: self.doc_offsets[rsi + 1]]
+
+    def words(self, rsi):
+        """Returns the word tokens of the doc `rsi`
+        """
+        return [self.vocab["word"][i] for i in self.column("word", rsi)]
+
+    def __getitem__(self, rsi):
+        i, j = self.doc_offsets[rsi], self.doc_offsets[rsi + 1]
+        word, lemma, pos, ner, start, end = [self.data[column][i: j].tolist() for column in columns]
+        return [dict(lemma=self.vocab["word"][lemma[k]], word=self.vocab["word"][word[k]], start=start[k], end=end[k], \
+            pos=self.vocab["pos"][pos[k]], ner=self.vocab["ner"][ner[k]]) for k in range(j - i)]
+
+    def __iter__(self):
+        for rsi in range(len(self)):
+            yield self[rsi]
+
+def read_processed(processed_filepath):
+    """Returns the NLP processed docs. If `processed_filepath` is a token store directory,
+    the memory-mapped `TokenStore` is returned, otherwise the JSONLINES file is read into a list.
+    """
+    if os.path.isdir(processed_filepath):
+        return TokenStore(processed_filepath)
+    return [doc for doc in tqdm(jsonlines.open(processed_filepath), desc="reading processed")]
+
+def iter_processed(processed_filepath):
+    """Iterate over the NLP processed docs of a token store directory or a JSONLINES file
+    without reading all of them into memory.
+    """
+    if os.path.isdir(processed_filepath):
+        yield from TokenStore(processed_filepath)
+    else:
+        with jsonlines.open(processed_filepath) as reader:
+            yield from reader
+
+def lookup_tokens(processed_filepath, rsis, starts):
+    """Returns the list of the tokens `starts[i]` of the docs `rsis[i]` of a token store directory or a JSONLINES
+    file of docs, such as the NLP processed docs or the WSD output, without reading the other docs.
+
+    The docs of a JSONLINES file are read through the line offset index of `sentence_store.SentenceStore`, which is
+    created once next to the file. The pairs are visited in rsi order, so each doc is read and parsed once and the
+    file is read sequentially.
+    """
+    if os.path.isdir(processed_filepath):
+        docs = TokenStore(processed_filepath)
+        read_doc = docs.__getitem__
+    else:
+        docs = SentenceStore(processed_filepath)
+        read_doc = lambda rsi: json.loads(docs[rsi])
+
+    tokens = [None] * len(rsis)
+    doc_rsi, doc = None, None
+    for i in tqdm(np.argsort(rsis, kind="stable").tolist(), desc="reading tokens"):
+        if rsis[i] != doc_rsi:
+            doc_rsi = rsis[i]
+            doc = read_doc(int(doc_rsi))
+        tokens[i] = doc[starts[i]]
+    return tokens
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create columnar token store from NLP processed docs", \
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--data", type=str, help="jsonlines filepath of NLP processed docs (tokens, POS, NER)", \
+        default="data/mentions/pos.ner.jsonl", dest="data")
+    parser.add_argument("--out", type=str, help="directory to which the token store will be saved", \
+        default="data/mentions/pos.ner.store/", dest="out")
+
+    args = parser.parse_args()
+    processed_filepath = args.data
+    token_store_dir = args.out
+
+    create_token_store(processed_filepath, token_store_dir)
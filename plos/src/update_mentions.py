@@ -0,0 +1,335 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+import argparse
+from subtitle_index import SubtitleIndex, update_subtitle_index, read_keys
+from sentence_index import SentenceIndex
+from sentence_store import SentenceStore
+from si_to_rsi import hash_sentence, SentenceHashTable
+from find_ner_pos import process_sentence_range, is_complete
+from find_mentions import create_mention_context, write_mentions_streaming, mention_files
+
+def count_lines(filepath):
+    """Returns the number of lines of the file, or 0 if it does not exist
+    """
+    if not os.path.exists(filepath):
+        return 0
+    return len(SentenceStore(filepath))
+
+def append_lines(source_filepath, target_filepath, n_target_lines):
+    """Append the lines of the source file to the target file, if the target file still has `n_target_lines` lines.
+    Returns false if the lines were already appended.
+    """
+    n_lines = count_lines(target_filepath)
+    if n_lines != n_target_lines:
+        assert n_lines == n_target_lines + count_lines(source_filepath), \
+            f"{target_filepath} has {n_lines} lines, expected {n_target_lines}"
+        return False
+    with open(target_filepath, "ab") as writer, open(source_filepath, "rb") as reader:
+        writer.write(reader.read())
+    return True
+
+def load_sentence_hashes(index_dir, sentences):
+    """Load the sentence hash table saved with the compact sentence index, and add the sentences that were appended
+    to the sentences file after it was saved, by an update that failed. If the table does not exist, it is created
+    by hashing the sentences file once.
+    """
+    hash_table = SentenceHashTable.load(index_dir)
+    if hash_table is None:
+        hash_table = SentenceHashTable.from_dict({})
+    n_hashed = len(hash_table)
+    assert n_hashed <= len(sentences), f"the sentence hash table has {n_hashed} sentences, expected at most " \
+        f"{len(sentences)}"
+    if n_hashed < len(sentences):
+        hash_table = hash_table.extend([hash_sentence(sentence) for sentence in tqdm(sentences.range(n_hashed, \
+            len(sentences)), total=len(sentences) - n_hashed, desc="hashing sentences")])
+        hash_table.save(index_dir)
+    return hash_table
+
+def update_sentence_index(index_dir, keys, postings, imdbs, subtitle_directory, sentences_filepath):
+    """Add the key postings of the new and changed subtitle files to the compact sentence index, and append their
+    new unique sentences to the sentences file. The existing flattened sentence indices (rsi) are not renumbered.
+    The si of the previous versions of the files are removed; their sentences stay in the sentences file. Because
+    the si of the files are replaced and sentences already in the sentences file are reused, running it again with
+    the same postings does not change the index or the sentences file.
+
+    The sentences already in the sentences file are found with the sentence hash table saved with the index, so
+    only the sentences of the new and changed files are hashed, and the existing postings are spliced with
+    `SentenceIndex.replace` instead of rebuilding the index.
+
+    Parameters
+    ----------
+    index_dir : str \\
+        Directory of the compact sentence index
+
+    keys : list \\
+        Keys of the profession gazetteer
+
+    postings : tuple \\
+        `(key_ids, imdbs, sents)` key postings of the new and changed files
+
+    imdbs : list \\
+        IMDb ids of the new and changed files
+
+    subtitle_directory : str \\
+        Directory containing the subtitle text files
+
+    sentences_filepath : str \\
+        TEXT filepath of the subtitle sentences. The new sentences are appended to it
+
+    Returns
+    -------
+    rsi_range : tuple \\
+        `(n_old, n_new)`, number of flattened sentences before and after the update
+    """
+    print("opening sentence index")
+    index = SentenceIndex.load(index_dir)
+    update_index = SentenceIndex.from_postings(keys, *postings)
+    sentences = SentenceStore(sentences_filepath)
+    n_old = len(sentences)
+    hash_table = load_sentence_hashes(index_dir, sentences)
+
+    # hash the sentences of the new si
+    si_sentences, si_hashes = [], []
+    imdb_offsets = np.searchsorted(update_index.si_imdb, np.arange(len(update_index.imdbs) + 1))
+    for i, imdb in enumerate(tqdm(update_index.imdbs, desc="hashing new sentences")):
+        text = open(os.path.join(subtitle_directory, f"{imdb}.txt")).read().strip().split("\n")
+        for sent in update_index.si_sent[imdb_offsets[i]: imdb_offsets[i + 1]]:
+            si_sentences.append(text[sent])
+            si_hashes.append(hash_sentence(text[sent]))
+
+    # assign the rsi of the new si, reusing the rsi of existing sentences
+    si_rsi = hash_table.find(si_hashes)
+    new_sentences, new_sentence_to_rsi = [], {}
+    for p in np.flatnonzero(si_rsi == -1):
+        if si_hashes[p] not in new_sentence_to_rsi:
+            new_sentence_to_rsi[si_hashes[p]] = n_old + len(new_sentences)
+            new_sentences.append(si_sentences[p])
+        si_rsi[p] = new_sentence_to_rsi[si_hashes[p]]
+    n_new = n_old + len(new_sentences)
+    print(f"{len(si_rsi)} new sentence indices, {len(new_sentences)} new sentences")
+
+    # append the new sentences, then save their hashes and the sentence index
+    with open(sentences_filepath, "a") as writer:
+        if new_sentences:
+            writer.write(("\n" if n_old else "") + "\n".join(new_sentences))
+    if new_sentences:
+        hash_table.extend(list(new_sentence_to_rsi.keys())).save(index_dir)
+    update_index.si_rsi = si_rsi
+    updated_index = index.replace(imdbs, update_index)
+    updated_index.set_rsi(updated_index.si_rsi, n_new)
+    updated_index.save(index_dir)
+    return n_old, n_new
+
+def remove_mentions(mentions_directory, prof_to_si_filepath, imdbs, chunk_size=100000):
+    """Remove the mentions of the IMDb ids from the mention csv files and the profession to file sentence index
+    dictionary. The csv files are filtered `chunk_size` rows at a time to a temporary file that replaces them.
+    """
+    imdbs = set(imdbs)
+    for filename, _ in mention_files.values():
+        filepath = os.path.join(mentions_directory, filename)
+        temporary_filepath = f"{filepath}.{os.getpid()}.tmp"
+        with open(temporary_filepath, "w") as writer:
+            for i, df in enumerate(pd.read_csv(filepath, index_col=None, dtype=str, keep_default_na=False, \
+                chunksize=chunk_size)):
+                df[~df["imdb"].isin(imdbs)].to_csv(writer, index=False, header=(i == 0))
+        os.replace(temporary_filepath, filepath)
+    prof_to_si = json.load(open(prof_to_si_filepath))
+    prof_to_si = dict((prof, [[imdb, sent] for imdb, sent in si_list if imdb not in imdbs]) for prof, si_list in \
+        prof_to_si.items())
+    json.dump(prof_to_si, open(prof_to_si_filepath, "w"))
+
+def find_new_mentions(state, index_dir, profession_filepath, sentences_filepath, processed_filepath, \
+    mentions_directory, prof_to_si_filepath, max_n_words):
+    """Remove the mentions of the new and changed files, and append the mentions of their si. The mentions of the
+    new files are removed too, in case some were appended by an update that failed.
+    """
+    print("removing mentions of new and changed files")
+    remove_mentions(mentions_directory, prof_to_si_filepath, state["imdbs"])
+    index = SentenceIndex.load(index_dir)
+    imdbs = set(state["imdbs"])
+    positions = np.flatnonzero(np.isin(index.imdbs[index.si_imdb], list(imdbs)))
+    rsis = np.unique(index.si_rsi[positions]).tolist()
+    sentences, processed = SentenceStore(sentences_filepath), SentenceStore(processed_filepath)
+    lines = ((sentences[rsi], json.loads(processed[rsi])) for rsi in rsis)
+    context = create_mention_context(index, profession_filepath, max_n_words)
+    prof_to_si, counts = write_mentions_streaming(lines, 0, context, mentions_directory, total=len(rsis), rsis=rsis, \
+        imdbs=imdbs, append=True)
+
+    print("saving profession to file sentence index dictionary")
+    merged_prof_to_si = json.load(open(prof_to_si_filepath))
+    for prof, si_list in prof_to_si.items():
+        merged_prof_to_si.setdefault(prof, []).extend(si_list)
+    json.dump(merged_prof_to_si, open(prof_to_si_filepath, "w"))
+    for category, n in counts.items():
+        print(f"{n} {category} mentions added")
+
+def write_state(state, state_filepath):
+    """Save the update state, replacing the previous state file atomically
+    """
+    temporary_filepath = f"{state_filepath}.{os.getpid()}.tmp"
+    json.dump(state, open(temporary_filepath, "w"))
+    os.replace(temporary_filepath, state_filepath)
+
+def update(subtitle_directory, subtitle_index_filepath, profession_filepath, index_dir, sentences_filepath, \
+    processed_filepath, wsd_checkpoint_filepath, wsd_filepath, wsd_nopos_filepath, mentions_directory, \
+    prof_to_si_filepath, max_n_words, n_workers=10, device="cpu", wsd_batch_size=20, ner_batch_size=50, \
+    n_concurrent=8):
+    """Update the mentions when subtitle files are added or changed, without processing the existing subtitles
+    again. The subtitle index, sentence index, sentences file, processed docs, WSD outputs, mention csv files and
+    profession to file sentence index dictionary are updated in place.
+
+    1. Index the new and changed subtitle files (`subtitle_index.update_subtitle_index`) to a pending subtitle index
+    2. Search the keys in them, add their si to the compact sentence index and append their new sentences to the
+        sentences file
+    3. Replace the subtitle index by the pending subtitle index
+    4. Tag the new sentences with CoreNLP and append the docs to the processed JSONLINES file
+    5. Disambiguate the new docs, with and without POS, and append them to the WSD JSONLINES files
+    6. Remove the mentions of the new and changed files, and append the mentions of their si
+
+    The update state is saved to `index_dir/update.json` after steps 1 and 2, and the intermediate files are saved
+    next to the outputs with an `.update` suffix, so the update resumes if it is run again after a failure. The
+    subtitle index is only replaced after the state is saved, so the new and changed files are found again if the
+    update fails before. The filtering stages that follow `find_mentions` are not incremental; run them again.
+
+    Parameters
+    ----------
+    subtitle_directory : str \\
+        Directory containing the subtitle text files
+
+    subtitle_index_filepath : str \\
+        NPZ filepath of the subtitle index created by `subtitle_index.py`
+
+    index_dir : str \\
+        Directory of the compact sentence index
+
+    processed_filepath : str \\
+        JSONLINES filepath of the NLP processed docs
+
+    wsd_checkpoint_filepath : str \\
+        Torch checkpoint filepath of the EWISER model
+
+    wsd_filepath, wsd_nopos_filepath : str \\
+        JSONLINES filepaths of the WSD outputs with and without POS
+
+    profession_filepath, sentences_filepath, mentions_directory, prof_to_si_filepath, max_n_words : \\
+        Same as `find_mentions`
+
+    n_workers : int \\
+        Number of worker processes of the subtitle indexer
+
+    device, wsd_batch_size : \\
+        Same as `find_wordnet_sense.find_wsd`
+
+    ner_batch_size, n_concurrent : \\
+        Same as `find_ner_pos.process_sentences`
+    """
+    assert not os.path.isdir(processed_filepath), "the processed docs should be a JSONLINES file"
+    state_filepath = os.path.join(index_dir, "update.json")
+
+    pending_subtitle_index_filepath = subtitle_index_filepath + ".update.npz"
+
+    # index the new and changed files to the pending subtitle index
+    if os.path.exists(state_filepath):
+        state = json.load(open(state_filepath))
+        print(f"resuming update of {len(state['imdbs'])} files")
+    else:
+        sentence_start, new_imdbs, changed_imdbs = update_subtitle_index(subtitle_directory, subtitle_index_filepath, \
+            profession_filepath=profession_filepath, n_workers=n_workers, out_filepath=pending_subtitle_index_filepath)
+        if not new_imdbs and not changed_imdbs:
+            print("no new or changed subtitle files")
+            return
+        state = dict(n_old=count_lines(sentences_filepath), sentence_start=sentence_start, \
+            imdbs=new_imdbs + changed_imdbs, changed_imdbs=changed_imdbs)
+        write_state(state, state_filepath)
+
+    # update the sentence index
+    if "n_new" not in state:
+        keys = read_keys(profession_filepath)
+        postings = SubtitleIndex(pending_subtitle_index_filepath).search(keys, sentence_start=state["sentence_start"])
+        _, state["n_new"] = update_sentence_index(index_dir, keys, postings, state["imdbs"], subtitle_directory, \
+            sentences_filepath)
+        write_state(state, state_filepath)
+    n_old, n_new = state["n_old"], state["n_new"]
+    print(f"updating rsi {n_old} to {n_new}")
+
+    # replace the subtitle index
+    if os.path.exists(pending_subtitle_index_filepath):
+        os.replace(pending_subtitle_index_filepath, subtitle_index_filepath)
+
+    # tag the new sentences
+    processed_update_filepath = processed_filepath + ".update"
+    process_sentence_range(sentences_filepath, n_old, n_new, processed_update_filepath, max_n_words, 0, \
+        batch_size=ner_batch_size, n_concurrent=n_concurrent, desc="update")
+    assert is_complete(processed_update_filepath, n_new - n_old), "the new sentences were not all tagged"
+    append_lines(processed_update_filepath, processed_filepath, n_old)
+
+    # disambiguate the new docs
+    from find_wordnet_sense import find_wsd
+    pending = [(filepath, use_pos) for filepath, use_pos in [(wsd_filepath, True), (wsd_nopos_filepath, False)] \
+        if count_lines(filepath) == n_old]
+    if len(pending) == 2:
+        find_wsd(processed_update_filepath, wsd_checkpoint_filepath, wsd_filepath + ".update", device, wsd_batch_size, \
+            nopos_wsd_filepath=wsd_nopos_filepath + ".update")
+    else:
+        for filepath, use_pos in pending:
+            find_wsd(processed_update_filepath, wsd_checkpoint_filepath, filepath + ".update", device, wsd_batch_size, \
+                use_pos=use_pos)
+    for filepath, _ in pending:
+        append_lines(filepath + ".update", filepath, n_old)
+
+    # find the mentions of the new si
+    if not state.get("mentions", False):
+        find_new_mentions(state, index_dir, profession_filepath, sentences_filepath, processed_filepath, \
+            mentions_directory, prof_to_si_filepath, max_n_words)
+        state["mentions"] = True
+        write_state(state, state_filepath)
+
+    # remove the intermediate files
+    for filepath in [processed_update_filepath, processed_update_filepath + ".checkpoint", wsd_filepath + ".update", \
+        wsd_nopos_filepath + ".update"]:
+        for intermediate_filepath in [filepath, filepath + ".idx.npy"]:
+            if os.path.exists(intermediate_filepath):
+                os.remove(intermediate_filepath)
+    os.remove(state_filepath)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Update the mentions with new or changed subtitle files", \
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--data", type=str, help="subtitle text directory", \
+        default="/proj/sbaruah/subtitle/profession/data/text/", dest="data")
+    parser.add_argument("--subtitle_index", type=str, help="npz filepath of the subtitle index", \
+        default="/proj/sbaruah/subtitle/profession/data/subtitle_index.npz", dest="subtitle_index")
+    parser.add_argument("--gzt", type=str, help="csv file of profession gazetteer", \
+        default="/proj/sbaruah/subtitle/profession/csl/data/gazetteer/inflection.csv", dest="gzt")
+    parser.add_argument("--index", type=str, help="directory of the compact sentence index", \
+        default="/proj/sbaruah/subtitle/profession/csl/data/mentions/index/", dest="index")
+    parser.add_argument("--sent", type=str, help="txt file of subtitle sentences which have some professional word", \
+        default="/proj/sbaruah/subtitle/profession/csl/data/mentions/sentences.txt", dest="sent")
+    parser.add_argument("--proc", type=str, help="jsonlines file of NLP processed docs", \
+        default="/proj/sbaruah/subtitle/profession/csl/data/mentions/processed_finegrained.jsonl", dest="proc")
+    parser.add_argument("--checkpoint", type=str, help="torch checkpoint filepath of EWISER English model", \
+        default="data/wsd_models/ewiser.semcor+wngt.pt", dest="checkpoint")
+    parser.add_argument("--wsd", type=str, help="jsonlines file of WSD output", default="data/mentions/wsd.jsonl", \
+        dest="wsd")
+    parser.add_argument("--wsd_nopos", type=str, help="jsonlines file of WSD output found without POS", \
+        default="data/mentions/wsd.nopos.jsonl", dest="wsd_nopos")
+    parser.add_argument("--mentions", type=str, help="directory of the mention csv files", \
+        default="/proj/sbaruah/subtitle/profession/csl/data/mentions/", dest="mentions")
+    parser.add_argument("--p2s", type=str, help="json file of profession to file sentence index", \
+        default="/proj/sbaruah/subtitle/profession/csl/data/mentions/prof_to_si.json", dest="p2s")
+    parser.add_argument("--max_words", type=int, help="maximum number of words in a sentence", default=100, \
+        dest="max_words")
+    parser.add_argument("--workers", type=int, help="number of worker processes of the subtitle indexer", default=10, \
+        dest="workers")
+    parser.add_argument("--device", type=str, help="CUDA device or CPU for WSD", default="cpu", dest="device")
+    parser.add_argument("--wsd_batch_size", type=int, help="number of subtitles in a WSD batch", default=20, \
+        dest="wsd_batch_size")
+
+    args = parser.parse_args()
+
+    update(args.data, args.subtitle_index, args.gzt, args.index, args.sent, args.proc, args.checkpoint, args.wsd, \
+        args.wsd_nopos, args.mentions, args.p2s, args.max_words, n_workers=args.workers, device=args.device, \
+            wsd_batch_size=args.wsd_batch_size)
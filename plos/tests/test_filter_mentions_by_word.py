@@ -0,0 +1,42 @@
+import csv
+import json
+import random
+
+from filter_mentions_by_word import read_senses
+
+def random_wsd_docs(n_docs, seed=0):
+    rng = random.Random(seed)
+    senses = ["", "doctor.n.01", "doctor.n.04", "nurse.n.01", "nurse.v.02", "officer.n.01"]
+    return [[rng.choice(senses) for _ in range(rng.randint(0, 8))] for _ in range(n_docs)]
+
+def random_tokens(wsd_docs, seed=1):
+    rng = random.Random(seed)
+    pairs = [(rsi, rng.randrange(len(doc))) for rsi, doc in enumerate(wsd_docs) if doc and rng.random() < 0.5]
+    pairs += rng.sample(pairs, len(pairs) // 4)
+    rng.shuffle(pairs)
+    return [rsi for rsi, _ in pairs], [start for _, start in pairs]
+
+def test_read_senses_of_jsonl_equals_loaded_docs(tmp_path):
+    wsd_docs = random_wsd_docs(300)
+    wsd_filepath = str(tmp_path / "wsd.jsonl")
+    with open(wsd_filepath, "w") as writer:
+        for doc in wsd_docs:
+            writer.write(json.dumps(doc) + "\n")
+    rsis, starts = random_tokens(wsd_docs)
+    assert read_senses(wsd_filepath, rsis, starts) == [wsd_docs[rsi][start] for rsi, start in zip(rsis, starts)]
+
+def test_read_senses_of_csv_equals_loaded_docs(tmp_path):
+    wsd_docs = random_wsd_docs(300, seed=2)
+    rsis, starts = random_tokens(wsd_docs, seed=3)
+
+    # the csv of find_wordnet_sense.py --mentions has one row per unigram mention token, in rsi order
+    wsd_filepath = str(tmp_path / "wsd.csv")
+    with open(wsd_filepath, "w", newline="") as writer:
+        csv_writer = csv.writer(writer)
+        csv_writer.writerow(["rsi", "start", "sense"])
+        for rsi, start in sorted(set(zip(rsis, starts))):
+            csv_writer.writerow([rsi, start, wsd_docs[rsi][start]])
+    assert read_senses(wsd_filepath, rsis, starts) == [wsd_docs[rsi][start] for rsi, start in zip(rsis, starts)]
+
+    # tokens that are not in the csv have no sense
+    assert read_senses(wsd_filepath, [rsis[0], 10 ** 6], [starts[0], 0]) == [wsd_docs[rsis[0]][starts[0]], ""]
@@ -0,0 +1,186 @@
+import os
+import json
+import random
+import nltk
+import pandas as pd
+import pytest
+
+from find_mentions import ProfessionMatcher, find_mentions, find_mentions_streaming, mention_files
+from sentence_index import SentenceIndex
+from token_store import create_token_store
+from mention_store import read_mentions
+
+PROFESSIONS = [
+    ["police officer", "police officer", "police officers", "police officer", "police officer"],
+    ["officer", "officer", "officers", "officer", "officer"],
+    ["doctor", "doctor", "doctors", "doctor", "doctor"],
+    ["nurse", "nurse", "nurses", "nurse", "nurse"],
+    ["chief", "chief", "chiefs", "chief", "chief"],
+    ["editor-in-chief", "editor-in-chief", "editors-in-chief", "editor-in-chief", "editors-in-chief"],
+]
+
+WORDS = ["the", "police", "officer", "officers", "Officer", "doctor", "Doctor", "nurses", "chief", "editor", "-", \
+    "in", "editor-in-chief", "said", "(", ")", ":", "♪", "hello", "yes"]
+
+def create_gazetteer():
+    return pd.DataFrame(PROFESSIONS, columns=["word", "singular", "plural", "singular_key", "plural_key"])
+
+def sliding_window_match(row, text_tok):
+    """Profession match of the baseline `find_mentions`, which slides every tokenization of the profession over the
+    doc tokens
+    """
+    profession_toks = set([tuple(nltk.wordpunct_tokenize(row["singular"])), tuple(row["singular"].split()), \
+        tuple(nltk.wordpunct_tokenize(row["plural"])), tuple(row["plural"].split())])
+    match = set()
+    for tok in profession_toks:
+        for i in range(len(text_tok) - len(tok) + 1):
+            if [token.lower() for token in text_tok[i:i + len(tok)]] == list(tok):
+                match.add((i, i + len(tok)))
+    return match
+
+def random_docs(n_docs, seed=0):
+    rng = random.Random(seed)
+    return [[rng.choice(WORDS) for _ in range(rng.randint(1, 12))] for _ in range(n_docs)]
+
+def test_matcher_equals_sliding_window():
+    profession_df = create_gazetteer()
+    matcher = ProfessionMatcher(profession_df)
+    for text_tok in random_docs(500):
+        matches = matcher.match(text_tok)
+        for r, row in profession_df.iterrows():
+            assert matches.get(r, set()) == sliding_window_match(row, text_tok), (row["word"], text_tok)
+
+def tag(sentence):
+    """Whitespace tokenizer standing in for CoreNLP
+    """
+    doc, start = [], 0
+    for word in sentence.split():
+        doc.append(dict(lemma=word.lower(), word=word, start=start, end=start + len(word), pos="NN", ner="O"))
+        start += len(word) + 1
+    return doc
+
+def write_corpus(directory, n_docs=200, max_si_per_rsi=2, seed=1):
+    """Write the sentences, processed docs and sentence index dictionaries of a random corpus. Some sentences occur
+    in several files, and some exceed the maximum number of words.
+    """
+    rng = random.Random(seed)
+    sentences = list(dict.fromkeys(" ".join(text_tok) for text_tok in random_docs(n_docs, seed)))
+    profession_df = create_gazetteer()
+    keys = sorted(set(profession_df["singular_key"]) | set(profession_df["plural_key"]))
+    key_to_si, si_to_rsi, rsi_to_si, si_to_key = dict((key, []) for key in keys), {}, {}, {}
+    for rsi, sentence in enumerate(sentences):
+        rsi_to_si[str(rsi)] = []
+        for _ in range(rng.randint(1, max_si_per_rsi)):
+            imdb, sent = f"{rng.randint(0, 20):07d}", rng.randint(0, 1000)
+            if str(sent) in si_to_rsi.get(imdb, {}):
+                continue
+            si_to_rsi.setdefault(imdb, {})[str(sent)] = rsi
+            rsi_to_si[str(rsi)].append([imdb, sent])
+            si_keys = rng.sample(keys, rng.randint(1, 2))
+            si_to_key.setdefault(imdb, {})[str(sent)] = si_keys
+            for key in si_keys:
+                key_to_si[key].append([imdb, sent])
+
+    with open(os.path.join(directory, "sentences.txt"), "w") as writer:
+        writer.write("\n".join(sentences))
+    with open(os.path.join(directory, "processed.jsonl"), "w") as writer:
+        for sentence in sentences:
+            writer.write(json.dumps(tag(sentence)) + "\n")
+    profession_df.to_csv(os.path.join(directory, "inflection.csv"), index=False)
+    for name, dictionary in [("key_to_si", key_to_si), ("si_to_rsi", si_to_rsi), ("rsi_to_si", rsi_to_si), \
+        ("si_to_key", si_to_key)]:
+        json.dump(dictionary, open(os.path.join(directory, f"{name}.json"), "w"))
+
+def read_mention_rows(directory, filename):
+    df = pd.read_csv(os.path.join(directory, filename), dtype=str, keep_default_na=False)
+    return df, sorted(map(tuple, df.values.tolist()))
+
+def test_find_mentions_equals_streaming(tmp_path):
+    write_corpus(str(tmp_path))
+    filepaths = dict((name, str(tmp_path / filename)) for name, filename in [("k2s", "key_to_si.json"), \
+        ("s2r", "si_to_rsi.json"), ("r2s", "rsi_to_si.json"), ("s2k", "si_to_key.json"), ("sent", "sentences.txt"), \
+        ("proc", "processed.jsonl"), ("gzt", "inflection.csv")])
+    (tmp_path / "mentions").mkdir()
+    (tmp_path / "streaming").mkdir()
+    find_mentions(filepaths["k2s"], filepaths["s2r"], filepaths["sent"], filepaths["proc"], filepaths["gzt"], \
+        str(tmp_path / "mentions" / "prof_to_si.json"), str(tmp_path / "mentions"), 8)
+    find_mentions_streaming(filepaths["s2k"], filepaths["r2s"], filepaths["sent"], filepaths["proc"], \
+        filepaths["gzt"], str(tmp_path / "streaming" / "prof_to_si.json"), str(tmp_path / "streaming"), 8)
+
+    n_rows = 0
+    for filename, _ in mention_files.values():
+        df, rows = read_mention_rows(str(tmp_path / "mentions"), filename)
+        _, streaming_rows = read_mention_rows(str(tmp_path / "streaming"), filename)
+        assert rows == streaming_rows, filename
+        n_rows += len(rows)
+
+        # the rows are in gazetteer order
+        row_ids = df["profession"].map(dict((prof[0], r) for r, prof in enumerate(PROFESSIONS)))
+        assert row_ids.is_monotonic_increasing, filename
+    assert n_rows > 0
+
+    prof_to_si, streaming_prof_to_si = [json.load(open(str(tmp_path / directory / "prof_to_si.json"))) for \
+        directory in ["mentions", "streaming"]]
+    assert dict((prof, sorted(map(tuple, si_list))) for prof, si_list in prof_to_si.items()) == \
+        dict((prof, sorted(map(tuple, si_list))) for prof, si_list in streaming_prof_to_si.items())
+
+def run_streaming(directory, name, processed_filepath=None, **kwargs):
+    """Run `find_mentions_streaming` on the corpus of `write_corpus` and return the output directory
+    """
+    output_directory = os.path.join(directory, name)
+    os.makedirs(output_directory)
+    find_mentions_streaming(os.path.join(directory, "si_to_key.json"), os.path.join(directory, "rsi_to_si.json"), \
+        os.path.join(directory, "sentences.txt"), processed_filepath or os.path.join(directory, "processed.jsonl"), \
+        os.path.join(directory, "inflection.csv"), os.path.join(output_directory, "prof_to_si.json"), \
+        output_directory, 8, **kwargs)
+    return output_directory
+
+def read_outputs(output_directory):
+    return dict((filename, open(os.path.join(output_directory, filename), "rb").read()) for filename in \
+        [filename for filename, _ in mention_files.values()] + ["prof_to_si.json"])
+
+def test_streaming_with_sentence_index_equals_dictionaries(tmp_path):
+    write_corpus(str(tmp_path))
+    index = SentenceIndex.from_key_to_si(json.load(open(tmp_path / "key_to_si.json")))
+    si_to_rsi = json.load(open(tmp_path / "si_to_rsi.json"))
+    index.set_rsi([si_to_rsi[imdb][str(sent)] for imdb, sent in zip(index.imdbs[index.si_imdb], \
+        index.si_sent.tolist())], len(json.load(open(tmp_path / "rsi_to_si.json"))))
+    index.save(str(tmp_path / "sentence_index"))
+
+    dictionary_directory = run_streaming(str(tmp_path), "dictionaries")
+    index_directory = run_streaming(str(tmp_path), "index", index_dir=str(tmp_path / "sentence_index"))
+    for filename, _ in mention_files.values():
+        assert read_mention_rows(index_directory, filename)[1] == read_mention_rows(dictionary_directory, filename)[1]
+
+def test_sharded_streaming_equals_serial(tmp_path):
+    write_corpus(str(tmp_path))
+    create_token_store(str(tmp_path / "processed.jsonl"), str(tmp_path / "token_store"))
+    serial_outputs = read_outputs(run_streaming(str(tmp_path), "serial"))
+    assert serial_outputs == read_outputs(run_streaming(str(tmp_path), "sharded", n_workers=2, chunk_size=7))
+    assert serial_outputs == read_outputs(run_streaming(str(tmp_path), "sharded_token_store", \
+        str(tmp_path / "token_store"), n_workers=2, chunk_size=7))
+    assert not os.path.exists(tmp_path / "sharded" / "shards")
+
+def test_parquet_mention_files_equal_csv(tmp_path):
+    pytest.importorskip("pyarrow")
+    write_corpus(str(tmp_path))
+    for name, parquet in [("csv", False), ("parquet", True)]:
+        (tmp_path / name).mkdir()
+        find_mentions(str(tmp_path / "key_to_si.json"), str(tmp_path / "si_to_rsi.json"), \
+            str(tmp_path / "sentences.txt"), str(tmp_path / "processed.jsonl"), str(tmp_path / "inflection.csv"), \
+            str(tmp_path / name / "prof_to_si.json"), str(tmp_path / name), 8, parquet=parquet)
+    streaming_directory = run_streaming(str(tmp_path), "streaming", parquet=True)
+
+    for filename, _ in mention_files.values():
+        parquet_filename = filename.replace(".csv", ".parquet")
+        assert not os.path.exists(os.path.join(streaming_directory, filename))
+        csv_df = read_mentions(str(tmp_path / "csv" / filename), categorical=False)
+        parquet_df = read_mentions(str(tmp_path / "parquet" / parquet_filename), categorical=False)
+        pd.testing.assert_frame_equal(parquet_df, csv_df, check_dtype=False)
+
+        # the streaming parquet mentions are in gazetteer order
+        streaming_df = read_mentions(os.path.join(streaming_directory, parquet_filename), categorical=False)
+        assert sorted(map(tuple, streaming_df.fillna("").astype(str).values.tolist())) == \
+            sorted(map(tuple, csv_df.fillna("").astype(str).values.tolist()))
+        row_ids = streaming_df["profession"].map(dict((prof[0], r) for r, prof in enumerate(PROFESSIONS)))
+        assert row_ids.is_monotonic_increasing, filename
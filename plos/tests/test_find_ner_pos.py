@@ -0,0 +1,87 @@
+import re
+import json
+import pytest
+
+pytest.importorskip("stanza")
+
+import find_ner_pos
+from find_ner_pos import annotate_texts
+
+class FakeCoreNLPClient:
+    """Tokenizes at whitespace and punctuation and splits sentences after ".", "!" and "?", like CoreNLP. Newlines
+    are sentence breaks only if `ssplit.newlineIsSentenceBreak` is "always", and the only sentence breaks if
+    `ssplit.eolonly` is "true". The POS tag of a token is its index in its sentence, so the tags depend on the
+    sentence splitting.
+    """
+
+    def annotate(self, text, properties=None):
+        properties = properties or {}
+        eolonly = properties.get("ssplit.eolonly") == "true"
+        newline_break = eolonly or properties.get("ssplit.newlineIsSentenceBreak") == "always"
+        sentences, tokens = [], []
+        for match in re.finditer(r"\w+|[^\w\s]|\n", text):
+            word = match.group()
+            if word == "\n":
+                if newline_break and tokens:
+                    sentences.append(dict(tokens=tokens))
+                    tokens = []
+                continue
+            tokens.append(dict(lemma=word.lower(), originalText=word, characterOffsetBegin=match.start(), \
+                characterOffsetEnd=match.end(), pos=str(len(tokens)), ner="O"))
+            if word in ".!?" and not eolonly:
+                sentences.append(dict(tokens=tokens))
+                tokens = []
+        if tokens:
+            sentences.append(dict(tokens=tokens))
+        return dict(sentences=sentences)
+
+def annotate_line(client, text):
+    return [dict(lemma=token["lemma"], word=token["originalText"], start=token["characterOffsetBegin"], \
+        end=token["characterOffsetEnd"], pos=token["pos"], ner=token["ner"]) \
+            for sentence in client.annotate(text)["sentences"] for token in sentence["tokens"]]
+
+def test_multi_sentence_line_is_annotated_as_alone():
+    client = FakeCoreNLPClient()
+    texts = ["Stop. Police!", "call the doctor", "Nurse? Yes. Hurry"]
+    docs = annotate_texts(client, texts)
+    assert docs == [annotate_line(client, text) for text in texts]
+    assert [token["pos"] for token in docs[0]] == ["0", "1", "0", "1"]
+    assert [(token["start"], token["end"]) for token in docs[2]] == [(0, 5), (5, 6), (7, 10), (10, 11), (12, 17)]
+
+class FakeServer:
+    """Context manager of a fake CoreNLP server, that fails to start on the ports in `failing_ports`
+    """
+
+    failing_ports = set()
+
+    def __init__(self, endpoint=None, stderr=None, **kwargs):
+        self.port = int(endpoint.rsplit(":", 1)[1])
+        stderr.close()
+
+    def __enter__(self):
+        if self.port in self.failing_ports:
+            raise PermissionError(f"port {self.port} is in use")
+        return FakeCoreNLPClient()
+
+    def __exit__(self, *args):
+        return False
+
+def test_worker_error_is_raised(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(find_ner_pos, "CoreNLPClient", FakeServer)
+    monkeypatch.setattr(FakeServer, "failing_ports", {12346})
+    sentences_filepath = str(tmp_path / "sentences.txt")
+    sentences = [f"the doctor {i} said hello." for i in range(40)]
+    with open(sentences_filepath, "w") as writer:
+        writer.write("\n".join(sentences))
+
+    with pytest.raises(PermissionError, match="port 12346"):
+        find_ner_pos.process_sentences_dynamic(sentences_filepath, 2, 5, 100, str(tmp_path / "processed"))
+    assert not (tmp_path / "processed" / "processed_finegrained.jsonl").exists()
+
+    # the worker that started tagged all the chunks, and a rerun merges them
+    monkeypatch.setattr(FakeServer, "failing_ports", set())
+    find_ner_pos.process_sentences_dynamic(sentences_filepath, 2, 5, 100, str(tmp_path / "processed"))
+    client = FakeCoreNLPClient()
+    docs = [json.loads(line) for line in open(tmp_path / "processed" / "processed_finegrained.jsonl")]
+    assert docs == [annotate_line(client, sentence) for sentence in sentences]
@@ -0,0 +1,271 @@
+import json
+import zlib
+import sqlite3
+import random
+import numpy as np
+import pandas as pd
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("ewiser")
+
+import find_wordnet_sense
+from find_wordnet_sense import CandidateTable, select_synsets, make_offset, wnpos, find_wsd
+from token_store import create_token_store
+
+def crc(text):
+    return zlib.crc32(text.encode())
+
+class FakeSynset:
+    def __init__(self, lemma, pos, i):
+        self._name, self._pos = f"{lemma}.{pos}.{i + 1:02d}", pos
+
+    def name(self):
+        return self._name
+
+    def offset(self):
+        return crc(self._name) % 10 ** 8
+
+    def pos(self):
+        return self._pos
+
+class FakeWordNet:
+    """Returns 0 to 3 synsets per lemma and POS, and counts the lookups
+    """
+
+    def __init__(self):
+        self.n_lookups = 0
+
+    def synsets(self, lemma, pos=None):
+        self.n_lookups += 1
+        return [FakeSynset(lemma, p, i) for p in "nvar" if pos in [None, p] for i in range(crc(lemma + p) % 4)]
+
+class FakeOutputDictionary:
+    """Maps some offsets to the same output index, so that candidates can share a logit
+    """
+
+    n_outputs = 50
+
+    def index(self, offset):
+        return 2 + crc(offset) % (self.n_outputs - 2)
+
+class FakeDictionary:
+    pad_index = 1
+
+    @staticmethod
+    def load(filepath):
+        return FakeDictionary()
+
+    def index(self, word):
+        return 2 + crc(word) % 40
+
+class FakeResourceManager:
+    @staticmethod
+    def get_offsets_dictionary():
+        return FakeOutputDictionary()
+
+class FakeModel(torch.nn.Module):
+    """Integer logits that depend on the token and the sum of the tokens of the sentence, so they do not depend on
+    the padding or the batch, and often tie
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.weight = torch.nn.Parameter(torch.zeros(1))
+
+    @classmethod
+    def build_model(cls, args, task):
+        return cls()
+
+    def forward(self, src_tokens, src_tokens_str=None):
+        assert src_tokens.shape[1] > 0, "empty batch"
+        context = (src_tokens * (src_tokens != FakeDictionary.pad_index)).sum(dim=1, keepdim=True)
+        outputs = torch.arange(FakeOutputDictionary.n_outputs)
+        logits = (src_tokens[:, :, None] * 31 + context[:, :, None] * 7 + outputs * 13) % 5
+        return logits.float(), None
+
+@pytest.fixture
+def fake_wordnet(monkeypatch):
+    wordnet = FakeWordNet()
+    monkeypatch.setattr(find_wordnet_sense, "wn", wordnet)
+    return wordnet
+
+@pytest.fixture
+def fake_ewiser(monkeypatch, fake_wordnet, tmp_path):
+    monkeypatch.setattr(find_wordnet_sense, "Dictionary", FakeDictionary)
+    monkeypatch.setattr(find_wordnet_sense, "ResourceManager", FakeResourceManager)
+    monkeypatch.setattr(find_wordnet_sense, "LinearTaggerModel", FakeModel)
+    checkpoint_filepath = str(tmp_path / "checkpoint.pt")
+    torch.save({"args": None, "model": FakeModel().state_dict()}, checkpoint_filepath)
+    return checkpoint_filepath
+
+def random_docs(n_docs, seed=0):
+    rng = random.Random(seed)
+    lemmas = [f"w{i}" for i in range(30)] + ["Doctor", "doctor"]
+    docs = []
+    for i in range(n_docs):
+        doc = []
+        for _ in range(rng.choice([0, 1, 2, 5, 9, 17]) if i % 10 else 0):
+            lemma = rng.choice(lemmas)
+            doc.append(dict(lemma=lemma, word=lemma.upper() if rng.random() < 0.3 else lemma, start=0, end=0, \
+                pos=rng.choice(["NN", "NNS", "VB", "VBD", "JJ", "RB", "DT"]), ner="O"))
+        docs.append(doc)
+    return docs
+
+def baseline_wsd(docs, use_pos):
+    """Synset names of the baseline `find_wsd`: the first best candidate of each token by `torch.max`
+    """
+    wordnet, dictionary, output_dictionary, model = FakeWordNet(), FakeDictionary(), FakeOutputDictionary(), \
+        FakeModel()
+    synsets_lists = []
+    for doc in docs:
+        if not doc:
+            synsets_lists.append([])
+            continue
+        logits, _ = model(src_tokens=torch.LongTensor([[dictionary.index(word["word"]) for word in doc]]))
+        synsets_list = []
+        for j, word in enumerate(doc):
+            pos = wnpos.get(word["pos"][:2])
+            word_synsets = wordnet.synsets(word["lemma"].lower(), pos) if pos and use_pos else \
+                wordnet.synsets(word["lemma"].lower())
+            synsets_list.append("")
+            if word_synsets:
+                output_indices = [output_dictionary.index(make_offset(synset)) for synset in word_synsets]
+                synsets_list[-1] = word_synsets[torch.max(logits[0, j][output_indices], -1).indices.item()].name()
+        synsets_lists.append(synsets_list)
+    return synsets_lists
+
+def write_docs(tmp_path, docs):
+    processed_filepath = str(tmp_path / "processed.jsonl")
+    with open(processed_filepath, "w") as writer:
+        for doc in docs:
+            writer.write(json.dumps(doc) + "\n")
+    return processed_filepath
+
+def read_jsonl(filepath):
+    return [json.loads(line) for line in open(filepath)]
+
+def test_candidate_table(fake_wordnet, tmp_path):
+    candidates = CandidateTable(FakeOutputDictionary())
+    pairs = [(f"w{i % 40}", [None, "n", "v", "a", "r"][i % 5]) for i in range(2000)]
+    for lemma, pos in pairs:
+        c = candidates.find(lemma, pos)
+        synsets = FakeWordNet().synsets(lemma, pos)
+        start, end = candidates.offsets[c], candidates.offsets[c + 1]
+        assert candidates.names[start: end] == [synset.name() for synset in synsets]
+        assert candidates.output_indices[start: end].tolist() == [FakeOutputDictionary().index(make_offset(synset)) \
+            for synset in synsets]
+    assert fake_wordnet.n_lookups == len(set(pairs)) == len(candidates)
+
+    # save and load, and merge the entries of another table
+    candidates.save(str(tmp_path / "candidates.npz"))
+    loaded_candidates = CandidateTable.load(str(tmp_path / "candidates.npz"), FakeOutputDictionary())
+    assert loaded_candidates.entries() == candidates.entries()
+    other_candidates = CandidateTable(FakeOutputDictionary())
+    for lemma, pos in pairs[::-7]:
+        other_candidates.find(lemma, pos)
+    other_candidates.merge(candidates.entries())
+    assert sorted(other_candidates.entries()) == sorted(candidates.entries())
+
+def test_select_synsets_equals_first_max(fake_wordnet):
+    candidates = CandidateTable(FakeOutputDictionary())
+    rng = np.random.default_rng(0)
+    lengths = [0, 3, 7, 1, 12]
+    logits = rng.integers(0, 3, size=(len(lengths), max(lengths), FakeOutputDictionary.n_outputs)).astype(np.float32)
+    batch_candidate_ids = [np.array([candidates.find(f"w{rng.integers(40)}", None) if rng.random() < 0.8 else -1 \
+        for _ in range(length)], dtype=np.int64) for length in lengths]
+
+    batch_synsets = select_synsets(logits, lengths, batch_candidate_ids, candidates)
+    for i, candidate_ids in enumerate(batch_candidate_ids):
+        assert len(batch_synsets[i]) == lengths[i]
+        for j, c in enumerate(candidate_ids.tolist()):
+            start, end = candidates.offsets[c], candidates.offsets[c + 1]
+            if c < 0 or start == end:
+                assert batch_synsets[i][j] == ""
+            else:
+                values = torch.from_numpy(logits[i, j][candidates.output_indices[start: end]])
+                assert batch_synsets[i][j] == candidates.names[start + torch.max(values, -1).indices.item()]
+
+@pytest.mark.parametrize("max_tokens", [None, 40])
+def test_pos_and_nopos_in_one_pass(fake_ewiser, tmp_path, max_tokens):
+    docs = random_docs(120)
+    processed_filepath = write_docs(tmp_path, docs)
+    wsd_filepath, nopos_wsd_filepath = str(tmp_path / "wsd.jsonl"), str(tmp_path / "wsd.nopos.jsonl")
+    find_wsd(processed_filepath, fake_ewiser, wsd_filepath, "cpu", 8, max_tokens=max_tokens, window_size=25, \
+        nopos_wsd_filepath=nopos_wsd_filepath)
+    assert read_jsonl(wsd_filepath) == baseline_wsd(docs, True)
+    assert read_jsonl(nopos_wsd_filepath) == baseline_wsd(docs, False)
+    assert read_jsonl(nopos_wsd_filepath) != read_jsonl(wsd_filepath)
+
+@pytest.mark.parametrize("n_workers", [1, 2])
+def test_cached_wsd_equals_baseline(fake_ewiser, tmp_path, n_workers):
+    docs = random_docs(150, seed=3)
+    docs += docs[:40]
+    processed_filepath = write_docs(tmp_path, docs)
+    cache_filepath = str(tmp_path / "cache.sqlite")
+    for run in range(2):
+        wsd_filepath = str(tmp_path / f"wsd.{run}.jsonl")
+        find_wsd(processed_filepath, fake_ewiser, wsd_filepath, "cpu", 8, window_size=30, n_workers=n_workers, \
+            cache_filepath=cache_filepath, cache_top_k=4)
+        assert read_jsonl(wsd_filepath) == baseline_wsd(docs, True)
+
+    # the sentences put by the workers are committed
+    connection = sqlite3.connect(cache_filepath)
+    assert connection.execute("select count(*) from logits").fetchone()[0] == len(set(json.dumps([word["word"] for \
+        word in doc]) for doc in docs if doc))
+    connection.close()
+
+@pytest.mark.parametrize("window_size, max_tokens, n_workers, token_store", [(1000, None, 1, False), \
+    (7, None, 1, False), (25, 30, 1, True), (25, None, 2, False), (9, 30, 2, True)])
+def test_wsd_equals_baseline(fake_ewiser, tmp_path, window_size, max_tokens, n_workers, token_store):
+    docs = random_docs(130, seed=4)
+    processed_filepath = write_docs(tmp_path, docs)
+    if token_store:
+        create_token_store(processed_filepath, str(tmp_path / "token_store"))
+        processed_filepath = str(tmp_path / "token_store")
+    candidates_filepath = str(tmp_path / "candidates.npz")
+
+    # the second run loads the candidate table saved by the first
+    for run in range(2):
+        wsd_filepath = str(tmp_path / f"wsd.{run}.jsonl")
+        find_wsd(processed_filepath, fake_ewiser, wsd_filepath, "cpu", 8, max_tokens=max_tokens, \
+            window_size=window_size, n_workers=n_workers, candidates_filepath=candidates_filepath)
+        assert read_jsonl(wsd_filepath) == baseline_wsd(docs, True)
+
+def write_mentions_csv(tmp_path, docs, seed=5):
+    """Writes unigram and bigram mentions of random tokens, some repeated, and returns the sorted (rsi, start) pairs
+    of the unigram mentions
+    """
+    rng = random.Random(seed)
+    rows = [[rsi, start, start + rng.choice([1, 1, 2])] for rsi, doc in enumerate(docs) if doc and rng.random() < 0.4 \
+        for start in rng.sample(range(len(doc)), min(len(doc), 2))]
+    rows += rng.sample(rows, len(rows) // 5)
+    rng.shuffle(rows)
+    mentions_filepath = str(tmp_path / "mentions.csv")
+    pd.DataFrame(rows, columns=["rsi", "start", "end"]).to_csv(mentions_filepath, index=False)
+    return mentions_filepath, sorted(set((rsi, start) for rsi, start, end in rows if end - start == 1))
+
+@pytest.mark.parametrize("token_store", [False, True])
+def test_mention_wsd_equals_baseline(fake_ewiser, tmp_path, token_store):
+    docs = random_docs(150, seed=6)
+    processed_filepath = write_docs(tmp_path, docs)
+    if token_store:
+        create_token_store(processed_filepath, str(tmp_path / "token_store"))
+        processed_filepath = str(tmp_path / "token_store")
+    mentions_filepath, tokens = write_mentions_csv(tmp_path, docs)
+    wsd_filepath, nopos_wsd_filepath = str(tmp_path / "wsd.csv"), str(tmp_path / "wsd.nopos.csv")
+    find_wsd(processed_filepath, fake_ewiser, wsd_filepath, "cpu", 8, window_size=10, \
+        mentions_filepath=mentions_filepath, nopos_wsd_filepath=nopos_wsd_filepath)
+    for filepath, use_pos in [(wsd_filepath, True), (nopos_wsd_filepath, False)]:
+        synsets_lists = baseline_wsd(docs, use_pos)
+        wsd_df = pd.read_csv(filepath, keep_default_na=False, dtype={"sense": str})
+        assert list(map(tuple, wsd_df.values.tolist())) == [(rsi, start, synsets_lists[rsi][start]) for rsi, start \
+            in tokens]
+
+def test_mention_wsd_of_short_processed_file_raises(fake_ewiser, tmp_path):
+    docs = random_docs(150, seed=7)
+    mentions_filepath, _ = write_mentions_csv(tmp_path, docs)
+    processed_filepath = write_docs(tmp_path, docs[:100])
+    with pytest.raises(RuntimeError, match="incomplete"):
+        find_wsd(processed_filepath, fake_ewiser, str(tmp_path / "wsd.csv"), "cpu", 8, \
+            mentions_filepath=mentions_filepath)
@@ -0,0 +1,52 @@
+import json
+import random
+import pytest
+
+pytest.importorskip("pattern.text.en")
+pytest.importorskip("whoosh")
+
+from key_to_si import PostingBuffer, search_native
+from subtitle_index import create_subtitle_index
+from sentence_index import SentenceIndex
+
+def test_posting_buffer_equals_sorted_set():
+    rng = random.Random(0)
+    imdbs = [f"{rng.randint(0, 10 ** 7):07d}" for _ in range(30)]
+    hits = [(rng.randint(0, 20), rng.choice(imdbs), rng.randint(0, 50)) for _ in range(3000)]
+    buffer = PostingBuffer()
+    for i in range(0, len(hits), 250):
+        buffer.add(*zip(*hits[i: i + 250]))
+    key_ids, imdbs, sents = buffer.postings()
+    assert list(zip(key_ids.tolist(), imdbs.tolist(), sents.tolist())) == sorted(set(hits))
+
+def test_empty_posting_buffer():
+    key_ids, imdbs, sents = PostingBuffer().postings()
+    assert len(key_ids) == len(imdbs) == len(sents) == 0
+
+def test_search_native(tmp_path):
+    subtitle_directory = tmp_path / "text"
+    subtitle_directory.mkdir()
+    texts = {"0000002": "a police officer\nthe doctors\nhello", "0000001": "doctor\nofficer yes\nthe police officer"}
+    for imdb, text in texts.items():
+        (subtitle_directory / f"{imdb}.txt").write_text(text)
+    profession_filepath = tmp_path / "inflection.csv"
+    profession_filepath.write_text("word,singular,plural,singular_key,plural_key\n"
+        "police officer,police officer,police officers,police officer,police officer\n"
+        "officer,officer,officers,officer,officer\ndoctor,doctor,doctors,doctor,doctors\n")
+    subtitle_index_filepath = str(tmp_path / "subtitle_index.npz")
+    create_subtitle_index(str(subtitle_directory), subtitle_index_filepath, n_workers=1)
+
+    search_native(subtitle_index_filepath, str(profession_filepath), str(tmp_path / "key_to_si.json"), \
+        str(tmp_path / "si_to_key.json"))
+    key_to_si = json.load(open(tmp_path / "key_to_si.json"))
+    # the terms are singularized, so a singular key and its plural key match the same sentences
+    assert key_to_si == {"doctor": [["0000001", 0], ["0000002", 1]], "doctors": [["0000001", 0], ["0000002", 1]], \
+        "officer": [["0000001", 1], ["0000001", 2], ["0000002", 0]], "police officer": [["0000001", 2], \
+        ["0000002", 0]]}
+    assert json.load(open(tmp_path / "si_to_key.json")) == {"0000001": {"0": ["doctor", "doctors"], \
+        "1": ["officer"], "2": ["officer", "police officer"]}, "0000002": {"0": ["officer", "police officer"], \
+        "1": ["doctor", "doctors"]}}
+
+    search_native(subtitle_index_filepath, str(profession_filepath), None, None, index_dir=str(tmp_path / "index"))
+    index = SentenceIndex.load(str(tmp_path / "index"))
+    assert dict((key, [[imdb, sent] for imdb, sent, _ in index.key_si(key)]) for key in index.keys) == key_to_si
@@ -0,0 +1,86 @@
+import sqlite3
+import numpy as np
+import pytest
+
+from logit_cache import LogitCache
+
+def top_k(logits, k, rng):
+    """Top-k output indices and logits of each token, with the ties at the k-th logit broken at random as
+    `torch.topk` may break them
+    """
+    order = np.lexsort((rng.random(logits.shape), -logits), axis=-1)[..., :k]
+    return order, np.take_along_axis(logits, order, axis=-1)
+
+@pytest.mark.parametrize("n_outputs", [6, 40])
+def test_best_equals_first_max_of_all_logits(tmp_path, n_outputs):
+    cache = LogitCache(str(tmp_path / "cache.sqlite"), "checkpoint", top_k=8)
+    rng = np.random.default_rng(0)
+    logits = rng.integers(0, 6, size=(3000, n_outputs)).astype(np.float32)
+    indices, top_logits = top_k(logits, cache.top_k, rng)
+    n_exact = 0
+    for j in range(len(logits)):
+        output_indices = rng.choice(n_outputs, size=rng.integers(1, 6), replace=False)
+        best = cache.best(indices[j], top_logits[j], output_indices)
+        if best is not None:
+            assert best == np.argmax(logits[j, output_indices])
+            n_exact += 1
+        else:
+            assert n_outputs > cache.top_k
+    assert 0 < n_exact < len(logits) if n_outputs > cache.top_k else n_exact == len(logits)
+
+def random_batch(rng, n_sentences, top_k=4):
+    lengths = rng.integers(1, 6, size=n_sentences).tolist()
+    indices = rng.integers(0, 100, size=(n_sentences, max(lengths), top_k))
+    logits = rng.random((n_sentences, max(lengths), top_k)).astype(np.float32)
+    keys = [LogitCache.key([f"w{x}" for x in rng.integers(0, 1000, size=3)]) for _ in range(n_sentences)]
+    return keys, indices, logits, lengths
+
+def count_rows(filepath):
+    connection = sqlite3.connect(filepath)
+    n_rows = connection.execute("select count(*) from logits").fetchone()[0]
+    connection.close()
+    return n_rows
+
+def test_put_get_and_commit(tmp_path):
+    filepath = str(tmp_path / "cache.sqlite")
+    cache = LogitCache(filepath, "checkpoint", top_k=4, commit_every=3)
+    rng = np.random.default_rng(1)
+    batches = [random_batch(rng, 10) for _ in range(4)]
+    for batch in batches[:2]:
+        cache.put(*batch)
+    assert len(cache) == 20
+    assert count_rows(filepath) == 0
+
+    # the puts are committed every commit_every puts and at close
+    cache.put(*batches[2])
+    assert count_rows(filepath) == 30
+    cache.put(*batches[3])
+    cache.put(*batches[0])
+    assert len(cache) == 40
+    cache.close()
+    assert count_rows(filepath) == 40
+
+    reopened_cache = LogitCache(filepath, "checkpoint", top_k=4)
+    assert len(reopened_cache) == 40
+    keys, indices, logits, lengths = batches[1]
+    entries = reopened_cache.get(keys + [LogitCache.key(["missing"])])
+    assert sorted(entries) == sorted(keys)
+    for i, key in enumerate(keys):
+        assert np.array_equal(entries[key][0], indices[i, :lengths[i]])
+        assert np.array_equal(entries[key][1], logits[i, :lengths[i]])
+    reopened_cache.close()
+
+    # another checkpoint clears the cache
+    assert len(LogitCache(filepath, "other checkpoint", top_k=4)) == 0
+
+def test_evict_least_recently_used(tmp_path):
+    cache = LogitCache(str(tmp_path / "cache.sqlite"), "checkpoint", top_k=4, max_entries=25, evict_every=100)
+    rng = np.random.default_rng(2)
+    batches = [random_batch(rng, 10) for _ in range(3)]
+    for batch in batches:
+        cache.put(*batch)
+    cache.get(batches[0][0])
+    cache.evict()
+    assert len(cache) == count_rows(cache.filepath) == 25
+    assert sorted(cache.get(batches[0][0] + batches[2][0])) == sorted(batches[0][0] + batches[2][0])
+    assert len(cache.get(batches[1][0])) == 5
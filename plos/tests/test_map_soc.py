@@ -0,0 +1,72 @@
+import random
+import numpy as np
+import pandas as pd
+import pytest
+from collections import defaultdict
+
+from map_soc import map_profession_to_soc, soc_names
+from mention_store import read_mentions
+
+def baseline_map(map_df, soc_df, mentions_df, professions_df):
+    """soc code, soc name and merged profession of the mentions and merged profession of the professions by the
+    baseline loop over the map rows, in which later map rows overwrite earlier ones
+    """
+    soc_dict = defaultdict(set)
+    for soc_code, title in zip(soc_df["2018 SOC Code"], soc_df["2018 SOC Direct Match Title"]):
+        soc_dict[title.lower().strip()].add(int(soc_code[:2]))
+    profession_arr, profession_arr_2 = mentions_df.profession.values, professions_df.profession.values
+    sense_arr = mentions_df.no_pos_sense.values
+    soc_code_arr = np.full(len(mentions_df), "", dtype=object)
+    soc_name_arr = np.full(len(mentions_df), "", dtype=object)
+    merge_arr, merge_arr_2 = profession_arr.copy(), profession_arr_2.copy()
+    for row in map_df.itertuples(index=False):
+        merge_arr[profession_arr == row.profession] = row.profession_merge
+        merge_arr_2[profession_arr_2 == row.profession] = row.profession_merge
+        soc_codes = set()
+        for soc in [row.primary_soc, row.secondary_soc]:
+            if pd.notna(soc) and soc != "Can't Say" and soc != "General":
+                soc_codes.add(int(soc[:2]))
+        soc_codes = list(soc_codes | soc_dict[row.profession])
+        mask = profession_arr == row.profession
+        if pd.notna(row.sense_name):
+            mask &= sense_arr == row.sense_name
+        soc_code_arr[mask] = ";".join([str(x) for x in soc_codes])
+        soc_name_arr[mask] = ";".join([soc_names[(x - 11)//2] for x in soc_codes])
+    return soc_code_arr.tolist(), soc_name_arr.tolist(), merge_arr.tolist(), merge_arr_2.tolist()
+
+@pytest.mark.parametrize("extension", ["csv", "parquet"])
+def test_map_soc_equals_baseline(tmp_path, extension):
+    if extension == "parquet":
+        pytest.importorskip("pyarrow")
+    rng = random.Random(0)
+    professions = [f"profession {i}" for i in range(30)]
+    senses = [None, "a.n.01", "b.n.01", "c.n.02"]
+    socs = [None, "Can't Say", "General", "11-1011", "29-1141", "33-3051", "53-3032"]
+    map_df = pd.DataFrame([[profession, rng.choice(professions + [profession] * 10), rng.choice(senses), \
+        rng.choice(socs), rng.choice(socs)] for profession in rng.choices(professions[:25], k=60)], \
+        columns=["profession", "profession_merge", "sense_name", "primary_soc", "secondary_soc"])
+    soc_df = pd.DataFrame([[rng.choice(socs[3:]), f" {profession.title()} "] for profession in \
+        rng.sample(professions, 10)], columns=["2018 SOC Code", "2018 SOC Direct Match Title"])
+    mentions_df = pd.DataFrame({"id": range(1000), "profession": rng.choices(professions, k=1000), "imdb": \
+        rng.choices(range(100), k=1000), "no_pos_sense": rng.choices(senses + ["d.n.01"], k=1000)})
+    professions_df = pd.DataFrame({"profession": professions, "n_mentions": range(30)})
+    map_df.to_csv(tmp_path / "map.csv", index=False)
+    soc_df.to_csv(tmp_path / "soc.csv", index=False)
+    mentions_df.to_csv(tmp_path / "mentions.csv", index=False)
+    professions_df.to_csv(tmp_path / "professions.csv", index=False)
+
+    out_mentions_file = str(tmp_path / f"out_mentions.{extension}")
+    map_profession_to_soc(str(tmp_path / "map.csv"), str(tmp_path / "soc.csv"), str(tmp_path / "mentions.csv"), \
+        str(tmp_path / "professions.csv"), out_mentions_file, str(tmp_path / "out_professions.csv"))
+    out_mentions_df = read_mentions(out_mentions_file, dtype={"soc_code":str, "soc_name":str}, categorical=False)\
+        .sort_values("id")
+    out_professions_df = pd.read_csv(tmp_path / "out_professions.csv")
+
+    # the empty soc codes and names of the baseline are read as missing values
+    soc_code_list, soc_name_list, merge_list, merge_list_2 = baseline_map(map_df, soc_df, \
+        pd.read_csv(tmp_path / "mentions.csv"), professions_df)
+    assert out_mentions_df.soc_code.fillna("").tolist() == soc_code_list
+    assert out_mentions_df.soc_name.fillna("").tolist() == soc_name_list
+    assert out_mentions_df.profession_merge.tolist() == merge_list
+    assert out_professions_df.profession_merge.tolist() == merge_list_2
+    assert 0 < soc_code_list.count("") < len(soc_code_list)
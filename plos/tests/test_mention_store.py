@@ -0,0 +1,71 @@
+import random
+import pandas as pd
+import pytest
+
+pytest.importorskip("pyarrow")
+
+from mention_store import read_mentions, write_mentions, categorical_columns
+from filter_mentions_by_sense import filter_mentions_by_sense
+
+def random_mentions(n_mentions, seed=0):
+    rng = random.Random(seed)
+    professions = [f"profession {i}" for i in range(1600)]
+    rows = []
+    for _ in range(n_mentions):
+        profession = rng.choice(professions)
+        rows.append([profession, f"{rng.randint(0, 10 ** 7):07d}", rng.randint(0, 500), rng.randint(0, 10 ** 6), \
+            rng.choice(["", "the", "hey , the"]), profession, rng.choice(["", "said", "is here ."]), \
+            rng.choice(["", "doctor.n.01", "nurse.n.01"]), int(rng.random() < 0.8)])
+    return pd.DataFrame(rows, columns=["profession", "imdb", "sent", "rsi", "left", "mention", "right", "no_pos_sense", \
+        "is_nopos_profession"]), professions
+
+@pytest.fixture
+def mention_files(tmp_path):
+    mentions_df, professions = random_mentions(8000)
+    csv_filepath, parquet_filepath = str(tmp_path / "mentions.csv"), str(tmp_path / "mentions.parquet")
+    write_mentions(mentions_df, csv_filepath)
+    write_mentions(mentions_df, parquet_filepath, row_group_size=100)
+    return csv_filepath, parquet_filepath, professions
+
+def test_parquet_equals_csv(mention_files):
+    csv_filepath, parquet_filepath, _ = mention_files
+    csv_df = read_mentions(csv_filepath, categorical=False)
+    parquet_df = read_mentions(parquet_filepath, categorical=False)
+    pd.testing.assert_frame_equal(parquet_df, csv_df, check_dtype=False)
+
+    # the categorical columns are categoricals by default, for csv and parquet
+    for filepath in [csv_filepath, parquet_filepath]:
+        mentions_df = read_mentions(filepath)
+        for column in mentions_df.columns:
+            assert isinstance(mentions_df[column].dtype, pd.CategoricalDtype) == (column in categorical_columns)
+        pd.testing.assert_frame_equal(mentions_df.astype(object), csv_df.astype(object))
+
+@pytest.mark.parametrize("filters", [[("profession", "in", ["profession 3", "profession 17", "profession 100"])], \
+    [("is_nopos_profession", "==", 1), ("no_pos_sense", "!=", "nurse.n.01")], [("rsi", ">=", 500000)]])
+def test_columns_and_filters(mention_files, filters):
+    csv_filepath, parquet_filepath, _ = mention_files
+    csv_df = read_mentions(csv_filepath, categorical=False)
+    mask = pd.Series(True, index=csv_df.index)
+    for column, op, value in filters:
+        if op == "in":
+            mask &= csv_df[column].isin(value)
+        else:
+            # missing values satisfy no comparison
+            mask &= {"==": csv_df[column].eq, "!=": csv_df[column].ne, ">=": csv_df[column].ge}[op](value) & \
+                csv_df[column].notna()
+    expected_df = csv_df.loc[mask, ["imdb", "rsi"]].reset_index(drop=True)
+    assert 0 < len(expected_df) < len(csv_df)
+    for filepath in [csv_filepath, parquet_filepath]:
+        pd.testing.assert_frame_equal(read_mentions(filepath, columns=["imdb", "rsi"], filters=filters), expected_df, \
+            check_dtype=False)
+
+def test_filter_mentions_by_sense_of_parquet_equals_csv(mention_files, tmp_path):
+    csv_filepath, parquet_filepath, professions = mention_files
+    pd.DataFrame({"profession": professions, "n_mentions": 0}).to_csv(tmp_path / "professions.csv", index=False)
+    for filepath in [csv_filepath, parquet_filepath]:
+        name = "parquet" if filepath.endswith(".parquet") else "csv"
+        filter_mentions_by_sense(filepath, str(tmp_path / "professions.csv"), str(tmp_path / f"out.{name}"), \
+            str(tmp_path / f"out_professions.{name}.csv"))
+    pd.testing.assert_frame_equal(read_mentions(str(tmp_path / "out.parquet"), categorical=False), \
+        read_mentions(str(tmp_path / "out.csv"), categorical=False), check_dtype=False)
+    assert open(tmp_path / "out_professions.parquet.csv").read() == open(tmp_path / "out_professions.csv.csv").read()
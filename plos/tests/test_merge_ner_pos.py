@@ -0,0 +1,29 @@
+import json
+import pytest
+
+from merge_ner_pos import merge_finegrained_processed
+
+def write_shard(filepath, docs, n_expected_docs):
+    content = "".join(json.dumps(doc) + "\n" for doc in docs)
+    filepath.write_text(content)
+    (filepath.parent / (filepath.name + ".checkpoint")).write_text(json.dumps(dict(n_docs=len(docs), \
+        offset=len(content.encode("utf-8")), n_expected_docs=n_expected_docs)))
+    return str(filepath)
+
+def test_merge_complete_and_empty_shards(tmp_path):
+    shards = [write_shard(tmp_path / "a.jsonl", [[{"word": "doctor"}], []], 2), \
+        write_shard(tmp_path / "b.jsonl", [], 0), write_shard(tmp_path / "c.jsonl", [[{"word": "nurse"}]], 1)]
+    merge_finegrained_processed(shards, str(tmp_path / "merged.jsonl"))
+    lines = (tmp_path / "merged.jsonl").read_text().splitlines()
+    assert lines == ['[{"word": "doctor"}]', '[]', '[{"word": "nurse"}]']
+
+def test_merge_fails_on_incomplete_shard(tmp_path):
+    shards = [write_shard(tmp_path / "a.jsonl", [[], []], 3), write_shard(tmp_path / "b.jsonl", [[]], 1)]
+    with pytest.raises(RuntimeError, match="incomplete"):
+        merge_finegrained_processed(shards, str(tmp_path / "merged.jsonl"))
+    assert not (tmp_path / "merged.jsonl").exists()
+
+def test_merge_fails_on_missing_shard(tmp_path):
+    shards = [write_shard(tmp_path / "a.jsonl", [[]], 1), str(tmp_path / "b.jsonl")]
+    with pytest.raises(RuntimeError, match="does not exist"):
+        merge_finegrained_processed(shards, str(tmp_path / "merged.jsonl"))
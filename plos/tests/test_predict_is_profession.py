@@ -0,0 +1,55 @@
+import json
+import random
+import pandas as pd
+
+from predict_is_profession import is_profession, character_name_tokens
+
+def baseline_is_person(imdbs, mentions, characters_data):
+    """is_person of the baseline `is_profession`: the mention is a token of the name of some character of the movie
+    """
+    is_person_list = []
+    for imdb, mention in zip(imdbs, mentions):
+        is_person = False
+        if imdb in characters_data:
+            for character in characters_data[imdb]:
+                if mention.strip().lower() in character.strip().lower().split():
+                    is_person = True
+                    break
+        is_person_list.append(is_person)
+    return is_person_list
+
+def test_character_name_tokens():
+    characters_data = {"0000001": ["Dr. House", "  the Doctor ", "Nurse Jackie"], "0000002": ["Doctor Who", "doctor"]}
+    name_tokens_df = character_name_tokens(characters_data)
+    assert list(map(tuple, name_tokens_df.values.tolist())) == [("0000001", "doctor"), ("0000001", "dr."), \
+        ("0000001", "house"), ("0000001", "jackie"), ("0000001", "nurse"), ("0000001", "the"), ("0000002", "doctor"), \
+        ("0000002", "who")]
+
+def test_is_person_equals_baseline(tmp_path):
+    rng = random.Random(0)
+    names = ["Doctor", "Nurse", "Jackie", "House", "Chief", "Officer", "Mary", "Smith"]
+    professions = [f"profession {i}" for i in range(1600)] + ["doctor", "nurse", "chief", "officer"]
+    characters_data = dict((f"{imdb:07d}", [" ".join(rng.sample(names, rng.randint(1, 3))) for _ in \
+        range(rng.randint(0, 4))]) for imdb in range(0, 40, 2))
+    mentions_df = pd.DataFrame({"id": range(2000), "profession": [rng.choice(professions[-4:]) for _ in range(2000)], \
+        "imdb": [rng.randint(0, 45) for _ in range(2000)]})
+    mentions_df["mention"] = [rng.choice([profession.capitalize(), f" {profession} ", profession.upper()]) for \
+        profession in mentions_df.profession]
+    mentions_df["ner"] = [rng.choice(["PERSON", "O", "TITLE", "ORGANIZATION"]) for _ in range(2000)]
+    mentions_df["sense"] = [rng.choice([None, "doctor.n.01", "doctor.n.04"]) for _ in range(2000)]
+    mentions_df["no_pos_sense"] = [rng.choice([None, "doctor.n.01", "nurse.v.01"]) for _ in range(2000)]
+    mentions_df.to_csv(tmp_path / "mentions.csv", index=False)
+    pd.DataFrame({"profession": professions, "n_senses": [rng.randint(0, 2) for _ in professions], "n_words": 1, \
+        "n_mentions": 0}).to_csv(tmp_path / "professions.csv", index=False)
+    (tmp_path / "senses.txt").write_text("doctor.n.01 doctor\nnurse.n.01 nurse\n")
+    json.dump(characters_data, open(tmp_path / "characters.json", "w"))
+
+    is_profession(str(tmp_path / "mentions.csv"), str(tmp_path / "professions.csv"), str(tmp_path / "senses.txt"), \
+        str(tmp_path / "characters.json"), str(tmp_path / "out_mentions.csv"), str(tmp_path / "out_professions.csv"))
+    out_mentions_df = pd.read_csv(tmp_path / "out_mentions.csv", dtype={"imdb": str}).sort_values("id")
+    is_person_list = baseline_is_person(mentions_df.imdb.astype(str).str.zfill(7), mentions_df.mention, \
+        characters_data)
+    assert out_mentions_df.is_person.tolist() == is_person_list
+    assert 0 < sum(is_person_list) < len(is_person_list)
+    person = out_mentions_df.is_person & (out_mentions_df.ner == "PERSON")
+    assert (out_mentions_df.loc[person, ["is_profession", "is_nopos_profession"]] == 0).all().all()
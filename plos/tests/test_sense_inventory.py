@@ -0,0 +1,122 @@
+import pytest
+
+nltk_corpus = pytest.importorskip("nltk.corpus")
+
+from sense_inventory import SenseInventory, create_sense_inventory, read_sense_names, wordnet_pos
+from list_profession_synsets import list_synsets_not_found_in_gazetteer
+
+class FakeSynset:
+
+    def __init__(self, name, lexname, lemma_names, hyponyms=()):
+        self._name, self._lexname, self._lemma_names, self._hyponyms = name, lexname, lemma_names, list(hyponyms)
+
+    def name(self):
+        return self._name
+
+    def lexname(self):
+        return self._lexname
+
+    def definition(self):
+        return f"definition of {self._name}"
+
+    def lemma_names(self):
+        return list(self._lemma_names)
+
+    def hyponyms(self):
+        return list(self._hyponyms)
+
+class FakeWordNet:
+    """WordNet of a few profession words, that counts its lookups. `doc.n.01` is an alias of `doctor.n.01`.
+    """
+
+    def __init__(self):
+        surgeon = FakeSynset("surgeon.n.01", "noun.person", ["surgeon", "operating_surgeon"])
+        doctor = FakeSynset("doctor.n.01", "noun.person", ["doctor", "doc", "physician"], [surgeon])
+        doctor_verb = FakeSynset("doctor.v.01", "verb.body", ["doctor"])
+        nurse = FakeSynset("nurse.n.01", "noun.person", ["nurse"])
+        nurse_verb = FakeSynset("nurse.v.01", "verb.body", ["nurse"])
+        staff = FakeSynset("staff.n.01", "noun.group", ["staff"])
+        fire_fighter = FakeSynset("fireman.n.04", "noun.person", ["fireman", "fire_fighter"])
+        self.word_synsets = {"doctor": [doctor, doctor_verb], "doc": [doctor], "nurse": [nurse, nurse_verb], \
+            "staff": [staff], "fire_fighter": [fire_fighter], "surgeon": [surgeon]}
+        self.name_synsets = dict((synset.name(), synset) for synsets in self.word_synsets.values() \
+            for synset in synsets)
+        self.name_synsets["doc.n.01"] = doctor
+        self.n_lookups = 0
+
+    def synsets(self, word, pos=None):
+        self.n_lookups += 1
+        return [synset for synset in self.word_synsets.get(word, []) if pos is None or synset.name().split(".")[1] \
+            == pos]
+
+    def synset(self, name):
+        self.n_lookups += 1
+        return self.name_synsets[name]
+
+@pytest.fixture
+def wordnet(monkeypatch):
+    fake_wordnet = FakeWordNet()
+    monkeypatch.setattr(nltk_corpus, "wordnet", fake_wordnet)
+    return fake_wordnet
+
+@pytest.fixture
+def inventory_files(tmp_path):
+    (tmp_path / "words.txt").write_text("Doctor\nnurse\nfire fighter\nunknown\n")
+    (tmp_path / "professions.csv").write_text("profession,n_mentions\nstaff,3\ndoctor,2\n")
+    (tmp_path / "synsets.txt").write_text("doc.n.01\tdefinition\nnurse.n.01\tdefinition\n")
+    (tmp_path / "professional_senses.txt").write_text("doc.n.01\nfireman.n.04\n")
+    return tmp_path
+
+def assert_inventory_equals_wordnet(inventory, wordnet):
+    for word in ["doctor", "Doctor", "nurse", "fire fighter", "staff", "unknown"]:
+        key = SenseInventory.key(word)
+        assert inventory.synsets(word) == [synset.name() for synset in wordnet.synsets(key)]
+        for pos in wordnet_pos:
+            assert inventory.synsets(word, pos=pos) == [synset.name() for synset in wordnet.synsets(key, pos=pos)]
+    for name, synset in wordnet.name_synsets.items():
+        assert inventory.canonical_name(name) == synset.name()
+        assert inventory.lexname(name) == synset.lexname()
+        assert inventory.definition(name) == synset.definition()
+        assert inventory.lemma_names(name) == synset.lemma_names()
+        assert inventory.hyponyms(name) == [hyponym.name() for hyponym in synset.hyponyms()]
+
+def test_created_inventory_equals_wordnet_without_lookups(inventory_files, wordnet):
+    inventory_filepath = str(inventory_files / "inventory.json")
+    create_sense_inventory([str(inventory_files / "words.txt"), str(inventory_files / "professions.csv"), \
+        str(inventory_files / "missing.txt")], str(inventory_files / "professional_senses.txt"), inventory_filepath, \
+        [str(inventory_files / "synsets.txt")])
+    assert wordnet.n_lookups > 0
+
+    wordnet.n_lookups = 0
+    inventory = SenseInventory.load(inventory_filepath)
+    assert inventory.professional_senses == {"doctor.n.01", "fireman.n.04"}
+    assert inventory.professional_synsets("doctor") == ["doctor.n.01"]
+    assert read_sense_names(str(inventory_files / "synsets.txt"), inventory) == {"doctor.n.01", "nurse.n.01"}
+    lookup_names = ["doctor.n.01", "doc.n.01", "doctor.v.01", "surgeon.n.01", "nurse.n.01", "nurse.v.01", \
+        "staff.n.01", "fireman.n.04"]
+    for name in lookup_names:
+        inventory.definition(name)
+    for word in ["doctor", "nurse", "fire fighter", "staff", "unknown"]:
+        for pos in [None] + wordnet_pos:
+            inventory.synsets(word, pos=pos)
+    assert wordnet.n_lookups == 0
+    assert not inventory.changed
+    assert_inventory_equals_wordnet(inventory, wordnet)
+
+def test_listing_does_not_change_inventory(inventory_files, wordnet):
+    inventory_filepath = str(inventory_files / "inventory.json")
+    create_sense_inventory([str(inventory_files / "words.txt")], str(inventory_files / "professional_senses.txt"), \
+        inventory_filepath)
+    inventory_data = open(inventory_filepath).read()
+
+    # surgeon and staff are not in the inventory, so they are looked up in WordNet but not saved
+    (inventory_files / "professions.csv").write_text("profession,n_mentions\nsurgeon,3\ndoctor,2\nstaff,1\nnurse,1\n")
+    wordnet.n_lookups = 0
+    list_synsets_not_found_in_gazetteer(str(inventory_files / "professions.csv"), str(inventory_files / "synsets.txt"), \
+        str(inventory_files / "found.txt"), str(inventory_files / "notfound.txt"), inventory_filepath)
+    assert wordnet.n_lookups > 0
+    assert open(inventory_filepath).read() == inventory_data
+    found = sorted(line.split()[0] for line in open(inventory_files / "found.txt"))
+    notfound = sorted(line.split()[0] for line in open(inventory_files / "notfound.txt"))
+    assert found == ["doctor.n.01", "nurse.n.01"]
+    assert notfound == ["staff.n.01", "surgeon.n.01"]
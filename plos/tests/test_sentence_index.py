@@ -0,0 +1,101 @@
+import random
+import numpy as np
+
+from sentence_index import SentenceIndex, DictSentenceIndex
+
+def random_dictionaries(seed=0, n_keys=8, n_imdbs=12, n_si=300):
+    """Returns random `key_to_si`, `si_to_rsi`, `rsi_to_si` and `si_to_key` dictionaries in which some sentences
+    occur in several files
+    """
+    rng = random.Random(seed)
+    keys = [f"key {k}" for k in range(n_keys)]
+    imdbs = [f"{rng.randint(0, 10 ** 7):07d}" for _ in range(n_imdbs)]
+    key_to_si, si_to_rsi, rsi_to_si, si_to_key = dict((key, []) for key in keys), {}, {}, {}
+    n_rsi = 0
+    for _ in range(n_si):
+        imdb, sent = rng.choice(imdbs), rng.randint(0, 500)
+        if str(sent) in si_to_rsi.get(imdb, {}):
+            continue
+        rsi = rng.randrange(n_rsi) if n_rsi and rng.random() < 0.3 else n_rsi
+        n_rsi = max(n_rsi, rsi + 1)
+        si_to_rsi.setdefault(imdb, {})[str(sent)] = rsi
+        rsi_to_si.setdefault(str(rsi), []).append([imdb, sent])
+        si_keys = sorted(rng.sample(keys, rng.randint(1, 3)), key=keys.index)
+        si_to_key.setdefault(imdb, {})[str(sent)] = si_keys
+        for key in si_keys:
+            key_to_si[key].append([imdb, sent])
+    return key_to_si, si_to_rsi, rsi_to_si, si_to_key
+
+def create_index(key_to_si, si_to_rsi, n_rsi):
+    index = SentenceIndex.from_key_to_si(key_to_si)
+    index.set_rsi([si_to_rsi[imdb][str(sent)] for imdb, sent in zip(index.imdbs[index.si_imdb], \
+        index.si_sent.tolist())], n_rsi)
+    return index
+
+def assert_same_lookups(index, dict_index, keys, n_rsi):
+    assert len(index) == n_rsi
+    for key in keys:
+        assert sorted(index.key_si(key)) == sorted(dict_index.key_si(key))
+    for rsi in range(n_rsi):
+        assert sorted(index.rsi_si(rsi)) == sorted(dict_index.rsi_si(rsi))
+        assert sorted(index.rsi_si_keys(rsi)) == sorted(dict_index.rsi_si_keys(rsi))
+
+def test_sentence_index_equals_dictionaries(tmp_path):
+    key_to_si, si_to_rsi, rsi_to_si, si_to_key = random_dictionaries()
+    index = create_index(key_to_si, si_to_rsi, len(rsi_to_si))
+    dict_index = DictSentenceIndex(key_to_si=key_to_si, si_to_rsi=si_to_rsi, rsi_to_si=rsi_to_si, si_to_key=si_to_key)
+    assert_same_lookups(index, dict_index, list(key_to_si), len(rsi_to_si))
+
+    # the loaded index is memory-mapped and gives the same lookups
+    index.save(str(tmp_path / "index"))
+    loaded_index = SentenceIndex.load(str(tmp_path / "index"))
+    assert isinstance(loaded_index.si_rsi, np.memmap)
+    assert_same_lookups(loaded_index, dict_index, list(key_to_si), len(rsi_to_si))
+
+def test_find():
+    key_to_si, si_to_rsi, rsi_to_si, _ = random_dictionaries(seed=1)
+    index = create_index(key_to_si, si_to_rsi, len(rsi_to_si))
+    si_list = [(imdb, int(sent)) for imdb, sent_to_rsi in si_to_rsi.items() for sent in sent_to_rsi]
+    missing = [(si_list[0][0], 10 ** 6), ("9999999x", 0), ("", 1)]
+    imdbs, sents = zip(*(si_list + missing))
+    positions = index.find(imdbs, sents)
+    assert (positions[len(si_list):] == -1).all()
+    assert [(str(index.imdbs[index.si_imdb[p]]), int(index.si_sent[p])) for p in positions[:len(si_list)]] == si_list
+    assert index.si_to_rsi(imdbs, sents).tolist() == [si_to_rsi[imdb][str(sent)] for imdb, sent in si_list] + \
+        [-1] * len(missing)
+
+def test_from_postings_removes_duplicates():
+    keys = ["doctor", "nurse"]
+    index = SentenceIndex.from_postings(keys, [1, 0, 1, 0, 1], ["0000002", "0000001", "0000002", "0000002", "0000001"], \
+        [3, 5, 3, 3, 0])
+    assert index.postings() == ([0, 0, 1, 1], ["0000001", "0000002", "0000001", "0000002"], [5, 3, 0, 3])
+    assert index.key_si("nurse") == [("0000001", 0, -1), ("0000002", 3, -1)]
+    assert index.key_si("chief") == []
+
+def test_replace_equals_rebuild():
+    key_to_si, si_to_rsi, rsi_to_si, _ = random_dictionaries(seed=2)
+    index = create_index(key_to_si, si_to_rsi, len(rsi_to_si))
+    rng = random.Random(3)
+    replaced_imdbs = rng.sample(sorted(si_to_rsi), 4) + ["0000000"]
+
+    # the postings of the replaced files are those of other random dictionaries, with a new key
+    update_key_to_si, update_si_to_rsi, _, _ = random_dictionaries(seed=4, n_keys=9, n_imdbs=len(replaced_imdbs))
+    update_imdbs = dict(zip(sorted(update_si_to_rsi), replaced_imdbs))
+    update_key_to_si = dict((key, [[update_imdbs[imdb], sent] for imdb, sent in si_list]) for key, si_list in \
+        update_key_to_si.items())
+    update_si_to_rsi = dict((update_imdbs[imdb], sent_to_rsi) for imdb, sent_to_rsi in update_si_to_rsi.items())
+    update_index = create_index(update_key_to_si, update_si_to_rsi, None)
+    replaced_index = index.replace(replaced_imdbs, update_index)
+    replaced_index.set_rsi(replaced_index.si_rsi)
+
+    merged_key_to_si = dict((key, [[imdb, sent] for imdb, sent in key_to_si.get(key, []) if imdb not in \
+        replaced_imdbs] + update_key_to_si.get(key, [])) for key in list(key_to_si) + ["key 8"])
+    merged_si_to_rsi = dict((imdb, sent_to_rsi) for imdb, sent_to_rsi in si_to_rsi.items() if imdb not in \
+        replaced_imdbs)
+    merged_si_to_rsi.update(update_si_to_rsi)
+    rebuilt_index = create_index(merged_key_to_si, merged_si_to_rsi, None)
+
+    assert replaced_index.keys == rebuilt_index.keys
+    assert replaced_index.imdbs.tolist() == rebuilt_index.imdbs.tolist()
+    for name in SentenceIndex.arrays:
+        assert np.array_equal(getattr(replaced_index, name), getattr(rebuilt_index, name)), name
@@ -0,0 +1,57 @@
+import os
+import random
+import pytest
+
+from sentence_store import SentenceStore, create_line_index
+
+def random_sentences(n_sentences, seed=0):
+    rng = random.Random(seed)
+    words = ["the", "doctor", "said", "héllo", "♪", "नमस्ते", "(", ")", "", "\t"]
+    return [" ".join(rng.choice(words) for _ in range(rng.randint(1, 6))) for _ in range(n_sentences)]
+
+def read_lines(sentences_filepath):
+    """Sentences as the baseline scripts read them
+    """
+    return open(sentences_filepath).read().strip().split("\n")
+
+@pytest.mark.parametrize("trailing_newline", [False, True])
+def test_sentence_store_equals_read_lines(tmp_path, trailing_newline):
+    sentences = [sentence.strip() or "x" for sentence in random_sentences(200)]
+    sentences_filepath = str(tmp_path / "sentences.txt")
+    with open(sentences_filepath, "w") as writer:
+        writer.write("\n".join(sentences) + ("\n" if trailing_newline else ""))
+
+    store = SentenceStore(sentences_filepath)
+    assert len(store) == len(read_lines(sentences_filepath))
+    assert list(store) == read_lines(sentences_filepath)
+    assert [store[rsi] for rsi in [0, 57, 199, -1]] == [sentences[0], sentences[57], sentences[199], sentences[-1]]
+    assert store.range(10, 20) == sentences[10:20]
+    assert store.range(190, 250) == sentences[190:]
+    assert store.range(20, 10) == []
+    with pytest.raises(IndexError):
+        store[200]
+
+def test_sentence_store_sees_appended_sentences(tmp_path):
+    sentences = random_sentences(50, seed=1)
+    sentences_filepath = str(tmp_path / "sentences.txt")
+    with open(sentences_filepath, "w") as writer:
+        writer.write("\n".join(sentences[:30]))
+    assert list(SentenceStore(sentences_filepath)) == sentences[:30]
+    assert os.path.exists(sentences_filepath + ".idx.npy")
+
+    # the stale line index is recreated even if the modification time did not change
+    mtime = os.stat(sentences_filepath).st_mtime_ns
+    with open(sentences_filepath, "a") as writer:
+        writer.write("\n" + "\n".join(sentences[30:]))
+    os.utime(sentences_filepath, ns=(mtime, mtime))
+    assert list(SentenceStore(sentences_filepath)) == sentences
+
+def test_line_index_chunks(tmp_path):
+    sentences = random_sentences(100, seed=2)
+    sentences_filepath = str(tmp_path / "sentences.txt")
+    with open(sentences_filepath, "w") as writer:
+        writer.write("\n".join(sentences))
+    create_line_index(sentences_filepath, chunk_size=7)
+    chunked_offsets = SentenceStore(sentences_filepath).offsets.tolist()
+    create_line_index(sentences_filepath)
+    assert SentenceStore(sentences_filepath).offsets.tolist() == chunked_offsets
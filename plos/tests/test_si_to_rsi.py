@@ -0,0 +1,47 @@
+import threading
+import pytest
+
+from si_to_rsi import iter_file_sentences, SentenceTable
+
+def write_subtitles(tmp_path, n_files):
+    subtitle_directory = tmp_path / "text"
+    subtitle_directory.mkdir()
+    for i in range(n_files):
+        (subtitle_directory / f"{i:07d}.txt").write_text(f"hello {i}\nthe doctor said\nnurse {i % 3}")
+    return str(subtitle_directory)
+
+def run_with_timeout(func, timeout=60):
+    outcome = {}
+    def target():
+        try:
+            outcome["result"] = func()
+        except Exception as error:
+            outcome["error"] = error
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "timed out"
+    return outcome
+
+def test_workers_yield_the_same_sentences_in_order(tmp_path):
+    subtitle_directory = write_subtitles(tmp_path, 100)
+    imdb_fsi_lists = [(f"{i:07d}", [2, 0, 1]) for i in range(100)]
+    expected = list(iter_file_sentences(imdb_fsi_lists, subtitle_directory, n_workers=1))
+    assert list(iter_file_sentences(imdb_fsi_lists, subtitle_directory, n_workers=3, window=1, chunk_size=4)) \
+        == expected
+    assert expected[5][2][0][0] == "nurse 2"
+
+def test_missing_file_raises_instead_of_hanging(tmp_path):
+    subtitle_directory = write_subtitles(tmp_path, 200)
+    imdb_fsi_lists = [(f"{i:07d}", [0]) for i in range(200)]
+    imdb_fsi_lists[150] = ("missing", [0])
+    outcome = run_with_timeout(lambda: list(iter_file_sentences(imdb_fsi_lists, subtitle_directory, n_workers=2, \
+        window=1)))
+    assert isinstance(outcome.get("error"), FileNotFoundError)
+
+def test_sentence_table_assigns_rsi_in_first_seen_order(tmp_path):
+    with open(tmp_path / "sentences.txt", "w") as writer:
+        table = SentenceTable(writer)
+        rsis = [table.add(sentence, sentence.encode()) for sentence in ["a", "b", "a", "c", "b"]]
+    assert rsis == [0, 1, 0, 2, 1]
+    assert (tmp_path / "sentences.txt").read_text() == "a\nb\nc"
@@ -0,0 +1,31 @@
+import pytest
+
+pytest.importorskip("pattern.text.en")
+
+from subtitle_index import create_subtitle_index, SubtitleIndex
+
+def create_index(tmp_path, texts):
+    subtitle_directory = tmp_path / "text"
+    subtitle_directory.mkdir()
+    for imdb, text in texts.items():
+        (subtitle_directory / f"{imdb}.txt").write_text(text)
+    subtitle_index_filepath = str(tmp_path / "subtitle_index.npz")
+    create_subtitle_index(str(subtitle_directory), subtitle_index_filepath, n_workers=1)
+    return SubtitleIndex(subtitle_index_filepath)
+
+def test_phrase_does_not_match_across_adjacent_sentences(tmp_path):
+    index = create_index(tmp_path, {"0000001": "hello police\nofficer yes"})
+    assert index.find_phrase("police officer").tolist() == []
+    assert index.find_phrase("hello police").tolist() == [0]
+    assert index.find_phrase("officer yes").tolist() == [1]
+
+def test_phrase_does_not_match_across_files(tmp_path):
+    index = create_index(tmp_path, {"0000001": "the police", "0000002": "officer"})
+    assert index.find_phrase("police officer").tolist() == []
+
+def test_phrase_matches_within_sentence(tmp_path):
+    index = create_index(tmp_path, {"0000001": "a police officer\npolice\nthe police officer said"})
+    assert index.find_phrase("police officer").tolist() == [0, 2]
+    key_ids, imdbs, sents = index.search(["police officer", "police"])
+    assert list(zip(key_ids, imdbs, sents)) == [(0, "0000001", 0), (0, "0000001", 2), (1, "0000001", 0), \
+        (1, "0000001", 1), (1, "0000001", 2)]
@@ -0,0 +1,49 @@
+import json
+import random
+
+from token_store import create_token_store, TokenStore, read_processed, iter_processed, lookup_tokens
+
+def random_docs(n_docs, seed=0):
+    rng = random.Random(seed)
+    words = ["the", "Doctor", "doctor", "said", "é", "♪", "(", ")", "nurse", "O'Brien"]
+    docs = []
+    for _ in range(n_docs):
+        doc, start = [], 0
+        for _ in range(rng.randint(0, 8)):
+            word = rng.choice(words)
+            doc.append(dict(lemma=word.lower(), word=word, start=start, end=start + len(word), \
+                pos=rng.choice(["NN", "NNP", "VBD", "DT"]), ner=rng.choice(["O", "PERSON", "TITLE"])))
+            start += len(word) + 1
+        docs.append(doc)
+    return docs
+
+def write_docs(tmp_path, docs):
+    processed_filepath = str(tmp_path / "processed.jsonl")
+    with open(processed_filepath, "w") as writer:
+        for doc in docs:
+            writer.write(json.dumps(doc) + "\n")
+    token_store_dir = str(tmp_path / "token_store")
+    create_token_store(processed_filepath, token_store_dir)
+    return processed_filepath, token_store_dir
+
+def test_token_store_round_trip(tmp_path):
+    docs = random_docs(100)
+    processed_filepath, token_store_dir = write_docs(tmp_path, docs)
+    store = TokenStore(token_store_dir)
+    assert len(store) == len(docs)
+    assert list(store) == docs
+    assert [store[rsi] for rsi in range(len(docs) - 1, -1, -1)] == docs[::-1]
+    assert store.words(3) == [token["word"] for token in docs[3]]
+    assert list(read_processed(token_store_dir)) == list(read_processed(processed_filepath)) == docs
+    assert list(iter_processed(token_store_dir)) == list(iter_processed(processed_filepath)) == docs
+
+def test_lookup_tokens(tmp_path):
+    docs = random_docs(100, seed=1)
+    processed_filepath, token_store_dir = write_docs(tmp_path, docs)
+    rng = random.Random(2)
+    pairs = [(rsi, rng.randrange(len(doc))) for rsi, doc in enumerate(docs) if doc for _ in range(rng.randint(0, 2))]
+    rng.shuffle(pairs)
+    rsis, starts = [rsi for rsi, _ in pairs], [start for _, start in pairs]
+    expected = [docs[rsi][start] for rsi, start in pairs]
+    assert lookup_tokens(processed_filepath, rsis, starts) == expected
+    assert lookup_tokens(token_store_dir, rsis, starts) == expected
@@ -0,0 +1,161 @@
+import os
+import sys
+import json
+import types
+import pandas as pd
+import pytest
+
+pytest.importorskip("pattern.text.en")
+pytest.importorskip("stanza")
+
+import update_mentions
+from subtitle_index import create_subtitle_index, SubtitleIndex, read_keys
+from sentence_index import SentenceIndex
+from sentence_store import SentenceStore
+from si_to_rsi import find_sentences_with_index, SentenceHashTable
+from find_mentions import find_mentions_streaming, mention_files
+from find_ner_pos import write_checkpoint
+
+GAZETTEER = """word,singular,plural,singular_key,plural_key
+police officer,police officer,police officers,police officer,police officer
+officer,officer,officers,officer,officer
+doctor,doctor,doctors,doctor,doctor
+nurse,nurse,nurses,nurse,nurse
+"""
+
+TEXTS = {
+    "0000001": "the police officer said hello\nyes doctor\nhello",
+    "0000002": "the nurses said yes\n( doctor )\nyes doctor",
+    "0000003": "officer : hello\n♪ the doctor ♪",
+}
+
+UPDATED_TEXTS = {
+    "0000002": "the nurses said yes\nthe chief doctor said hello\nofficers",
+    "0000004": "yes doctor\nthe police officer said hello\nnurse : yes nurse",
+}
+
+def tag(sentence):
+    """Whitespace tokenizer standing in for CoreNLP
+    """
+    doc, start = [], 0
+    for word in sentence.split():
+        doc.append(dict(lemma=word.lower(), word=word, start=start, end=start + len(word), pos="NN", ner="O"))
+        start += len(word) + 1
+    return doc
+
+def fake_process_sentence_range(sentences_filepath, start, end, processed_filepath, *args, **kwargs):
+    sentences = SentenceStore(sentences_filepath).range(start, end)
+    with open(processed_filepath, "w") as writer:
+        for sentence in sentences:
+            writer.write(json.dumps(tag(sentence)) + "\n")
+    write_checkpoint(processed_filepath, len(sentences), os.path.getsize(processed_filepath), len(sentences))
+
+def fake_find_wsd(processed_filepath, checkpoint_filepath, wsd_filepath, *args, nopos_wsd_filepath=None, **kwargs):
+    for filepath in [wsd_filepath, nopos_wsd_filepath]:
+        if filepath is not None:
+            with open(filepath, "w") as writer:
+                writer.write("[]\n" * len(SentenceStore(processed_filepath)))
+
+def write_texts(subtitle_directory, texts):
+    for imdb, text in texts.items():
+        with open(os.path.join(subtitle_directory, f"{imdb}.txt"), "w") as writer:
+            writer.write(text)
+
+def run_pipeline(subtitle_directory, output_directory, profession_filepath):
+    """Run the pipeline from the subtitle index to the mention csv files on all the subtitle files
+    """
+    os.makedirs(output_directory)
+    subtitle_index_filepath = os.path.join(output_directory, "subtitle_index.npz")
+    index_dir = os.path.join(output_directory, "index")
+    sentences_filepath = os.path.join(output_directory, "sentences.txt")
+    create_subtitle_index(subtitle_directory, subtitle_index_filepath, profession_filepath=profession_filepath, \
+        n_workers=1)
+    keys = read_keys(profession_filepath)
+    SentenceIndex.from_postings(keys, *SubtitleIndex(subtitle_index_filepath).search(keys)).save(index_dir)
+    find_sentences_with_index(index_dir, subtitle_directory, sentences_filepath)
+    n_sentences = len(SentenceStore(sentences_filepath))
+    fake_process_sentence_range(sentences_filepath, 0, n_sentences, os.path.join(output_directory, "processed.jsonl"))
+    for filename in ["wsd.jsonl", "wsd.nopos.jsonl"]:
+        with open(os.path.join(output_directory, filename), "w") as writer:
+            writer.write("[]\n" * n_sentences)
+    find_mentions_streaming(None, None, sentences_filepath, os.path.join(output_directory, "processed.jsonl"), \
+        profession_filepath, os.path.join(output_directory, "prof_to_si.json"), output_directory, 100, \
+        index_dir=index_dir)
+
+def run_update(subtitle_directory, output_directory, profession_filepath):
+    update_mentions.update(subtitle_directory, os.path.join(output_directory, "subtitle_index.npz"), \
+        profession_filepath, os.path.join(output_directory, "index"), os.path.join(output_directory, "sentences.txt"), \
+        os.path.join(output_directory, "processed.jsonl"), None, os.path.join(output_directory, "wsd.jsonl"), \
+        os.path.join(output_directory, "wsd.nopos.jsonl"), output_directory, \
+        os.path.join(output_directory, "prof_to_si.json"), 100, n_workers=1)
+
+def read_mention_rows(output_directory, filename):
+    """Returns the sorted mention rows without the rsi, which depends on the order in which the sentences are added
+    """
+    df = pd.read_csv(os.path.join(output_directory, filename), dtype=str, keep_default_na=False)
+    return sorted(map(tuple, df.drop(columns="rsi").values.tolist()))
+
+@pytest.fixture
+def corpus(tmp_path, monkeypatch):
+    monkeypatch.setattr(update_mentions, "process_sentence_range", fake_process_sentence_range)
+    monkeypatch.setitem(sys.modules, "find_wordnet_sense", types.SimpleNamespace(find_wsd=fake_find_wsd))
+    subtitle_directory = tmp_path / "text"
+    subtitle_directory.mkdir()
+    profession_filepath = tmp_path / "inflection.csv"
+    profession_filepath.write_text(GAZETTEER)
+    write_texts(str(subtitle_directory), TEXTS)
+    run_pipeline(str(subtitle_directory), str(tmp_path / "incremental"), str(profession_filepath))
+    write_texts(str(subtitle_directory), UPDATED_TEXTS)
+    return str(subtitle_directory), str(tmp_path), str(profession_filepath)
+
+def test_update_equals_full_rebuild(corpus):
+    subtitle_directory, directory, profession_filepath = corpus
+    incremental_directory, full_directory = os.path.join(directory, "incremental"), os.path.join(directory, "full")
+    run_update(subtitle_directory, incremental_directory, profession_filepath)
+    run_pipeline(subtitle_directory, full_directory, profession_filepath)
+
+    for filename, _ in mention_files.values():
+        assert read_mention_rows(incremental_directory, filename) == read_mention_rows(full_directory, filename), \
+            filename
+    incremental_prof_to_si, full_prof_to_si = [json.load(open(os.path.join(output_directory, "prof_to_si.json"))) \
+        for output_directory in [incremental_directory, full_directory]]
+    assert dict((prof, sorted(map(tuple, si_list))) for prof, si_list in incremental_prof_to_si.items() if si_list) \
+        == dict((prof, sorted(map(tuple, si_list))) for prof, si_list in full_prof_to_si.items() if si_list)
+
+    # the spliced sentence index has the same key postings as the rebuilt one, and its rsi point to the sentences
+    incremental_index = SentenceIndex.load(os.path.join(incremental_directory, "index"))
+    full_index = SentenceIndex.load(os.path.join(full_directory, "index"))
+    assert sorted(incremental_index.keys) == sorted(full_index.keys)
+    sentences = SentenceStore(os.path.join(incremental_directory, "sentences.txt"))
+    for key in full_index.keys:
+        si_rsi_list = incremental_index.key_si(key)
+        assert sorted((imdb, sent) for imdb, sent, _ in si_rsi_list) == sorted((imdb, sent) for imdb, sent, _ in \
+            full_index.key_si(key))
+        for imdb, sent, rsi in si_rsi_list:
+            text = open(os.path.join(subtitle_directory, f"{imdb}.txt")).read().strip().split("\n")
+            assert sentences[rsi] == text[sent]
+    assert len(SentenceHashTable.load(os.path.join(incremental_directory, "index"))) == len(sentences)
+    assert not os.path.exists(os.path.join(incremental_directory, "index", "update.json"))
+
+def test_update_resumes_after_failure(corpus, monkeypatch):
+    subtitle_directory, directory, profession_filepath = corpus
+    incremental_directory = os.path.join(directory, "incremental")
+    update_sentence_index = update_mentions.update_sentence_index
+
+    def failing_update_sentence_index(*args, **kwargs):
+        update_sentence_index(*args, **kwargs)
+        raise RuntimeError("update failed")
+
+    monkeypatch.setattr(update_mentions, "update_sentence_index", failing_update_sentence_index)
+    with pytest.raises(RuntimeError):
+        run_update(subtitle_directory, incremental_directory, profession_filepath)
+    n_sentences = len(SentenceStore(os.path.join(incremental_directory, "sentences.txt")))
+
+    # resuming does not append the sentences again
+    monkeypatch.setattr(update_mentions, "update_sentence_index", update_sentence_index)
+    run_update(subtitle_directory, incremental_directory, profession_filepath)
+    assert len(SentenceStore(os.path.join(incremental_directory, "sentences.txt"))) == n_sentences
+    run_pipeline(subtitle_directory, os.path.join(directory, "full"), profession_filepath)
+    for filename, _ in mention_files.values():
+        assert read_mention_rows(incremental_directory, filename) == \
+            read_mention_rows(os.path.join(directory, "full"), filename), filename